@@ -1,9 +1,16 @@
 # api/main.py
 # (V4 - 决赛 RAG 最终版)
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import asyncio
 import uuid
+import json
+import time
+import os
 
 # --- 导入大模型 ---
 from langchain_openai import ChatOpenAI
@@ -12,34 +19,54 @@ from langchain_core.output_parsers import StrOutputParser
 
 # 导入你的配置
 from utils import config 
+from utils import metrics
+from utils import model_registry
+from utils.logger import log_event, new_request_id, set_request_id, reset_request_id
 # 导入你的数据和向量库模块
 from backend.knowledge_base import vector_store 
+from backend.knowledge_base import mate_store
 from backend.data_process import pdf_processor
+from backend.data_process import ingest_pipeline
 # 导入我们为初赛构建的“纯检索管线”
-from rag.rag_chain import run_retrieval_pipeline 
+from rag.rag_chain import run_retrieval_pipeline, reload_indexes, cache_stats, embed_query
+from backend.rag.answer_cache import SemanticAnswerCache
 
-# --- 数据导入 (不变) ---
-# (这部分代码和 V3 版完全一样)
+# --- 数据导入 (增量版) ---
 def run_ingestion():
+    """
+    增量入库: 用 mate_store 清单对比 data/ 目录,
+    只处理 新增/修改 的文件, 并删除已移除文件在 Milvus 中的数据。
+    """
     print("--- 1. 检查并初始化 Milvus (图文) ---")
     client = vector_store.initialize_milvus()
-    
-    count = client.query(config.TEXT_COLLECTION_NAME, "pk != ''", limit=1)
-    if count:
-        print("Milvus 中已有数据，跳过入库。")
+    manifest = mate_store.ManifestStore()
+
+    if not os.path.exists(config.DATA_DIR):
+        print(f"错误: 知识库目录 {config.DATA_DIR} 不存在, 跳过入库。")
         return client
 
-    print("--- 2. 开始图文数据处理 (pdf_processor) ---")
-    text_docs, image_infos = pdf_processor.process_all_pdfs() 
-    
-    if text_docs:
-        print("--- 3. 开始 文本数据 入库 (vector_store) ---")
-        vector_store.add_text_documents(client, text_docs)
-    
-    if image_infos:
-        print("--- 4. 开始 图片数据 入库 (vector_store) ---")
-        vector_store.add_image_documents(client, image_infos)
-    
+    file_list = [(path, name) for path, name in pdf_processor.list_data_files(config.DATA_DIR)
+                 if pdf_processor.is_supported(name)]
+    added, changed, removed, resumed = manifest.diff(file_list)
+    print(f"  > 新增 {len(added)} 个, 修改 {len(changed)} 个, 删除 {len(removed)} 个, 续传 {len(resumed)} 个文件")
+
+    if not (added or changed or removed or resumed):
+        manifest.save()
+        print("知识库已是最新，跳过入库。")
+        return client
+
+    print("--- 2. 删除 修改/移除 文件的旧数据 ---")
+    ingest_pipeline.remove_files(client, manifest, [name for _, name in changed] + removed)
+    # (新文件在清单里没有主键记录, 按 doc_name 清掉可能残留的旧数据, 避免重复)
+    for _, name in added:
+        vector_store.delete_doc_rows(client, name)
+    manifest.save()
+
+    to_process = added + changed + resumed
+    if to_process:
+        print("--- 3. 流式入库: 解析 → 切分 → 嵌入 → 写入 (ingest_pipeline) ---")
+        ingest_pipeline.run_pipeline(client, to_process, manifest)
+
     print("--- 数据入库完成 ---")
     return client
 
@@ -77,20 +104,91 @@ def get_final_rag_chain():
     
     return chain
 
-# --- 初始化所有模型 ---
-final_rag_chain = get_final_rag_chain()
+# --- 登记模型 (第一次调用时才构建, 启动时按 config.WARMUP_MODELS 预热) ---
+final_rag_chain = model_registry.register("llm_chain", get_final_rag_chain)
 
 # --- FastAPI 启动事件 ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 模型预热 (后台线程, 与入库同时进行; 入库用到的 m3e 与检索共用一份, 只加载一次)
+    model_registry.warm_up(config.WARMUP_MODELS, background=config.WARMUP_IN_BACKGROUND)
     # 启动时, 自动完成数据入库
+    # (与检索共用同一个向量库客户端, Milvus 时为带超时/重试的连接池)
     app.state.milvus_client = run_ingestion()
+    # 入库后重新加载 条文索引 和 页面图片索引 (新增/修改文件的条文和插图)
+    reload_indexes()
+    # 语义答案缓存: 知识库 (清单指纹) 或 LLM 模型变了就清空, 重新入库后不会返回旧答案
+    app.state.answer_cache = None
+    if config.ANSWER_CACHE_ENABLED:
+        app.state.answer_cache = SemanticAnswerCache()
+        app.state.answer_cache.validate(f"{mate_store.ManifestStore().fingerprint()}|{config.LLM_MODEL_NAME}")
+    # 检索 (Milvus + Reranker) 是同步阻塞的, 放到线程池里跑, 不占用事件循环
+    app.state.retrieval_executor = ThreadPoolExecutor(
+        max_workers=config.QUERY_RETRIEVAL_WORKERS, thread_name_prefix="retrieval"
+    )
+    # LLM 调用是异步的, 用信号量限制同时进行的请求数
+    app.state.llm_semaphore = asyncio.Semaphore(config.QUERY_LLM_CONCURRENCY)
     yield
     print("关闭应用...")
+    app.state.retrieval_executor.shutdown(wait=False, cancel_futures=True)
+    if app.state.answer_cache is not None:
+        app.state.answer_cache.close()
+    app.state.milvus_client.close()
 
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """每个请求一个请求 ID (沿用请求头 X-Request-ID), 写入日志上下文并通过响应头返回"""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = set_request_id(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_request_id(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # --- API 接口 (决赛版) ---
+def _retrieve_sync(query_text: str) -> tuple:
+    retrieval_dict = run_retrieval_pipeline(query_text)
+    # (语义答案缓存要用问题向量; 检索时已经算过, 这里命中向量缓存)
+    embedding = embed_query(query_text) if app.state.answer_cache is not None else None
+    return retrieval_dict, embedding
+
+async def _retrieve(query_text: str) -> tuple:
+    """运行初赛的“纯检索管线”(R), 在检索线程池里运行, 不阻塞其他请求; 返回 (检索结果, 问题向量)"""
+    loop = asyncio.get_running_loop()
+    # (复制上下文, 检索线程里的日志也带上请求 ID)
+    context = contextvars.copy_context()
+    with metrics.stage_timer("retrieval"):
+        return await loop.run_in_executor(
+            app.state.retrieval_executor, context.run, _retrieve_sync, query_text
+        )
+
+async def _cached_answer(embedding, retrieval_dict: dict):
+    """语义答案缓存: 来源相同且问题足够相似时返回缓存的答案, 否则返回 None"""
+    if app.state.answer_cache is None:
+        return None
+    # (SQLite 读写放到线程里, 不阻塞事件循环)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, app.state.answer_cache.get, embedding, retrieval_dict)
+
+async def _store_answer(query_text: str, embedding, retrieval_dict: dict, answer: str):
+    if app.state.answer_cache is not None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, app.state.answer_cache.put, query_text, embedding, retrieval_dict, answer
+        )
+
+def _llm_inputs(query_text: str, retrieval_dict: dict) -> dict:
+    """准备 LLM (G) 的输入: Top-3 条款拼成上下文"""
+    clauses_context = "\n---\n".join(
+        f"[来源: {c['doc_name']}, 第 {c['page']} 页]\n{c['content']}" 
+        for c in retrieval_dict['clauses']
+    )
+    return {"clauses_context": clauses_context, "query": query_text}
+
 @app.post("/api/query")
 async def query_endpoint(request: dict):
     """
@@ -101,29 +199,134 @@ async def query_endpoint(request: dict):
     if not query_text:
         return {"error": "Query text is missing."}
 
-    # 1. 运行初赛的“纯检索管线”(R)
-    # 这会返回 Top-3 条款 和 关联的图片
-    retrieval_dict = run_retrieval_pipeline(query_text)
-    
-    # 2. 准备 LLM (G) 的上下文
-    clauses_context = "\n---\n".join(
-        f"[来源: {c['doc_name']}, 第 {c['page']} 页]\n{c['content']}" 
-        for c in retrieval_dict['clauses']
-    )
-    
-    # 3. 运行决赛的“RAG链”
-    generated_answer = final_rag_chain.invoke({
-        "clauses_context": clauses_context,
-        "query": query_text
-    })
+    started = time.perf_counter()
+    log_event("query_received", endpoint="/api/query", query_chars=len(query_text))
+    try:
+        with metrics.track_request("/api/query"):
+            # 1. 运行初赛的“纯检索管线”(R)
+            # 这会返回 Top-3 条款 和 关联的图片
+            retrieval_dict, embedding = await _retrieve(query_text)
+
+            # 2. 运行决赛的“RAG链” (异步调用 LLM; 语义答案缓存命中时跳过)
+            generated_answer = await _cached_answer(embedding, retrieval_dict)
+            cached = generated_answer is not None
+            if not cached:
+                async with app.state.llm_semaphore:
+                    with metrics.stage_timer("llm"):
+                        generated_answer = await final_rag_chain().ainvoke(_llm_inputs(query_text, retrieval_dict))
+                await _store_answer(query_text, embedding, retrieval_dict, generated_answer)
+    except Exception as e:
+        log_event("query_failed", level="error", endpoint="/api/query", error=repr(e))
+        raise
+    log_event("query_completed", endpoint="/api/query", cached=cached,
+              clauses=len(retrieval_dict["clauses"]), images=len(retrieval_dict["images"]),
+              duration_ms=round((time.perf_counter() - started) * 1000, 1))
     
-    # 4. 返回一个包含“生成式答案”和“来源”的最终结果
+    # 3. 返回一个包含“生成式答案”和“来源”的最终结果
     return {
         "id": str(uuid.uuid4()),
         "generated_answer": generated_answer, # LLM 生成的答案
-        "sources": retrieval_dict # 原始来源 (包含clauses和images)
+        "sources": retrieval_dict, # 原始来源 (包含clauses和images)
+        "cached": cached # 是否来自语义答案缓存
     }
 
+def _sse(event: str, data: dict) -> str:
+    """一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/query/stream")
+async def query_stream_endpoint(request: dict):
+    """
+    流式版 /api/query (SSE, text/event-stream):
+      event: sources → 检索完成后立即发送 {"id", "sources"} (条款和图片)
+      event: token   → LLM 每生成一段发送一次 {"text"}
+      event: done    → 生成结束 {"id", "generated_answer", "cached"}
+      event: error   → 生成出错 {"error"}
+    首字节时间 = 检索耗时, 不用等 LLM 全部生成完。
+    """
+    query_text = request.get("query")
+    if not query_text:
+        return {"error": "Query text is missing."}
+
+    log_event("query_received", endpoint="/api/query/stream", query_chars=len(query_text))
+
+    async def event_stream():
+        # (进行中数量和耗时按整个流计算, 不是到响应头为止)
+        with metrics.track_request("/api/query/stream"):
+            async for message in _stream_answer(query_text):
+                yield message
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # (关闭代理缓冲, 否则 nginx 会攒满缓冲区才转发)
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_answer(query_text: str):
+    started = time.perf_counter()
+    answer_id = str(uuid.uuid4())
+    retrieval_dict, embedding = await _retrieve(query_text)
+    yield _sse("sources", {"id": answer_id, "sources": retrieval_dict})
+
+    # 语义答案缓存命中: 整个答案作为一个 token 发出
+    cached_answer = await _cached_answer(embedding, retrieval_dict)
+    if cached_answer is not None:
+        yield _sse("token", {"text": cached_answer})
+        yield _sse("done", {"id": answer_id, "generated_answer": cached_answer, "cached": True})
+        log_event("query_completed", endpoint="/api/query/stream", cached=True,
+                  duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        return
+
+    # (客户端断开时生成器被取消, 信号量随之释放)
+    parts = []
+    try:
+        async with app.state.llm_semaphore:
+            with metrics.stage_timer("llm"):
+                llm_started = time.perf_counter()
+                async for chunk in final_rag_chain().astream(_llm_inputs(query_text, retrieval_dict)):
+                    if chunk:
+                        if not parts:
+                            metrics.STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - llm_started)
+                        parts.append(chunk)
+                        yield _sse("token", {"text": chunk})
+    except Exception as e:
+        log_event("query_failed", level="error", endpoint="/api/query/stream", error=repr(e))
+        yield _sse("error", {"error": str(e)})
+        return
+    generated_answer = "".join(parts)
+    await _store_answer(query_text, embedding, retrieval_dict, generated_answer)
+    yield _sse("done", {"id": answer_id, "generated_answer": generated_answer, "cached": False})
+    log_event("query_completed", endpoint="/api/query/stream", cached=False,
+              duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+@app.get("/api/cache/stats")
+def cache_stats_endpoint():
+    """查询缓存 (检索结果 / 问题向量) 和 语义答案缓存 的命中统计"""
+    stats = cache_stats()
+    if app.state.answer_cache is not None:
+        stats["answers"] = app.state.answer_cache.stats()
+    return stats
+
+@app.get("/api/ready")
+def ready_endpoint():
+    """就绪检查: 模型预热完成且向量库可用时返回 200, 否则 503 (负载均衡据此决定是否转发流量)"""
+    status = model_registry.status()
+    status["vector_store"] = vector_store.health()
+    status["ready"] = status["ready"] and status["vector_store"]["ok"]
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/api/health")
+def health_endpoint():
+    """向量库健康检查: 能否连通 (短超时)、集合是否存在、耗时; 不可用时返回 503"""
+    status = vector_store.health()
+    return JSONResponse(status, status_code=200 if status["ok"] else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus 格式的运行指标 (各阶段耗时直方图、错误计数、进行中请求数、模型内存)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 def read_root():
     return {"message": "Knowlex RAG API  正在运行..."}
\ No newline at end of file
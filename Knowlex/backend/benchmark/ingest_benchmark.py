@@ -0,0 +1,377 @@
+# backend/benchmark/ingest_benchmark.py
+# (V1 - 入库基准测试)
+#
+# 用 synthetic_corpus 生成的语料逐阶段计时入库流程:
+#   解析 (process_pdf / docx / pptx, 不含切分) → 切分 → 文本嵌入 → CLIP 编码 → 写入
+# 写入默认用内存向量库替身 (不需要 Milvus 服务), 也可以用 Milvus Lite 本地文件或进程内引擎 (local_store)。
+# 加 --pipeline 时再跑一遍流式管线 (ingest_pipeline), 测端到端吞吐。
+# 报告每个阶段的 耗时 / 吞吐 / 峰值内存, 并写成 JSON, 改动前后各跑一次即可对比。
+#
+# 用法 (在 Knowlex/ 目录下):
+#   python -m backend.benchmark.ingest_benchmark --pdfs 20 --pages 30 --fake-models
+#   python -m backend.benchmark.ingest_benchmark --pdfs 5 --store lite --pipeline
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# (直接运行脚本时, 把 backend/ 和 Knowlex/ 加入 import 路径)
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (_BACKEND_DIR, os.path.dirname(_BACKEND_DIR)):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import numpy as np
+import torch
+
+# 导入你的配置
+from utils import config
+from backend.benchmark import synthetic_corpus
+from backend.data_process import pdf_processor
+from backend.data_process import ingest_pipeline
+from backend.knowledge_base import vector_store
+from backend.knowledge_base.mate_store import ManifestStore
+
+
+# --- 1. 峰值内存采样 ---
+
+def _current_rss_mb() -> Optional[float]:
+    """当前进程常驻内存 (MB); 取不到时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil  # (非 Linux 平台可选)
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        return None
+
+class _RssSampler:
+    """后台线程每隔 interval 秒采一次常驻内存, 记录阶段内的峰值"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _current_rss_mb()
+            if rss is not None:
+                self.peak = max(self.peak or 0.0, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        rss = _current_rss_mb()
+        if rss is not None:
+            self.peak = max(self.peak or 0.0, rss)
+
+
+def _pad(text: str, width: int) -> str:
+    """按显示宽度左对齐 (中文字符占两列)"""
+    shown = sum(2 if ord(ch) > 0x2E80 else 1 for ch in text)
+    return text + " " * max(width - shown, 0)
+
+
+class StageReport:
+    """收集各阶段的 耗时 / 数量 / 峰值内存"""
+
+    def __init__(self):
+        self.stages: List[Dict] = []
+
+    @contextmanager
+    def stage(self, name: str, unit: str):
+        record = {"stage": name, "unit": unit, "items": 0}
+        started = time.perf_counter()
+        with _RssSampler() as sampler:
+            yield record
+        record.setdefault("seconds", time.perf_counter() - started)
+        record["peak_rss_mb"] = sampler.peak
+        self.stages.append(record)
+
+    def add(self, name: str, unit: str, items: int, seconds: float, peak_rss_mb: Optional[float]):
+        self.stages.append({"stage": name, "unit": unit, "items": items,
+                            "seconds": seconds, "peak_rss_mb": peak_rss_mb})
+
+    def print(self):
+        print(f"\n{_pad('阶段', 20)}{'耗时(s)':>10}{'数量':>10}  {_pad('吞吐', 20)}{'峰值内存(MB)'}")
+        for s in self.stages:
+            rate = f"{s['items'] / s['seconds']:.1f} {s['unit']}/秒" if s["seconds"] > 0 else "-"
+            peak = f"{s['peak_rss_mb']:.0f}" if s["peak_rss_mb"] is not None else "n/a"
+            print(f"{_pad(s['stage'], 20)}{s['seconds']:>10.2f}{s['items']:>10}  {_pad(rate, 20)}{peak:>8}")
+
+
+# --- 2. 内存向量库替身 ---
+
+class MemoryVectorStore:
+    """
+    只实现入库用到的 MilvusClient 接口 (insert / upsert / get / flush),
+    数据放在内存里, 用来单独衡量入库代码本身的开销, 不受 Milvus 服务影响。
+    """
+
+    def __init__(self):
+        self.collections: Dict[str, Dict] = {}
+        self._next_pk = 1
+        self._lock = threading.Lock()
+
+    def _rows(self, collection_name: str) -> Dict:
+        return self.collections.setdefault(collection_name, {})
+
+    def insert(self, collection_name: str, data: List[Dict], **kwargs) -> Dict:
+        with self._lock:
+            rows = self._rows(collection_name)
+            ids = list(range(self._next_pk, self._next_pk + len(data)))
+            self._next_pk += len(data)
+            for pk, row in zip(ids, data):
+                rows[pk] = dict(row, pk=pk)
+        return {"insert_count": len(data), "ids": ids}
+
+    def upsert(self, collection_name: str, data: List[Dict], **kwargs) -> Dict:
+        with self._lock:
+            rows = self._rows(collection_name)
+            for row in data:
+                rows[row["pk"]] = dict(row)
+        return {"upsert_count": len(data)}
+
+    def get(self, collection_name: str, ids: List, output_fields: List[str] = None, **kwargs) -> List[Dict]:
+        with self._lock:
+            rows = self._rows(collection_name)
+            found = [rows[pk] for pk in ids if pk in rows]
+        if output_fields:
+            return [{k: row[k] for k in ["pk"] + output_fields if k in row} for row in found]
+        return [dict(row) for row in found]
+
+    def flush(self, collection_name: str, **kwargs):
+        pass
+
+    def count(self, collection_name: str) -> int:
+        return len(self._rows(collection_name))
+
+def _make_store(kind: str, work_dir: str, name: str):
+    if kind == "memory":
+        return MemoryVectorStore()
+    if kind == "local":
+        # (进程内引擎: 每次用新目录)
+        config.VECTOR_BACKEND = "local"
+        config.LOCAL_STORE_DIR = os.path.join(work_dir, f"local_{name}_{int(time.time() * 1000)}")
+        return vector_store.initialize_milvus()
+    config.VECTOR_BACKEND = "milvus"
+    # (Milvus Lite: 本地文件, 每次用新文件, 避免上一次的数据影响计时)
+    config.MILVUS_URI = os.path.join(work_dir, f"milvus_{name}_{int(time.time() * 1000)}.db")
+    return vector_store.initialize_milvus()
+
+def _store_counts(store) -> Dict[str, int]:
+    if isinstance(store, MemoryVectorStore):
+        return {name: store.count(name) for name in (config.TEXT_COLLECTION_NAME, config.IMAGE_COLLECTION_NAME)}
+    return {name: store.get_collection_stats(name)["row_count"]
+            for name in (config.TEXT_COLLECTION_NAME, config.IMAGE_COLLECTION_NAME)}
+
+
+# --- 3. 模型 (真实模型 / 不下载模型的替身) ---
+
+def _fake_vector(key: str, dim: int) -> List[float]:
+    seed = int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16)
+    v = np.random.RandomState(seed).standard_normal(dim).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+class _FakeTextModel:
+    """m3e 替身: 按文本哈希生成固定向量 (只测管线开销, 不测模型)"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [_fake_vector(text, config.TEXT_EMBEDDING_DIM) for text in texts]
+
+class _FakeClipInputs(dict):
+    def to(self, device):
+        return self
+
+class _FakeClipProcessor:
+    """CLIP 预处理替身: 缩放到 224x224 并转成张量 (保留真实预处理的主要开销)"""
+
+    def __call__(self, images=None, return_tensors=None, padding=None, **kwargs):
+        arrays = [np.asarray(img.resize((224, 224)), dtype=np.float32) / 255.0 for img in images]
+        return _FakeClipInputs(pixel_values=torch.from_numpy(np.stack(arrays)).permute(0, 3, 1, 2))
+
+class _FakeClipModel:
+    def get_image_features(self, pixel_values=None, **kwargs):
+        pooled = torch.nn.functional.adaptive_avg_pool2d(pixel_values, (16, 11)).flatten(1)
+        return pooled[:, :config.IMAGE_EMBEDDING_DIM]
+
+def _load_models(fake: bool):
+    if fake:
+        return _FakeTextModel(), (_FakeClipModel(), _FakeClipProcessor(), "cpu")
+    return vector_store.get_text_embedding_model(), vector_store.get_image_embedding_models()
+
+
+# --- 4. 逐阶段计时 ---
+
+def run_stages(file_list, report: StageReport, text_model, image_models, store) -> Dict:
+    """单进程顺序跑各阶段, 得到每个阶段单独的耗时"""
+    # 1+2. 解析 + 切分 (包装 split_text 单独统计切分耗时)
+    split_seconds = 0.0
+    original_split_text = pdf_processor.split_text
+
+    def timed_split_text(*args, **kwargs):
+        nonlocal split_seconds
+        started = time.perf_counter()
+        try:
+            return original_split_text(*args, **kwargs)
+        finally:
+            split_seconds += time.perf_counter() - started
+
+    text_docs, image_infos = [], []
+    pdf_processor.split_text = timed_split_text
+    try:
+        started = time.perf_counter()
+        with _RssSampler() as sampler:
+            for _, _, file_docs, file_images in pdf_processor.iter_files(file_list, workers=1):
+                text_docs.extend(file_docs)
+                image_infos.extend(file_images)
+        parse_total = time.perf_counter() - started
+    finally:
+        pdf_processor.split_text = original_split_text
+    report.add("解析", "文件", len(file_list), parse_total - split_seconds, sampler.peak)
+    report.add("切分", "块", len(text_docs), split_seconds, sampler.peak)
+
+    # 3. 文本嵌入
+    text_rows = []
+    with report.stage("文本嵌入", "块") as record:
+        batch_size = config.TEXT_EMBED_BATCH_SIZE
+        for i in range(0, len(text_docs), batch_size):
+            text_rows.append(vector_store.embed_text_rows(lambda: text_model, text_docs[i:i + batch_size]))
+        record["items"] = len(text_docs)
+
+    # 4. CLIP 编码 (含解码; 同一张图只编码一次)
+    groups = vector_store.group_image_refs(image_infos)
+    items = [dict(image_hash=image_hash, **group) for image_hash, group in groups.items()]
+    image_rows = []
+    with report.stage("CLIP 编码", "张") as record:
+        for rows in vector_store.iter_image_rows(lambda: image_models, items):
+            image_rows.append(rows)
+        record["items"] = sum(len(rows) for rows in image_rows)
+
+    # 5. 写入
+    with report.stage("写入", "行") as record:
+        for rows in text_rows:
+            vector_store.insert_text_rows(store, rows)
+        for rows in image_rows:
+            vector_store.upsert_image_rows(store, rows)
+        store.flush(config.TEXT_COLLECTION_NAME)
+        store.flush(config.IMAGE_COLLECTION_NAME)
+        record["items"] = sum(len(rows) for rows in text_rows) + sum(len(rows) for rows in image_rows)
+
+    return {"chunks": len(text_docs), "image_occurrences": len(image_infos),
+            "unique_images": len(groups), "clause_chunks": sum(1 for d in text_docs if d.metadata["clause_id"])}
+
+def run_pipeline_stage(file_list, report: StageReport, text_model, image_models, store,
+                       work_dir: str, workers: int) -> Dict:
+    """端到端跑一遍流式管线 (多进程解析 + 各阶段并行)"""
+    manifest_path = os.path.join(work_dir, "bench_manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    loaders = (vector_store.text_embedding_model, vector_store.image_embedding_models)
+    vector_store.text_embedding_model = lambda: text_model
+    vector_store.image_embedding_models = lambda: image_models
+    try:
+        with report.stage("流式管线 (端到端)", "块") as record:
+            stats = ingest_pipeline.run_pipeline(store, file_list, ManifestStore(manifest_path), workers)
+            record["items"] = stats["chunks"]
+    finally:
+        vector_store.text_embedding_model, vector_store.image_embedding_models = loaders
+    return stats
+
+
+# --- 5. 主函数 ---
+
+def _dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 1024 / 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Knowlex 入库基准测试")
+    parser.add_argument("--pdfs", type=int, default=10, help="PDF 文件数")
+    parser.add_argument("--docx", type=int, default=2, help="DOCX 文件数")
+    parser.add_argument("--pptx", type=int, default=2, help="PPTX 文件数")
+    parser.add_argument("--pages", type=int, default=20, help="每个文件的页数 (PPTX 为幻灯片数)")
+    parser.add_argument("--clauses-per-page", type=int, default=6)
+    parser.add_argument("--images-per-page", type=int, default=2)
+    parser.add_argument("--image-pool", type=int, default=40, help="不同图片的数量 (越少重复越多)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default="./output/benchmark", help="语料、图片和报告的存放目录")
+    parser.add_argument("--store", choices=["memory", "lite", "local"], default="memory",
+                        help="写入目标: memory = 内存替身, lite = Milvus Lite 本地文件, local = 进程内引擎")
+    parser.add_argument("--fake-models", action="store_true", help="用替身代替 m3e / CLIP (不下载模型, 只测管线)")
+    parser.add_argument("--embedding-cache", action="store_true", help="启用本地向量缓存 (默认关闭, 每次都真实编码)")
+    parser.add_argument("--pipeline", action="store_true", help="再跑一遍流式管线, 测端到端吞吐")
+    parser.add_argument("--workers", type=int, default=None, help="流式管线的解析进程数 (默认读取配置)")
+    args = parser.parse_args(argv)
+
+    work_dir = os.path.abspath(args.work_dir)
+    corpus_dir = os.path.join(work_dir, synthetic_corpus.corpus_dir_name(
+        args.pdfs, args.docx, args.pptx, args.pages, args.clauses_per_page,
+        args.images_per_page, args.image_pool, args.seed))
+    run_dir = os.path.join(work_dir, "run")
+    config.OUTPUT_IMAGE_PATH = os.path.join(run_dir, "images")
+    config.EMBEDDING_CACHE_ENABLED = args.embedding_cache
+    config.EMBEDDING_CACHE_DIR = os.path.join(run_dir, "embedding_cache")
+
+    report = StageReport()
+    with report.stage("生成语料", "文件") as record:
+        file_list = synthetic_corpus.build_corpus(
+            corpus_dir, args.pdfs, args.docx, args.pptx, args.pages, args.clauses_per_page,
+            args.images_per_page, args.image_pool, seed=args.seed)
+        record["items"] = len(file_list)
+    with report.stage("加载模型", "个") as record:
+        text_model, image_models = _load_models(args.fake_models)
+        record["items"] = 2
+
+    store = _make_store(args.store, run_dir, "stages")
+    started = time.perf_counter()
+    corpus_stats = run_stages(file_list, report, text_model, image_models, store)
+    stage_seconds = time.perf_counter() - started
+    corpus_stats["store_rows"] = _store_counts(store)
+    corpus_stats["image_dir_mb"] = _dir_size_mb(config.OUTPUT_IMAGE_PATH)
+    corpus_stats["corpus_mb"] = _dir_size_mb(corpus_dir)
+
+    if args.pipeline:
+        pipeline_store = _make_store(args.store, run_dir, "pipeline")
+        run_pipeline_stage(file_list, report, text_model, image_models, pipeline_store, run_dir, args.workers)
+
+    report.print()
+    print(f"\n语料: {len(file_list)} 个文件 ({corpus_stats['corpus_mb']:.1f} MB), "
+          f"{corpus_stats['chunks']} 个文本块 (带条文编号 {corpus_stats['clause_chunks']}), "
+          f"图片 {corpus_stats['image_occurrences']} 次出现 / {corpus_stats['unique_images']} 张不同")
+    print(f"逐阶段合计 {stage_seconds:.2f}s, {corpus_stats['chunks'] / max(stage_seconds, 1e-9):.1f} 块/秒; "
+          f"落盘图片 {corpus_stats['image_dir_mb']:.1f} MB")
+
+    os.makedirs(work_dir, exist_ok=True)
+    report_path = os.path.join(work_dir, f"ingest_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "args": vars(args),
+            "config": {key: getattr(config, key) for key in (
+                "TEXT_EMBED_BATCH_SIZE", "IMAGE_EMBED_BATCH_SIZE", "IMAGE_DECODE_WORKERS",
+                "INGEST_WORKERS", "PDF_PAGES_PER_TASK", "CLAUSE_CHUNKING", "IMAGE_LAZY_EXTRACT")},
+            "corpus": corpus_stats,
+            "stages": report.stages,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"报告已写入: {report_path}")
+    return report
+
+if __name__ == "__main__":
+    main()
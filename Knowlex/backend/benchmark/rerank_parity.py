@@ -0,0 +1,138 @@
+# backend/benchmark/rerank_parity.py
+# (V1 - Reranker 后端一致性检查)
+#
+# 切换 RERANKER_BACKEND (如 flag → onnx-int8) 前跑一遍:
+# 对 test_questions.jsonl 里的每个问题, 用向量检索器召回候选文本块,
+# 分别用参考后端 (默认 flag) 和待测后端打分排序, 比较:
+#   - Top-1 一致率: 两个后端第一名相同的问题比例
+#   - Top-3 重合率: 两个后端前三名的平均重合比例 (不计顺序)
+# 同时报告两个后端每个问题的平均打分耗时。低于门槛 (RERANK_PARITY_TOP1 / TOP3) 时以非零状态退出。
+#
+# 用法 (在 Knowlex/ 目录下, 需要向量库里已有数据):
+#   python -m backend.benchmark.rerank_parity --backend onnx-int8
+#   python -m backend.benchmark.rerank_parity --backend onnx-int8 --threads 4 --report output/rerank_parity.json
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Tuple
+
+# (直接运行脚本时, 把 backend/ 和 Knowlex/ 加入 import 路径)
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (_BACKEND_DIR, os.path.dirname(_BACKEND_DIR)):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# 导入你的配置
+from utils import config
+from backend.knowledge_base import vector_store
+from backend.rag import reranker_backend
+
+
+def load_questions(path: str) -> List[Dict]:
+    """读取问题文件 (每行一个 {"id", "query"}, 跳过空行和 # 注释行)"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                questions.append(json.loads(line))
+    return questions
+
+def _ranking(reranker, query: str, texts: List[str]) -> Tuple[List[int], float]:
+    """返回 (按分数从高到低的候选序号, 打分耗时 秒)"""
+    started = time.perf_counter()
+    scores = reranker.compute_score([(query, text) for text in texts], batch_size=config.RERANK_MAX_BATCH)
+    elapsed = time.perf_counter() - started
+    scores = [scores] if len(texts) == 1 else list(scores)
+    return sorted(range(len(texts)), key=lambda i: scores[i], reverse=True), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reranker 后端一致性检查 (Top-1 / Top-3)")
+    parser.add_argument("--questions", default="test_questions.jsonl", help="问题文件")
+    parser.add_argument("--model", default=config.RERANKER_MODEL)
+    parser.add_argument("--reference", default="flag", help="参考后端 (flag / onnx / onnx-int8)")
+    parser.add_argument("--backend", default="onnx-int8", help="待测后端 (flag / onnx / onnx-int8)")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX intra-op 线程数 (默认 RERANK_ONNX_THREADS)")
+    parser.add_argument("--top1", type=float, default=config.RERANK_PARITY_TOP1, help="Top-1 一致率门槛")
+    parser.add_argument("--top3", type=float, default=config.RERANK_PARITY_TOP3, help="Top-3 重合率门槛")
+    parser.add_argument("--report", default="", help="JSON 报告输出路径 (可选)")
+    args = parser.parse_args()
+    if args.threads is not None:
+        config.RERANK_ONNX_THREADS = args.threads
+
+    questions = load_questions(args.questions)
+    if not questions:
+        print(f"错误: {args.questions} 里没有问题")
+        sys.exit(2)
+
+    # --- 1. 召回候选 (两个后端用同一批候选) ---
+    print(f"正在召回候选 ({len(questions)} 个问题)...")
+    retriever = vector_store.get_text_retriever()
+    candidates = {q["id"]: [doc.page_content for doc in retriever.invoke(q["query"])] for q in questions}
+
+    # --- 2. 两个后端分别打分 ---
+    print(f"正在加载 参考后端: {args.reference}")
+    reference = reranker_backend.load_reranker(args.model, args.reference)
+    print(f"正在加载 待测后端: {args.backend}")
+    backend = reranker_backend.load_reranker(args.model, args.backend)
+
+    rows, ref_seconds, test_seconds = [], 0.0, 0.0
+    for q in questions:
+        texts = candidates[q["id"]]
+        if not texts:
+            print(f"  [跳过] {q['id']}: 没有召回结果")
+            continue
+        ref_order, ref_elapsed = _ranking(reference, q["query"], texts)
+        test_order, test_elapsed = _ranking(backend, q["query"], texts)
+        ref_seconds += ref_elapsed
+        test_seconds += test_elapsed
+        top3 = min(3, len(texts))
+        rows.append({
+            "id": q["id"],
+            "candidates": len(texts),
+            "top1_match": ref_order[0] == test_order[0],
+            "top3_overlap": len(set(ref_order[:top3]) & set(test_order[:top3])) / top3,
+            "reference_ms": round(ref_elapsed * 1000, 2),
+            "backend_ms": round(test_elapsed * 1000, 2),
+        })
+        print(f"  {q['id']}: Top-1 {'一致' if rows[-1]['top1_match'] else '不同'}, "
+              f"Top-3 重合 {rows[-1]['top3_overlap']:.2f}, "
+              f"{rows[-1]['reference_ms']:.1f}ms → {rows[-1]['backend_ms']:.1f}ms")
+
+    if not rows:
+        print("错误: 所有问题都没有召回结果, 请先入库")
+        sys.exit(2)
+
+    # --- 3. 汇总 ---
+    top1 = sum(r["top1_match"] for r in rows) / len(rows)
+    top3 = sum(r["top3_overlap"] for r in rows) / len(rows)
+    passed = top1 >= args.top1 and top3 >= args.top3
+    summary = {
+        "model": args.model,
+        "reference": args.reference,
+        "backend": args.backend,
+        "questions": len(rows),
+        "top1_agreement": round(top1, 4),
+        "top3_overlap": round(top3, 4),
+        "reference_avg_ms": round(ref_seconds / len(rows) * 1000, 2),
+        "backend_avg_ms": round(test_seconds / len(rows) * 1000, 2),
+        "passed": passed,
+        "per_question": rows,
+    }
+    print(f"\nTop-1 一致率: {top1:.2%} (门槛 {args.top1:.0%}), Top-3 重合率: {top3:.2%} (门槛 {args.top3:.0%})")
+    print(f"平均打分耗时: {args.reference} {summary['reference_avg_ms']}ms, {args.backend} {summary['backend_avg_ms']}ms")
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入: {args.report}")
+    print("通过" if passed else "未通过: 排序差异超出容忍范围, 不建议切换后端")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
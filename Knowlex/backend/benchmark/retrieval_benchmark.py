@@ -0,0 +1,377 @@
+# backend/benchmark/retrieval_benchmark.py
+# (V1 - 检索质量与延迟基准测试)
+#
+# 对一组带标注的问题 (期望命中的 文件名 / 页码 / 条文编号) 逐个运行 run_retrieval_pipeline, 报告:
+#   - 质量: Top-1 准确率、Top-3 召回率、MRR (只看返回的 Top-3)
+#   - 延迟: 各阶段 (嵌入 / 检索 / 重排 / 关联图片) 和整个请求的 p50 / p95 / p99
+# 默认完全离线: 用 synthetic_corpus 生成语料, 写入进程内向量引擎 (local_store),
+# 嵌入模型和 Reranker 用不需要下载的替身 (字符二元组), 问题从入库的文本块里按随机种子抽取。
+# 同样的参数得到同样的语料和问题, 每个问题前清空查询缓存, 前后两次运行的结果可以直接对比 (--compare)。
+#
+# 用法 (在 Knowlex/ 目录下):
+#   python -m backend.benchmark.retrieval_benchmark                       # 离线, 替身模型
+#   python -m backend.benchmark.retrieval_benchmark --real-models         # 离线语料, 真实 m3e / bge-reranker
+#   python -m backend.benchmark.retrieval_benchmark --questions labeled.jsonl   # 用当前配置的向量库和模型
+#   python -m backend.benchmark.retrieval_benchmark --compare output/benchmark/retrieval_report_xxx.json
+#
+# 标注问题文件每行一个 JSON: {"id", "query", "expected": [{"doc_name", "page", "clause_id"}]}
+# (只有一个期望结果时也可以把 doc_name / page / clause_id 直接写在顶层)。
+# 期望结果写了 clause_id 时按 文件名 + 条文编号 判定命中, 否则按 文件名 + 页码。
+
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import shutil
+import argparse
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# (直接运行脚本时, 把 backend/ 和 Knowlex/ 加入 import 路径)
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (_BACKEND_DIR, os.path.dirname(_BACKEND_DIR)):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import numpy as np
+
+# 导入你的配置
+from utils import config
+from utils import model_registry
+from backend.benchmark import synthetic_corpus
+from backend.benchmark import ingest_benchmark
+from backend.data_process import ingest_pipeline
+from backend.knowledge_base import vector_store
+from backend.knowledge_base import image_store
+from backend.knowledge_base.mate_store import ManifestStore
+from backend.rag import reranker_backend
+
+STAGES = ["embed", "search", "rerank", "image"]
+STAGE_NAMES = {"embed": "问题嵌入", "search": "召回", "rerank": "重排", "image": "关联图片",
+               "other": "其他 (融合/格式化)", "total": "整个请求"}
+LOAD_BATCH_SIZE = 1000
+
+
+# --- 1. 替身模型 (不下载模型; 相似的文本得分也相近, 指标才有意义) ---
+
+def _bigrams(text: str) -> List[str]:
+    text = "".join(text.split())
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+class _HashingTextModel:
+    """m3e 替身: 字符二元组哈希到固定维度的词袋向量 (归一化)"""
+
+    def _vector(self, text: str) -> List[float]:
+        v = np.zeros(config.TEXT_EMBEDDING_DIM, dtype=np.float32)
+        for gram in _bigrams(text):
+            v[zlib.crc32(gram.encode("utf-8")) % config.TEXT_EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(v)
+        return (v / norm if norm > 0 else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+class _OverlapReranker:
+    """bge-reranker 替身: 问题与文本块的字符二元组重合度 (余弦)"""
+
+    def compute_score(self, sentence_pairs, batch_size: int = None, **kwargs):
+        scores = []
+        for query, passage in sentence_pairs:
+            q, p = set(_bigrams(query)), set(_bigrams(passage))
+            scores.append(len(q & p) / math.sqrt(len(q) * len(p)) if q and p else 0.0)
+        return scores[0] if len(scores) == 1 else scores
+
+
+# --- 2. 分阶段计时 ---
+
+class StageTimer:
+    """
+    按线程记录当前请求每个阶段的独占耗时:
+    阶段之间嵌套调用时 (如检索器内部调用嵌入模型), 内层的时间只算在内层阶段。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.totals = defaultdict(float)
+        self._local.stack = []
+
+    def totals(self) -> Dict[str, float]:
+        return dict(getattr(self._local, "totals", {}))
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            local = self._local
+            if not hasattr(local, "stack"):
+                self.reset()
+            local.stack.append(0.0)  # (内层阶段的累计耗时)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                local.totals[stage] += elapsed - local.stack.pop()
+                if local.stack:
+                    local.stack[-1] += elapsed
+        return timed
+
+class _TimedEmbeddings:
+    def __init__(self, embeddings, timer: StageTimer):
+        self.embed_query = timer.wrap("embed", embeddings.embed_query)
+        self.embed_documents = timer.wrap("embed", embeddings.embed_documents)
+
+class _TimedRetriever:
+    def __init__(self, retriever, timer: StageTimer):
+        self.get_relevant_documents = timer.wrap("search", retriever.get_relevant_documents)
+
+def instrument(rag_chain, timer: StageTimer):
+    """给检索管线的各阶段套上计时 (只在基准测试进程里替换)"""
+    rag_chain.query_embeddings.embeddings = _TimedEmbeddings(rag_chain.query_embeddings.embeddings, timer)
+    timed_retriever = _TimedRetriever(rag_chain.text_retriever(), timer)
+    rag_chain.text_retriever = lambda: timed_retriever
+    rag_chain.keyword_idx.search = timer.wrap("search", rag_chain.keyword_idx.search)
+    rag_chain.clause_idx.match_query = timer.wrap("search", rag_chain.clause_idx.match_query)
+    rag_chain._rerank = timer.wrap("rerank", rag_chain._rerank)
+    rag_chain.page_image_idx.lookup = timer.wrap("image", rag_chain.page_image_idx.lookup)
+    image_store.resolve_image = timer.wrap("image", image_store.resolve_image)
+
+
+# --- 3. 评测指标 ---
+
+def load_labeled_questions(path: str) -> List[Dict]:
+    """读取标注问题 (跳过空行和 # 注释行), 统一成 {"id", "query", "expected": [...]}"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            expected = item.get("expected") or [
+                {key: item[key] for key in ("doc_name", "page", "clause_id") if key in item}]
+            questions.append({"id": item["id"], "query": item["query"], "expected": expected})
+    return questions
+
+def _is_hit(clause: Dict, expected: Dict) -> bool:
+    if clause.get("doc_name") != expected.get("doc_name"):
+        return False
+    if expected.get("clause_id"):
+        return clause.get("clause_id") == expected["clause_id"]
+    return clause.get("page") == expected.get("page")
+
+def score_result(result: Dict, expected: List[Dict]) -> Dict:
+    """单个问题的 Top-1 / Top-3 召回 / 倒数排名 (第一个命中的名次)"""
+    clauses = result["clauses"][:3]
+    ranks = [rank for rank, clause in enumerate(clauses, start=1)
+             if any(_is_hit(clause, exp) for exp in expected)]
+    found = sum(1 for exp in expected if any(_is_hit(clause, exp) for clause in clauses))
+    return {
+        "top1": bool(ranks) and ranks[0] == 1,
+        "recall3": found / len(expected),
+        "rr": 1.0 / ranks[0] if ranks else 0.0,
+        "rank": ranks[0] if ranks else None,
+    }
+
+def _percentiles(values_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(values_ms, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+    }
+
+
+# --- 4. 离线语料与标注问题 ---
+
+def _load_chunks(client) -> List[Dict]:
+    iterator = client.query_iterator(
+        collection_name=config.TEXT_COLLECTION_NAME,
+        batch_size=LOAD_BATCH_SIZE,
+        output_fields=["pk", "chunk_text", "doc_name", "page", "clause_id"],
+    )
+    chunks = []
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            chunks.extend(batch)
+    finally:
+        iterator.close()
+    return sorted(chunks, key=lambda row: row["pk"])
+
+def build_offline_questions(client, count: int, clause_ratio: float, seed: int) -> List[Dict]:
+    """
+    从入库的文本块里按随机种子抽取问题:
+    大部分问题是文本块里连续两句话 (考察 向量 + 关键词 召回和重排),
+    clause_ratio 比例的问题点名 "标准 + 条文编号" (考察条文直查)。
+    """
+    rng = random.Random(seed)
+    chunks = [row for row in _load_chunks(client) if row.get("clause_id")]
+    questions = []
+    for i, row in enumerate(rng.sample(chunks, min(count, len(chunks)))):
+        expected = [{"doc_name": row["doc_name"], "page": row["page"], "clause_id": row["clause_id"]}]
+        if rng.random() < clause_ratio:
+            title = os.path.splitext(os.path.basename(row["doc_name"]))[0]
+            query = f"《{title}》第{row['clause_id']}条是怎么规定的?"
+        else:
+            sentences = [s for s in row["chunk_text"].replace(row["clause_id"], "", 1).split("。") if s.strip()]
+            start = rng.randrange(max(len(sentences) - 1, 1))
+            query = "。".join(s.strip() for s in sentences[start:start + 2])
+        questions.append({"id": f"b{i:04d}", "query": query, "expected": expected})
+    return questions
+
+def prepare_offline(args, run_dir: str) -> List[Dict]:
+    """生成语料并写入新的进程内引擎, 返回标注问题"""
+    corpus_dir = os.path.join(os.path.abspath(args.work_dir), synthetic_corpus.corpus_dir_name(
+        args.pdfs, 0, 0, args.pages, args.clauses_per_page, args.images_per_page, args.image_pool, args.seed))
+    file_list = synthetic_corpus.build_corpus(
+        corpus_dir, args.pdfs, 0, 0, args.pages, args.clauses_per_page,
+        args.images_per_page, args.image_pool, seed=args.seed)
+
+    shutil.rmtree(run_dir, ignore_errors=True)
+    config.VECTOR_BACKEND = "local"
+    config.LOCAL_STORE_DIR = os.path.join(run_dir, "local_store")
+    config.OUTPUT_IMAGE_PATH = os.path.join(run_dir, "images")
+    config.IMAGE_CACHE_DIR = os.path.join(run_dir, "image_cache")
+    config.MANIFEST_PATH = os.path.join(run_dir, "manifest.json")
+    config.EMBEDDING_CACHE_ENABLED = False
+
+    print(f"正在入库离线语料 ({len(file_list)} 个文件)...")
+    client = vector_store.initialize_milvus()
+    ingest_pipeline.run_pipeline(client, file_list, ManifestStore())
+    questions = build_offline_questions(client, args.count, args.clause_ratio, args.seed)
+    with open(os.path.join(run_dir, "questions.jsonl"), "w", encoding="utf-8") as f:
+        for item in questions:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    return questions
+
+
+# --- 5. 主函数 ---
+
+def run_benchmark(rag_chain, questions: List[Dict], warmup: int, keep_cache: bool) -> Dict:
+    # (模型和索引在计时前加载, 不算进第一个问题的耗时)
+    model_registry.warm_up(config.WARMUP_MODELS, background=False)
+    rag_chain.ensure_indexes()
+    timer = StageTimer()
+    instrument(rag_chain, timer)
+    for item in questions[:warmup]:
+        rag_chain.run_retrieval_pipeline(item["query"])
+
+    rows = []
+    latencies = defaultdict(list)
+    for item in questions:
+        if not keep_cache:
+            rag_chain.result_cache.clear()
+            rag_chain.query_embed_cache.clear()
+        timer.reset()
+        started = time.perf_counter()
+        result = rag_chain.run_retrieval_pipeline(item["query"])
+        total = time.perf_counter() - started
+        stages = timer.totals()
+        for stage in STAGES:
+            latencies[stage].append(stages.get(stage, 0.0) * 1000)
+        latencies["other"].append(max(total - sum(stages.values()), 0.0) * 1000)
+        latencies["total"].append(total * 1000)
+        rows.append(dict(score_result(result, item["expected"]), id=item["id"], total_ms=round(total * 1000, 3)))
+
+    n = len(rows)
+    return {
+        "questions": n,
+        "metrics": {
+            "top1_accuracy": round(sum(r["top1"] for r in rows) / n, 4),
+            "top3_recall": round(sum(r["recall3"] for r in rows) / n, 4),
+            "mrr": round(sum(r["rr"] for r in rows) / n, 4),
+        },
+        "latency_ms": {stage: _percentiles(values) for stage, values in latencies.items()},
+        "per_question": rows,
+    }
+
+def print_report(report: Dict, previous: Optional[Dict] = None):
+    def delta(now, before, fmt):
+        return f"  ({now - before:+{fmt}})" if before is not None else ""
+
+    metrics = report["metrics"]
+    old_metrics = (previous or {}).get("metrics", {})
+    print(f"\n问题数: {report['questions']}")
+    for key, name in (("top1_accuracy", "Top-1 准确率"), ("top3_recall", "Top-3 召回率"), ("mrr", "MRR")):
+        print(f"{ingest_benchmark._pad(name, 16)}{metrics[key]:>8.4f}{delta(metrics[key], old_metrics.get(key), '.4f')}")
+
+    old_latency = (previous or {}).get("latency_ms", {})
+    print(f"\n{ingest_benchmark._pad('阶段 (ms)', 22)}{'p50':>10}{'p95':>10}{'p99':>10}{'平均':>10}")
+    for stage in STAGES + ["other", "total"]:
+        values = report["latency_ms"][stage]
+        line = f"{ingest_benchmark._pad(STAGE_NAMES[stage], 22)}"
+        line += "".join(f"{values[key]:>10.2f}" for key in ("p50", "p95", "p99", "mean"))
+        if stage in old_latency:
+            line += f"  (p50 {values['p50'] - old_latency[stage]['p50']:+.2f}, p95 {values['p95'] - old_latency[stage]['p95']:+.2f})"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Knowlex 检索质量与延迟基准测试")
+    parser.add_argument("--questions", default="", help="标注问题文件 (不指定时离线生成语料和问题)")
+    parser.add_argument("--count", type=int, default=200, help="离线模式抽取的问题数")
+    parser.add_argument("--clause-ratio", type=float, default=0.2, help="离线模式中点名条文编号的问题比例")
+    parser.add_argument("--pdfs", type=int, default=6, help="离线语料的 PDF 文件数")
+    parser.add_argument("--pages", type=int, default=15)
+    parser.add_argument("--clauses-per-page", type=int, default=6)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--image-pool", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true", help="离线模式也用真实的 m3e / Reranker (默认用替身)")
+    parser.add_argument("--warmup", type=int, default=3, help="正式计时前预热的问题数")
+    parser.add_argument("--keep-cache", action="store_true", help="不在每个问题前清空查询缓存")
+    parser.add_argument("--work-dir", default="./output/benchmark", help="语料和报告的存放目录")
+    parser.add_argument("--compare", default="", help="上一次的报告 (JSON), 打印差值")
+    args = parser.parse_args(argv)
+
+    work_dir = os.path.abspath(args.work_dir)
+    offline = not args.questions
+    if offline:
+        if not args.real_models:
+            text_model = _HashingTextModel()
+            vector_store.get_text_embedding_model = lambda: text_model
+            vector_store.get_image_embedding_models = lambda: ingest_benchmark._load_models(True)[1]
+            reranker_backend.load_reranker = lambda model_name, backend=None: _OverlapReranker()
+        questions = prepare_offline(args, os.path.join(work_dir, "retrieval_run"))
+    else:
+        questions = load_labeled_questions(args.questions)
+    if not questions:
+        print("错误: 没有可用的标注问题")
+        sys.exit(2)
+
+    # (放在替身和配置都设好之后; 检索管线导入时只登记模型, 第一次用到时才加载)
+    from backend.rag import rag_chain
+
+    print(f"正在运行检索基准 ({len(questions)} 个问题)...")
+    report = run_benchmark(rag_chain, questions, args.warmup, args.keep_cache)
+    report["args"] = vars(args)
+    report["config"] = {key: getattr(config, key) for key in (
+        "VECTOR_BACKEND", "HYBRID_RETRIEVAL", "KEYWORD_TOP_K", "RERANK_CANDIDATES", "RRF_K",
+        "RERANKER_BACKEND", "RERANK_CASCADE", "RERANK_CASCADE_CHEAP_MODEL", "RERANK_CASCADE_KEEP",
+        "RERANK_EARLY_EXIT_MARGIN", "RERANK_BUDGET_MS", "LOCAL_IVF_NPROBE")}
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(report, previous)
+
+    os.makedirs(work_dir, exist_ok=True)
+    report_path = os.path.join(work_dir, f"retrieval_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n报告已写入: {report_path}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# backend/benchmark/synthetic_corpus.py
+# (V1 - 合成语料生成器)
+#
+# 在本地生成规模可调的 PDF / DOCX / PPTX 语料, 用于入库基准测试:
+# 正文是按 "章.节.条" 编号的中文条文, 页面里嵌入图片 (从固定数量的图片池里取, 会有重复, 用来覆盖图片去重)。
+# 同样的参数和随机种子生成的语料完全相同, 前后两次测试结果可以直接对比。
+
+import io
+import os
+import random
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+import docx
+from docx.shared import Inches as DocxInches
+import pptx
+from pptx.util import Inches
+from PIL import Image, ImageDraw
+
+# 条文用词 (拼出来的句子不求通顺, 只要字符分布接近真实规范)
+_SUBJECTS = ["地下室外墙", "屋面防水层", "卫生间楼地面", "后浇带", "穿墙套管", "灭火器箱", "抗震缝",
+             "外墙保温层", "施工缝", "变形缝", "防水卷材", "止水钢板", "混凝土结构", "基础底板"]
+_VERBS = ["应符合", "不应低于", "宜采用", "应按", "必须满足", "不得小于", "应设置", "可按"]
+_OBJECTS = ["设计要求", "本标准附录A的规定", "现行国家标准的有关规定", "抗震设防烈度的要求",
+            "相应的防水等级", "每层不少于两处", "图纸和施工方案", "200mm的搭接宽度", "表3.0.2的规定"]
+_TITLES = ["总则", "术语", "基本规定", "材料", "施工", "质量验收", "安装设置", "检查与维护", "防水构造", "细部做法"]
+
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(_SUBJECTS)}{rng.choice(_VERBS)}{rng.choice(_OBJECTS)}。"
+
+def _clause_text(rng: random.Random, sentences: int) -> str:
+    return "".join(_sentence(rng) for _ in range(sentences))
+
+def make_image_pool(count: int, size: int = 256, seed: int = 0) -> List[bytes]:
+    """生成 count 张不同的 PNG 图片 (随机色块 + 线条, 模拟节点图)"""
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(count):
+        img = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, x1 = sorted(rng.randrange(size) for _ in range(2))
+            y0, y1 = sorted(rng.randrange(size) for _ in range(2))
+            draw.rectangle([x0, y0, x1, y1],
+                           outline=tuple(rng.randrange(256) for _ in range(3)), width=3)
+            draw.line([rng.randrange(size) for _ in range(4)], fill=(0, 0, 0), width=2)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        pool.append(buf.getvalue())
+    return pool
+
+def _iter_clauses(rng: random.Random, count: int, sentences: Tuple[int, int]):
+    """按顺序产出 (条文编号, 节标题或 None, 条文正文)"""
+    chapter, section, clause = 1, 1, 0
+    for _ in range(count):
+        title = None
+        clause += 1
+        if clause > rng.randint(3, 8):
+            clause = 1
+            section += 1
+            title = f"{chapter}.{section} {rng.choice(_TITLES)}"
+            if section > rng.randint(2, 4):
+                chapter, section = chapter + 1, 1
+                title = f"{chapter} {rng.choice(_TITLES)}\n{chapter}.{section} {rng.choice(_TITLES)}"
+        yield f"{chapter}.{section}.{clause}", title, _clause_text(rng, rng.randint(*sentences))
+
+def _page_text(clauses) -> str:
+    lines = []
+    for clause_id, title, body in clauses:
+        if title:
+            lines.append(title)
+        lines.append(f"{clause_id} {body}")
+    return "\n".join(lines)
+
+def write_pdf(path: str, rng: random.Random, pages: int, clauses_per_page: int,
+              images_per_page: int, image_pool: List[bytes], sentences: Tuple[int, int]):
+    doc = fitz.open()
+    clauses = _iter_clauses(rng, pages * clauses_per_page, sentences)
+    for _ in range(pages):
+        page = doc.new_page(width=595, height=842)
+        text = _page_text([next(clauses) for _ in range(clauses_per_page)])
+        page.insert_textbox(fitz.Rect(40, 40, 555, 560), text, fontname="china-s", fontsize=9)
+        for k in range(images_per_page):
+            x = 40 + (k % 3) * 170
+            y = 580 + (k // 3) * 130
+            page.insert_image(fitz.Rect(x, y, x + 160, y + 120), stream=rng.choice(image_pool))
+    doc.save(path, deflate=True)
+    doc.close()
+
+def write_docx(path: str, rng: random.Random, clauses: int, images: int,
+               image_pool: List[bytes], sentences: Tuple[int, int]):
+    document = docx.Document()
+    image_every = max(clauses // max(images, 1), 1)
+    for i, (clause_id, title, body) in enumerate(_iter_clauses(rng, clauses, sentences)):
+        if title:
+            for line in title.split("\n"):
+                document.add_paragraph(line)
+        document.add_paragraph(f"{clause_id} {body}")
+        if images and i % image_every == 0:
+            document.add_picture(io.BytesIO(rng.choice(image_pool)), width=DocxInches(2))
+            images -= 1
+    document.save(path)
+
+def write_pptx(path: str, rng: random.Random, slides: int, clauses_per_slide: int,
+               images_per_slide: int, image_pool: List[bytes], sentences: Tuple[int, int]):
+    presentation = pptx.Presentation()
+    clauses = _iter_clauses(rng, slides * clauses_per_slide, sentences)
+    for _ in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])  # (空白版式)
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(4))
+        box.text_frame.text = _page_text([next(clauses) for _ in range(clauses_per_slide)])
+        for k in range(images_per_slide):
+            slide.shapes.add_picture(io.BytesIO(rng.choice(image_pool)),
+                                     Inches(0.5 + k * 3), Inches(4.8), width=Inches(2.5))
+    presentation.save(path)
+
+def build_corpus(out_dir: str, pdfs: int = 10, docxs: int = 2, pptxs: int = 2,
+                 pages: int = 20, clauses_per_page: int = 6, images_per_page: int = 2,
+                 image_pool_size: int = 40, sentences: Tuple[int, int] = (2, 8),
+                 seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    在 out_dir 下生成语料, 返回 [(绝对路径, 相对路径)] (与 pdf_processor.list_data_files 格式一致)。
+    DOCX 的条文数和图片数与一个 PDF 相同; PPTX 每页幻灯片放一半的条文。
+    已存在的同名文件直接复用, 反复跑基准时不必重新生成。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    image_pool = None
+    names = ([f"pdf/标准_{i:03d}.pdf" for i in range(pdfs)]
+             + [f"docx/讲义_{i:03d}.docx" for i in range(docxs)]
+             + [f"pptx/培训_{i:03d}.pptx" for i in range(pptxs)])
+
+    file_list = []
+    for relative_filename in names:
+        path = os.path.join(out_dir, relative_filename)
+        file_list.append((path, relative_filename))
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if image_pool is None:
+            image_pool = make_image_pool(image_pool_size, seed=seed)
+        rng = random.Random(f"{seed}:{relative_filename}")
+        # (先写临时文件再改名, 中途中断不会留下半个文件被下次复用)
+        tmp_path = path + ".tmp" + os.path.splitext(path)[1]
+        if relative_filename.endswith(".pdf"):
+            write_pdf(tmp_path, rng, pages, clauses_per_page, images_per_page, image_pool, sentences)
+        elif relative_filename.endswith(".docx"):
+            write_docx(tmp_path, rng, pages * clauses_per_page, pages * images_per_page, image_pool, sentences)
+        else:
+            write_pptx(tmp_path, rng, pages, max(clauses_per_page // 2, 1), images_per_page, image_pool, sentences)
+        os.replace(tmp_path, path)
+    return file_list
+
+def corpus_dir_name(pdfs: int, docxs: int, pptxs: int, pages: int, clauses_per_page: int,
+                    images_per_page: int, image_pool_size: int, seed: int) -> str:
+    """按参数命名语料目录, 参数不同的语料不会互相复用"""
+    return (f"corpus_p{pdfs}_d{docxs}_x{pptxs}_pg{pages}_c{clauses_per_page}"
+            f"_i{images_per_page}_pool{image_pool_size}_s{seed}")
@@ -0,0 +1,100 @@
+# backend/data_process/clause_splitter.py
+# (V1 - 按条文编号切分)
+#
+# 规范/标准的正文按 "3.2.1 ..." 这样的条文编号组织。
+# 按编号切分后每个文本块只属于一条, 编号写入 clause_id;
+# 超长的条文再交给 text_splitter 细分, 细分出的块共用同一个编号。
+
+import re
+from typing import List, Tuple
+
+# 行首的条文编号:
+#   三/四级编号 (3.2.1, A.0.1, 4.1.2.3): 后面跟空白或汉字
+#   二级编号 (3.2 材料): 只认后面跟汉字的节标题, 避免把表格里的 "2.5 m" 当成编号;
+#   还要求这一行像标题 (见 _is_heading), 避免把折行的正文 "1.5倍的设计压力进行试验。" 当成编号
+CLAUSE_PATTERN = re.compile(
+    r"^[ \t\u3000]*(?:"
+    r"((?:[1-9]\d?|[A-Z])\.\d{1,3}(?:\.\d{1,3}){1,2})(?=[\s\u3000]|[\u4e00-\u9fff]|$)"
+    r"|((?:[1-9]\d?|[A-Z])\.\d{1,3})[ \t\u3000]*(?=[\u4e00-\u9fff])"
+    r")",
+    re.M,
+)
+# 排版/扫描件抽出的文字里编号常被拆开: "3\n. 1\n. 2" / "3. 1. 2", 切分前先拼回 "3.1.2"
+_BROKEN_DOT = re.compile(r"(?<=\d)[ \t]*\n?[ \t]*\.[ \t]*(?=\d)")
+# 目录里的 "3.2 材料 ······ (12)": 带引导点的段不是条文
+_TOC_LEADERS = re.compile(r"[·…⋯]")
+_TOC_MIN_LEADERS = 6
+# 节标题: 编号后面的文字不长, 没有句子标点, 也不以量词/单位开头 ("1.5倍", "2.5米")
+_HEADING_MAX_CHARS = 20
+_SENTENCE_PUNCT = re.compile(r"[。，；：、！？,;:!?（(]")
+_QUANTITY_CHARS = "倍米毫厘千万吨克度个次天时分秒层级%‰"
+
+
+def normalize_clause_numbers(text: str) -> str:
+    """把被换行/空格拆开的条文编号拼回来"""
+    return _BROKEN_DOT.sub(".", text)
+
+
+def _is_heading(text: str, pos: int) -> bool:
+    """pos 到行尾的文字是否像节标题"""
+    end = text.find("\n", pos)
+    title = text[pos:end if end >= 0 else len(text)]
+    title = _TOC_LEADERS.split(title, 1)[0].strip()  # (目录条目只看引导点之前的标题)
+    return (0 < len(title) <= _HEADING_MAX_CHARS and not _SENTENCE_PUNCT.search(title)
+            and title[0] not in _QUANTITY_CHARS)
+
+def find_clauses(text: str) -> List[Tuple[int, str]]:
+    """
+    找出文本中所有条文编号, 返回 [(起始位置, 条文编号)]。
+    目录条目仍作为分段位置返回, 但编号为空串。
+    """
+    starts = [(m.start(), m.group(1) or m.group(2)) for m in CLAUSE_PATTERN.finditer(text)
+              if m.group(1) or _is_heading(text, m.end())]
+    clauses = []
+    for i, (start, clause_id) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else len(text)
+        if len(_TOC_LEADERS.findall(text, start, end)) >= _TOC_MIN_LEADERS:
+            clause_id = ""
+        clauses.append((start, clause_id))
+    return clauses
+
+def last_clause_id(text: str) -> str:
+    """文本中最后一个条文编号 (没有或是目录条目时返回空串)"""
+    clauses = find_clauses(normalize_clause_numbers(text))
+    return clauses[-1][1] if clauses else ""
+
+def split_clauses(text: str, current_clause: str = "", min_chars: int = 30) -> List[Tuple[str, str]]:
+    """
+    按条文编号把文本切成段: [(段落文本, 条文编号)]。
+    第一个编号之前的文字属于 current_clause (上一页延续下来的条文)。
+    短于 min_chars 的段 (节标题、页眉页码) 并入下一段, 使用下一段的编号。
+    """
+    text = normalize_clause_numbers(text)
+    bounds = find_clauses(text)
+    segments = []
+    head = text[:bounds[0][0]] if bounds else text
+    if head.strip():
+        segments.append((head, current_clause))
+    for i, (start, clause_id) in enumerate(bounds):
+        end = bounds[i + 1][0] if i + 1 < len(bounds) else len(text)
+        segments.append((text[start:end], clause_id))
+
+    merged = []
+    pending = ""
+    for i, (segment, clause_id) in enumerate(segments):
+        segment = pending + segment
+        pending = ""
+        if len(segment.strip()) < min_chars and i + 1 < len(segments):
+            pending = segment
+            continue
+        merged.append((segment, clause_id))
+    return merged
+
+def chunk_by_clause(text: str, splitter, current_clause: str = "",
+                    min_chars: int = 30) -> List[Tuple[str, str]]:
+    """按条文切分后再用 splitter 细分超长的条文, 返回 [(文本块, 条文编号)]"""
+    chunks = []
+    for segment, clause_id in split_clauses(text, current_clause, min_chars):
+        for chunk in splitter.split_text(segment):
+            chunks.append((chunk, clause_id))
+    return chunks
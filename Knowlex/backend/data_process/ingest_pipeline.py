@@ -0,0 +1,269 @@
+# backend/data_process/ingest_pipeline.py
+# (V1 - 流式入库管线)
+#
+# 解析+切分 → 文本嵌入 → 图片嵌入 → 写入 四个阶段用有界队列串起来, 各阶段同时工作:
+# 进程池解析后面的文件时, 嵌入线程在编码前面的文件, 写入线程在写 Milvus。
+# 队列满了上游就等待, 任一时刻内存里只有队列容量以内的数据, 不随 data/ 的规模增长。
+# 写入一个文件的第一行之前先在清单 (mate_store) 里记一个 partial 条目, 之后每写入一批就记下主键;
+# 全部写入后才转为正式条目。中途失败的文件下次入库时从断点续传: 内容没变就跳过已写入的文本块
+# (切分结果对同样的内容是确定的, 按已记下的主键数跳过), 只嵌入和写入剩下的; 内容变了或文件已被删除的,
+# 按记下的主键清掉已写入的行 (remove_files)。
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import List, Tuple, Dict
+
+from pymilvus import MilvusClient
+
+# 导入你的配置
+from utils import config
+from backend.data_process import pdf_processor
+from backend.knowledge_base import vector_store
+from backend.knowledge_base import mate_store
+from backend.knowledge_base.mate_store import ManifestStore
+
+_END = object()
+
+
+class _Stopped(Exception):
+    """其他阶段出错, 本阶段停止"""
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise _Stopped()
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    raise _Stopped()
+
+def _start_stage(name: str, target, stop: threading.Event, errors: List[BaseException]) -> threading.Thread:
+    """在后台线程运行一个阶段; 出错时记录异常并通知其他阶段停止"""
+    def run():
+        try:
+            target()
+        except _Stopped:
+            pass
+        except BaseException as e:
+            print(f"  > 错误: 入库阶段 [{name}] 失败: {e}")
+            errors.append(e)
+            stop.set()
+    thread = threading.Thread(target=run, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    return thread
+
+# --- 各阶段 ---
+
+def _parse_stage(file_list, workers, out_q, stop, resume):
+    """
+    阶段 1: 解析 + 切分 (进程池), 每个文件一条: (绝对路径, 相对路径, 文本块, 图片信息)。
+    resume: {相对路径: 已写入的文本块数}, 续传的文件去掉这些文本块 (不再嵌入和写入)。
+    """
+    for file_path, relative_filename, text_docs, image_infos in pdf_processor.iter_files(file_list, workers):
+        text_docs = text_docs[resume.get(relative_filename, 0):]
+        _put(out_q, (file_path, relative_filename, text_docs, image_infos), stop)
+    _put(out_q, _END, stop)
+
+def _text_embed_stage(in_q, out_q, stop, batch_size):
+    """
+    阶段 2: 文本嵌入。跨文件攒满 batch_size 条再编码, 产出 ("text", 行)。
+    一个文件的文本全部产出后才产出它的 ("file", ...) 标记, 下游据此判断该文件何时写完。
+    """
+    text_model = vector_store.text_embedding_model
+    buffer = []
+    pending_files = deque()  # (文件信息, 该文件最后一个文本块在流中的位置)
+    pushed = flushed = 0
+
+    def flush(n):
+        nonlocal flushed
+        rows = vector_store.embed_text_rows(text_model, buffer[:n])
+        del buffer[:n]
+        flushed += n
+        _put(out_q, ("text", rows), stop)
+
+    def emit_ready_files():
+        while pending_files and pending_files[0][1] <= flushed:
+            _put(out_q, ("file", pending_files.popleft()[0]), stop)
+
+    while True:
+        item = _get(in_q, stop)
+        if item is _END:
+            break
+        file_path, relative_filename, text_docs, image_infos = item
+        buffer.extend(text_docs)
+        pushed += len(text_docs)
+        pending_files.append(((file_path, relative_filename, image_infos), pushed))
+        while len(buffer) >= batch_size:
+            flush(batch_size)
+        emit_ready_files()
+
+    if buffer:
+        flush(len(buffer))
+    emit_ready_files()
+    _put(out_q, _END, stop)
+
+def _image_embed_stage(client, in_q, out_q, stop):
+    """
+    阶段 3: 图片嵌入。文本行直接透传; 遇到文件标记时处理该文件的图片:
+    先产出 ("images", (相对路径, 图片哈希)) 让写入阶段在写之前记下主键,
+    本次入库或库里已有的图片只产出 ("image_refs", ...) 合并出现位置, 新图片 CLIP 编码后产出 ("image_rows", 行)。
+    """
+    image_models = vector_store.image_embedding_models
+    seen = set()
+    # (感知哈希去重: 与已入库或本次已见过的图片只差几位的, 归到同一个键上)
+    phash_index = None
+    if config.IMAGE_PHASH_DEDUP:
+        phash_index = pdf_processor.PHashIndex()
+        for image_hash in vector_store.iter_image_pks(client):
+            phash_index.add(image_hash)
+    while True:
+        item = _get(in_q, stop)
+        if item is _END:
+            break
+        kind, payload = item
+        if kind != "file":
+            _put(out_q, item, stop)
+            continue
+
+        file_path, relative_filename, image_infos = payload
+        if phash_index is not None:
+            image_infos = phash_index.canonicalize(image_infos)
+        groups = vector_store.group_image_refs(image_infos)
+        new_items, known = vector_store.split_image_groups(client, groups, seen)
+        seen.update(groups)
+        if groups:
+            _put(out_q, ("images", (relative_filename, list(groups))), stop)
+        if known:
+            _put(out_q, ("image_refs", known), stop)
+        if new_items:
+            for rows in vector_store.iter_image_rows(image_models, new_items):
+                _put(out_q, ("image_rows", rows), stop)
+        _put(out_q, ("file", relative_filename), stop)
+    _put(out_q, _END, stop)
+
+# --- 主函数 ---
+
+def remove_files(client: MilvusClient, manifest: ManifestStore, names: List[str]):
+    """按清单里记下的主键删除这些文件的 文本行 / 图片出现位置, 并移除清单条目"""
+    for name in names:
+        entry = manifest.remove_file(name)
+        if entry is None:
+            continue
+        vector_store.delete_rows(client, config.TEXT_COLLECTION_NAME, entry["text_pks"])
+        vector_store.remove_image_refs(client, name, entry["image_pks"])
+        if entry.get("partial"):
+            # (上次入库中途失败的文件: 最后一批可能已写入但还没记下主键, 再按 doc_name 清一遍)
+            vector_store.delete_doc_rows(client, name)
+
+def _resume_points(client: MilvusClient, file_list, manifest: ManifestStore, states) -> Dict[str, int]:
+    """
+    上次没入库完 (partial) 的文件: 内容没变的返回 {相对路径: 已写入的文本块数}, 并删掉断点之后写入但没记下主键的行;
+    内容变了的清掉已写入的行, 从头入库。
+    """
+    resume = {}
+    for _, relative_filename in file_list:
+        entry = manifest.get(relative_filename)
+        if not (entry and entry.get("partial")):
+            continue
+        if entry["sha256"] != states[relative_filename]["sha256"]:
+            remove_files(client, manifest, [relative_filename])
+            continue
+        vector_store.delete_doc_rows(client, relative_filename, after_pk=max(entry["text_pks"], default=None))
+        resume[relative_filename] = len(entry["text_pks"])
+    if resume:
+        print(f"  > 断点续传 {len(resume)} 个文件, 跳过已写入的 {sum(resume.values())} 个文本块")
+    return resume
+
+def run_pipeline(client: MilvusClient, file_list: List[Tuple[str, str]],
+                 manifest: ManifestStore, workers: int = None) -> Dict[str, int]:
+    """
+    流式入库 file_list [(绝对路径, 相对路径)]。
+    写入阶段在当前线程运行: 写入前先记 partial 条目, 每批写入后记下主键, 一个文件的 文本/图片 行全部写入后才转为正式条目;
+    中途失败时已完成的文件不会重做, 未完成的文件下次从最后写入的一批之后继续。
+    返回统计 {"files", "chunks", "images"}。
+    """
+    # 文件状态 (哈希/mtime/大小) 在进程池读文件之前记录, 入库期间文件被改写时, 清单里不会出现新哈希配旧内容的行
+    states = {relative_filename: mate_store.file_state(file_path) for file_path, relative_filename in file_list}
+    resume = _resume_points(client, file_list, manifest, states)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    parsed_q = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    text_q = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    embedded_q = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+
+    threads = [
+        _start_stage("parse", lambda: _parse_stage(file_list, workers, parsed_q, stop, resume), stop, errors),
+        _start_stage("text-embed", lambda: _text_embed_stage(parsed_q, text_q, stop,
+                                                             config.TEXT_EMBED_BATCH_SIZE), stop, errors),
+        _start_stage("image-embed", lambda: _image_embed_stage(client, text_q, embedded_q, stop), stop, errors),
+    ]
+
+    # 阶段 4: 写入 Milvus + 更新清单
+    stats = {"files": 0, "chunks": 0, "images": 0}
+    started = set(resume)  # (续传的文件沿用已有的 partial 条目)
+
+    def begin(relative_filename):
+        if relative_filename not in started:
+            manifest.begin_file(relative_filename, states[relative_filename])
+            started.add(relative_filename)
+
+    started_at = last_save = time.time()
+    try:
+        while True:
+            item = _get(embedded_q, stop)
+            if item is _END:
+                break
+            kind, payload = item
+            if kind == "text":
+                for name in {row["doc_name"] for row in payload}:
+                    begin(name)
+                for name, pks in vector_store.insert_text_rows(client, payload).items():
+                    manifest.add_pks(name, text_pks=pks)
+                stats["chunks"] += len(payload)
+            elif kind == "images":
+                relative_filename, image_hashes = payload
+                begin(relative_filename)
+                # (图片主键就是哈希, 写入前记下: 没写成功的哈希清理时直接跳过)
+                manifest.add_pks(relative_filename, image_pks=image_hashes)
+            elif kind == "image_rows":
+                vector_store.upsert_image_rows(client, payload)
+                stats["images"] += len(payload)
+            elif kind == "image_refs":
+                vector_store.merge_image_refs(client, payload)
+            else:
+                begin(payload)  # (没有文本也没有图片的文件)
+                manifest.finish_file(payload)
+                stats["files"] += 1
+                if time.time() - last_save >= config.MANIFEST_SAVE_INTERVAL:
+                    manifest.save()
+                    last_save = time.time()
+    except _Stopped:
+        pass
+    except BaseException:
+        stop.set()  # (写入失败, 通知上游阶段停止)
+        raise
+    finally:
+        manifest.save()
+
+    if errors:
+        raise errors[0]
+    for thread in threads:
+        thread.join()
+
+    client.flush(config.TEXT_COLLECTION_NAME)
+    client.flush(config.IMAGE_COLLECTION_NAME)
+    elapsed = max(time.time() - started_at, 1e-6)
+    print(f"  > 入库 {stats['files']} 个文件, {stats['chunks']} 个文本块, {stats['images']} 张新图片, "
+          f"耗时 {elapsed:.1f}s ({stats['chunks'] / elapsed:.1f} 块/秒)")
+    return stats
@@ -5,11 +5,18 @@ import os
 import fitz  # PyMuPDF
 from PIL import Image
 import io
-from typing import List, Tuple, Dict
+import hashlib
+import statistics
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Dict, Optional, Iterator
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from tqdm import tqdm 
 from utils import config
+from backend.data_process import clause_splitter
+from backend.knowledge_base import image_store
 import docx
 import pptx
 
@@ -19,6 +26,21 @@ text_splitter = RecursiveCharacterTextSplitter(
     chunk_overlap=100
 )
 
+# 支持入库的文件类型
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".pptx")
+
+# (子进程中关闭逐页进度条, 避免多个进度条互相刷屏)
+_IN_WORKER = False
+
+def split_text(text: str, current_clause: str = "") -> List[Tuple[str, str]]:
+    """
+    切分文本, 返回 [(文本块, 条文编号)]。
+    开启 config.CLAUSE_CHUNKING 时按条文编号切分 (见 clause_splitter), 否则编号为空。
+    """
+    if not config.CLAUSE_CHUNKING:
+        return [(chunk, "") for chunk in text_splitter.split_text(text)]
+    return clause_splitter.chunk_by_clause(text, text_splitter, current_clause, config.CLAUSE_MIN_CHARS)
+
 # --- (不变) DOCX 文件处理器 ---
 def process_docx(file_path: str, filename: str) -> List[Document]:
     print(f"  > (DOCX) 正在处理 {filename}")
@@ -27,12 +49,12 @@ def process_docx(file_path: str, filename: str) -> List[Document]:
         full_text = "\n".join([para.text for para in doc.paragraphs if para.text])
         if not full_text: return []
         
-        chunks = text_splitter.split_text(full_text)
+        chunks = split_text(full_text)
         doc_list = []
-        for chunk in chunks:
+        for chunk, clause_id in chunks:
             doc_list.append(Document(
                 page_content=chunk,
-                metadata={"doc_name": filename, "page": 1, "clause_id": ""}
+                metadata={"doc_name": filename, "page": 1, "clause_id": clause_id}
             ))
         return doc_list
     except Exception as e:
@@ -53,56 +75,210 @@ def process_pptx(file_path: str, filename: str) -> List[Document]:
         
         if not full_text: return []
 
-        chunks = text_splitter.split_text(full_text)
+        chunks = split_text(full_text)
         doc_list = []
-        for chunk in chunks:
+        for chunk, clause_id in chunks:
             doc_list.append(Document(
                 page_content=chunk,
-                metadata={"doc_name": filename, "page": 1, "clause_id": ""}
+                metadata={"doc_name": filename, "page": 1, "clause_id": clause_id}
             ))
         return doc_list
     except Exception as e:
         print(f"  > 错误: 处理 {filename} 失败: {e}")
         return []
 
+# --- 图片去重: 内容哈希 / 感知哈希 ---
+
+def _dhash(image_bytes: bytes) -> Optional[str]:
+    """
+    64 位差异哈希 (dHash): 重新编码/轻微压缩过的同一张图得到相同或相近的值。
+    灰度方差太小的图 (空白、纯色、几乎全白的线稿) 返回 None: 它们的 dHash 只是噪声, 会把不相干的图合并。
+    """
+    img = Image.open(io.BytesIO(image_bytes)).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(img.tobytes())
+    if statistics.pstdev(pixels) < config.IMAGE_PHASH_MIN_STD:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def is_phash_key(key: str) -> bool:
+    """感知哈希键 ("d" + 16 位十六进制); 内容哈希键是 40 位 SHA-1"""
+    return len(key) == 17 and key[0] == "d"
+
+def hamming(key_a: str, key_b: str) -> int:
+    """两个感知哈希键不同的位数"""
+    return bin(int(key_a[1:], 16) ^ int(key_b[1:], 16)).count("1")
+
+def image_key(image_bytes: bytes) -> str:
+    """
+    图片去重键 (同时是 Milvus 图片集合的主键)。
+    默认是内容 SHA-1; 开启 config.IMAGE_PHASH_DEDUP 时用感知哈希, 视觉上相同的图也会合并
+    (相近而不完全相同的感知哈希由 PHashIndex 在入库时归并)。方差太小的图仍用内容哈希。
+    """
+    if config.IMAGE_PHASH_DEDUP:
+        try:
+            phash = _dhash(image_bytes)
+            if phash is not None:
+                return "d" + phash
+        except Exception:
+            pass  # (PIL 解不开的格式退回内容哈希)
+    return hashlib.sha1(image_bytes).hexdigest()
+
+def same_image(image_bytes: bytes, key: str) -> bool:
+    """图片是否属于去重键 key (感知哈希键允许 IMAGE_PHASH_MAX_DISTANCE 位以内的差异)"""
+    own_key = image_key(image_bytes)
+    if own_key == key:
+        return True
+    return (is_phash_key(own_key) and is_phash_key(key)
+            and hamming(own_key, key) <= config.IMAGE_PHASH_MAX_DISTANCE)
+
+
+class PHashIndex:
+    """
+    感知哈希的近邻归并: 与已知键相差不超过 max_distance 位的键归到那个已知键上。
+    64 位分成 max_distance + 1 段, 相差不超过 max_distance 位的两个键至少有一段完全相同,
+    只需比较有相同段的候选, 不用逐个比较。内容哈希键原样返回。
+    """
+
+    def __init__(self, max_distance: int = None):
+        self.max_distance = config.IMAGE_PHASH_MAX_DISTANCE if max_distance is None else max_distance
+        bands = self.max_distance + 1
+        self._bounds = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self._bands: List[Dict[int, List[str]]] = [{} for _ in self._bounds]
+        self._resolved: Dict[str, str] = {}
+
+    def _band_values(self, key: str) -> List[int]:
+        bits = int(key[1:], 16)
+        return [(bits >> (64 - end)) & ((1 << (end - start)) - 1) for start, end in self._bounds]
+
+    def add(self, key: str):
+        """登记一个已知键 (如 Milvus 里已有的图片主键)"""
+        if not is_phash_key(key) or key in self._resolved:
+            return
+        self._resolved[key] = key
+        for band, value in zip(self._bands, self._band_values(key)):
+            band.setdefault(value, []).append(key)
+
+    def resolve(self, key: str) -> str:
+        """返回 key 归并到的已知键 (没有相近的已知键时登记 key 本身)"""
+        if not is_phash_key(key):
+            return key
+        if key in self._resolved:
+            return self._resolved[key]
+        best, best_distance = None, self.max_distance + 1
+        for band, value in zip(self._bands, self._band_values(key)):
+            for known in band.get(value, ()):
+                distance = hamming(key, known)
+                if distance < best_distance:
+                    best, best_distance = known, distance
+        if best is None:
+            self.add(key)
+            return key
+        self._resolved[key] = best
+        return best
+
+    def canonicalize(self, image_infos: List[Dict]) -> List[Dict]:
+        """把 image_infos 里的 image_hash 换成归并后的键 (被归并的图片已落盘时删掉那份文件)"""
+        for info in image_infos:
+            key = self.resolve(info["image_hash"])
+            path = info["image_path"]
+            if (key != info["image_hash"] and not image_store.is_pdf_ref(path)
+                    and os.path.basename(path).startswith(info["image_hash"]) and os.path.exists(path)):
+                os.remove(path)
+            info["image_hash"] = key
+        return image_infos
+
+def save_image_bytes(image_bytes: bytes, image_ext: str, output_image_dir: str) -> Tuple[str, str]:
+    """
+    按去重键落盘: {键}.{扩展名}, 已存在则不再写。文件名只由去重键决定:
+    内容哈希键的扩展名由内容决定; 感知哈希键可能对应 png / jpeg 等不同编码, 统一存成 png。
+    先写临时文件再改名, 多个进程同时写同一张图也不会互相覆盖出半个文件。
+    返回 (去重键, 图片路径)。
+    """
+    key = image_key(image_bytes)
+    reencode = is_phash_key(key) and image_ext != "png"
+    img_save_path = os.path.join(output_image_dir, f"{key}.{'png' if is_phash_key(key) else image_ext}")
+    if not os.path.exists(img_save_path):
+        if reencode:
+            buffer = io.BytesIO()
+            Image.open(io.BytesIO(image_bytes)).save(buffer, format="PNG")
+            image_bytes = buffer.getvalue()
+        tmp_path = f"{img_save_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f: f.write(image_bytes)
+        os.replace(tmp_path, img_save_path)
+    return key, img_save_path
+
 # --- (不变) PDF 文件处理器 ---
-def process_pdf(file_path: str, filename: str, output_image_dir: str) -> Tuple[List[Document], List[Dict]]:
-    print(f"  > (PDF) 正在图文处理 {filename}")
+def process_pdf(file_path: str, filename: str, output_image_dir: str,
+                page_range: Optional[Tuple[int, int]] = None) -> Tuple[List[Document], List[Dict]]:
+    """
+    处理单个 PDF。
+    page_range: (起始页, 结束页) 左闭右开, 从 0 开始; None 表示整本。
+    页码元数据始终是整本中的页码, 因此按页段拆分后结果与整本处理一致。
+    页首没有条文编号的文字归属上一条 (最多追溯 CLAUSE_LOOKBACK_PAGES 页);
+    页段从中间开始时先向前回看同样的页数, 找到延续的条文编号。
+    开启 config.IMAGE_LAZY_EXTRACT 时图片不落盘, image_path 记录 (PDF, xref) 引用。
+    """
+    if page_range is None:
+        print(f"  > (PDF) 正在图文处理 {filename}")
     text_docs: List[Document] = []
     image_infos: List[Dict] = []
+    # (同一个 xref 在多页出现时只提取一次: xref -> (图片哈希, 路径))
+    saved_xrefs: Dict[int, Tuple[str, str]] = {}
     
     try:
         doc = fitz.open(file_path)
-        for page_num in tqdm(range(len(doc)), desc=f"    > 遍历 {filename}", leave=False):
+        start, end = page_range if page_range else (0, len(doc))
+        end = min(end, len(doc))
+
+        # (当前条文编号, 它所在的页)
+        current_clause, clause_page = "", start
+        if config.CLAUSE_CHUNKING:
+            for prev in range(start - 1, max(start - config.CLAUSE_LOOKBACK_PAGES, 0) - 1, -1):
+                prev_clause = clause_splitter.last_clause_id(doc.load_page(prev).get_text("text"))
+                if prev_clause:
+                    current_clause, clause_page = prev_clause, prev
+                    break
+
+        for page_num in tqdm(range(start, end), desc=f"    > 遍历 {filename}", leave=False, disable=_IN_WORKER):
             page = doc.load_page(page_num)
             
             # 1. 处理文本
             page_text = page.get_text("text")
+            if page_num - clause_page > config.CLAUSE_LOOKBACK_PAGES:
+                current_clause = ""
             if page_text:
-                chunks = text_splitter.split_text(page_text)
-                for chunk in chunks:
+                chunks = split_text(page_text, current_clause)
+                for chunk, clause_id in chunks:
                     text_docs.append(Document(
                         page_content=chunk,
-                        metadata={"doc_name": filename, "page": page_num + 1, "clause_id": ""}
+                        metadata={"doc_name": filename, "page": page_num + 1, "clause_id": clause_id}
                     ))
+                page_clause = clause_splitter.last_clause_id(page_text) if config.CLAUSE_CHUNKING else ""
+                if page_clause:
+                    current_clause, clause_page = page_clause, page_num
             
-            # 2. 处理图片
+            # 2. 处理图片 (按内容哈希去重, 同一张图全库只落盘一次; 懒提取时不落盘)
             image_list = page.get_images(full=True)
-            for img_index, img in enumerate(image_list):
+            for img in image_list:
                 xref = img[0]
                 try:
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    # (为防止重名, 替换路径中的 / 和 \)
-                    safe_filename = filename.replace("\\", "_").replace("/", "_")
-                    img_filename = f"{safe_filename}_p{page_num+1}_img{img_index}.{image_ext}"
-                    img_save_path = os.path.join(output_image_dir, img_filename)
-                    
-                    with open(img_save_path, "wb") as f: f.write(image_bytes)
-                    
+                    if xref not in saved_xrefs:
+                        base_image = doc.extract_image(xref)
+                        if config.IMAGE_LAZY_EXTRACT:
+                            saved_xrefs[xref] = (image_key(base_image["image"]),
+                                                 image_store.make_pdf_ref(file_path, xref))
+                        else:
+                            saved_xrefs[xref] = save_image_bytes(base_image["image"], base_image["ext"],
+                                                                 output_image_dir)
+                    image_hash, img_save_path = saved_xrefs[xref]
+
                     image_infos.append({
                         "image_path": img_save_path,
+                        "image_hash": image_hash,
                         "doc_name": filename,
                         "page": page_num + 1
                     })
@@ -115,53 +291,168 @@ def process_pdf(file_path: str, filename: str, output_image_dir: str) -> Tuple[L
         
     return text_docs, image_infos
 
-# --- (重大升级) 主函数 ---
-def process_all_files() -> Tuple[List[Document], List[Dict]]:
+# --- 并行入库: 任务拆分与调度 ---
+
+def list_data_files(data_dir: str) -> List[Tuple[str, str]]:
     """
-    (主函数 V4)
-    递归加载 data/ 目录下的所有文件 (PDF, DOCX, PPTX)，
-    并返回文本块和图片信息。
+    递归列出 data_dir 下的所有文件, 返回 [(绝对路径, 相对路径)]。
+    目录和文件名均排序, 保证每次遍历顺序一致 (入库结果可复现)。
     """
-    data_dir = config.DATA_DIR
-    output_image_dir = config.OUTPUT_IMAGE_PATH
-    os.makedirs(output_image_dir, exist_ok=True)
-    
-    print(f"--- (V4 递归版) 开始从 {data_dir} 加载所有文件 ---")
-    
-    all_text_docs: List[Document] = []
-    all_image_infos: List[Dict] = []
-    
-    if not os.path.exists(data_dir):
-        print(f"错误: 知识库目录 {data_dir} 不存在。")
-        return [], []
-
-    # --- (关键升级) 使用 os.walk 递归遍历 ---
+    file_list = []
     for root, dirs, files in os.walk(data_dir):
-        for filename in files:
+        dirs.sort()
+        for filename in sorted(files):
             file_path = os.path.join(root, filename)
-            
             # (新增) 相对路径名, 用于元数据
             # e.g., "地下室\建筑设计防火规范.pdf"
-            relative_filename = os.path.relpath(file_path, data_dir) 
-
-            if filename.endswith(".pdf"):
-                text_docs, image_infos = process_pdf(file_path, relative_filename, output_image_dir)
-                all_text_docs.extend(text_docs)
-                all_image_infos.extend(image_infos)
-                
-            elif filename.endswith(".docx"):
-                text_docs = process_docx(file_path, relative_filename)
-                all_text_docs.extend(text_docs)
-                
-            elif filename.endswith(".pptx"):
-                text_docs = process_pptx(file_path, relative_filename)
-                all_text_docs.extend(text_docs)
-                
+            file_list.append((file_path, os.path.relpath(file_path, data_dir)))
+    return file_list
+
+def _build_tasks(file_list: List[Tuple[str, str]], pages_per_task: int) -> List[Tuple]:
+    """
+    把文件列表拆成任务: (类型, 绝对路径, 相对路径, 页段)。
+    大 PDF 按 pages_per_task 拆成多个页段任务, 其余文件一个文件一个任务。
+    """
+    tasks = []
+    for file_path, relative_filename in file_list:
+        if relative_filename.endswith(".pdf"):
+            try:
+                with fitz.open(file_path) as doc:
+                    page_count = len(doc)
+            except Exception as e:
+                print(f"  > 错误: 打开 {relative_filename} 失败: {e}")
+                continue
+            if page_count <= pages_per_task:
+                tasks.append(("pdf", file_path, relative_filename, None))
             else:
-                print(f"  > (跳过) 不支持的文件类型: {filename}")
-    
+                for start in range(0, page_count, pages_per_task):
+                    tasks.append(("pdf", file_path, relative_filename,
+                                  (start, min(start + pages_per_task, page_count))))
+        elif relative_filename.endswith(".docx"):
+            tasks.append(("docx", file_path, relative_filename, None))
+        elif relative_filename.endswith(".pptx"):
+            tasks.append(("pptx", file_path, relative_filename, None))
+        else:
+            print(f"  > (跳过) 不支持的文件类型: {os.path.basename(file_path)}")
+    return tasks
+
+def _config_snapshot() -> Dict:
+    """主进程当前的配置 (含运行时修改过的值), 传给子进程"""
+    return {name: value for name, value in vars(config).items() if name.isupper()}
+
+def _init_worker(settings: Dict):
+    global _IN_WORKER
+    _IN_WORKER = True
+    # (spawn 出的子进程重新导入 config, 拿不到主进程运行时改过的配置, 这里补上)
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+def _run_task(task: Tuple) -> Tuple[List[Document], List[Dict]]:
+    """执行单个任务 (在子进程中运行, 必须是模块级函数才能被 pickle)"""
+    kind, file_path, relative_filename, page_range = task
+    if kind == "pdf":
+        return process_pdf(file_path, relative_filename, config.OUTPUT_IMAGE_PATH, page_range)
+    if kind == "docx":
+        return process_docx(file_path, relative_filename), []
+    return process_pptx(file_path, relative_filename), []
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = config.INGEST_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def is_supported(filename: str) -> bool:
+    return filename.endswith(SUPPORTED_EXTENSIONS)
+
+def _iter_task_results(tasks: List[Tuple], workers: int) -> Iterator[Tuple[List[Document], List[Dict]]]:
+    """
+    按任务顺序逐个产出结果。
+    多进程时最多同时挂起 workers * PARSE_INFLIGHT_PER_WORKER 个任务,
+    下游处理慢时不会把整个语料的解析结果堆在内存里。
+    """
+    if workers == 1:
+        yield from map(_run_task, tasks)
+        return
+
+    max_inflight = workers * config.PARSE_INFLIGHT_PER_WORKER
+    # (不用 fork: 主进程里已有 torch / gRPC 等线程, fork 出的子进程可能卡在它们持有的锁上)
+    mp_context = multiprocessing.get_context(config.INGEST_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=(_config_snapshot(),)) as executor:
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(executor.submit(_run_task, task))
+                if len(pending) >= max_inflight:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # (下游提前退出时取消还没开始的任务)
+            for future in pending:
+                future.cancel()
+
+def iter_files(file_list: List[Tuple[str, str]],
+               workers: Optional[int] = None) -> Iterator[Tuple[str, str, List[Document], List[Dict]]]:
+    """
+    流式处理文件列表 [(绝对路径, 相对路径)], 每处理完一个文件产出一次:
+    (绝对路径, 相对路径, 文本块, 图片信息)。
+    大 PDF 的多个页段任务按顺序合并成一个文件的结果; 产出顺序与 file_list 一致。
+    """
+    os.makedirs(config.OUTPUT_IMAGE_PATH, exist_ok=True)
+
+    tasks = _build_tasks(file_list, config.PDF_PAGES_PER_TASK)
+    workers = min(_resolve_workers(workers), max(len(tasks), 1))
+    print(f"  > 共 {len(tasks)} 个任务, 使用 {workers} 个进程")
+
+    current, text_docs, image_infos = None, [], []
+    results = _iter_task_results(tasks, workers)
+    for task, (task_docs, task_images) in tqdm(zip(tasks, results), total=len(tasks), desc="  > 处理文件"):
+        file_key = (task[1], task[2])
+        if current is not None and file_key != current:
+            yield current[0], current[1], text_docs, image_infos
+            text_docs, image_infos = [], []
+        current = file_key
+        text_docs.extend(task_docs)
+        image_infos.extend(task_images)
+    if current is not None:
+        yield current[0], current[1], text_docs, image_infos
+
+def process_files(file_list: List[Tuple[str, str]],
+                  workers: Optional[int] = None) -> Tuple[List[Document], List[Dict]]:
+    """
+    处理给定的文件列表 [(绝对路径, 相对路径)], 一次性返回全部文本块和图片信息。
+    workers: 进程数, 默认读取 config.INGEST_WORKERS; 1 表示单进程顺序处理。
+    文件和大 PDF 的页段分发到进程池, 结果按任务顺序合并, 与单进程输出完全一致。
+    (入库走 ingest_pipeline 的流式管线; 这里用于需要完整列表的场景)
+    """
+    all_text_docs: List[Document] = []
+    all_image_infos: List[Dict] = []
+
+    for _, _, text_docs, image_infos in iter_files(file_list, workers):
+        all_text_docs.extend(text_docs)
+        all_image_infos.extend(image_infos)
+
     print(f"--- 所有文件处理完毕 ---")
     print(f"  > 共提取 {len(all_text_docs)} 个文本块")
     print(f"  > 共提取 {len(all_image_infos)} 张图片")
-    
-    return all_text_docs, all_image_infos
\ No newline at end of file
+
+    return all_text_docs, all_image_infos
+
+# --- (重大升级) 主函数 ---
+def process_all_files(workers: Optional[int] = None) -> Tuple[List[Document], List[Dict]]:
+    """
+    (主函数 V5 - 多进程版)
+    递归加载 data/ 目录下的所有文件 (PDF, DOCX, PPTX)，
+    并返回文本块和图片信息。
+    """
+    data_dir = config.DATA_DIR
+    print(f"--- (V5 多进程版) 开始从 {data_dir} 加载所有文件 ---")
+
+    if not os.path.exists(data_dir):
+        print(f"错误: 知识库目录 {data_dir} 不存在。")
+        return [], []
+
+    return process_files(list_data_files(data_dir), workers)
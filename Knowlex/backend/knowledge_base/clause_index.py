@@ -0,0 +1,149 @@
+# backend/knowledge_base/clause_index.py
+# (V1 - 条文编号索引)
+#
+# 内存索引: (文件名, 条文编号) → 该条的文本块, 条文编号 → [文件名]。
+# 问题里直接写了条文编号 (如 "第3.2.1条") 时查表即可, 不用走 Milvus 向量检索和 Reranker。
+# 启动时从 Milvus 文本集合加载, 入库完成后重新加载。
+
+import re
+from collections import defaultdict
+from typing import Dict, List, Tuple, Iterable
+
+from pymilvus import MilvusClient
+
+# 导入你的配置
+from utils import config
+
+LOAD_BATCH_SIZE = 1000
+
+# 问题中的条文编号: 三/四级编号 (3.2.1), 或带 "第...条/节" 的二级编号 (第3.2条)
+_QUERY_CLAUSE_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9.])((?:[1-9]\d?|[A-Z])\.\d{1,3}(?:\.\d{1,3}){1,2})(?![\d.])"
+    r"|第\s*((?:[1-9]\d?|[A-Z])\.\d{1,3})\s*[条节]"
+)
+# 问题中的标准编号, 如 "GB 50223-2008", "JGJ/T 3"
+_QUERY_CODE_PATTERN = re.compile(r"([A-Za-z]{2,4})\s*(/\s*T)?\s*(\d{2,6})")
+
+
+def extract_clause_ids(query: str) -> List[str]:
+    """找出问题中引用的条文编号 (去重, 保持出现顺序)"""
+    clause_ids = []
+    for m in _QUERY_CLAUSE_PATTERN.finditer(query):
+        clause_id = m.group(1) or m.group(2)
+        if clause_id not in clause_ids:
+            clause_ids.append(clause_id)
+    return clause_ids
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[\s\-_/—·.]", "", text).upper()
+
+def _doc_title(doc_name: str) -> str:
+    """
+    标准名称: 文件名去掉目录、扩展名、书名号和标准编号,
+    如 "《建筑灭火器配置验收及检查规范》GB50444-2008.pdf" → "建筑灭火器配置验收及检查规范"
+    """
+    name = re.split(r"[\\/]", doc_name)[-1].rsplit(".", 1)[0]
+    name = re.sub(r"[A-Za-z]{2,4}[\s/T]*\d[\d.\-—]*", "", name)
+    return name.strip(" 《》-_—")
+
+def _mentions_doc(query: str, doc_name: str) -> bool:
+    """问题里是否点名了这个文件 (标准编号或标准名称)"""
+    norm_name = _normalize(doc_name)
+    for prefix, recommended, number in _QUERY_CODE_PATTERN.findall(query):
+        if (prefix + ("T" if recommended else "") + number).upper() in norm_name:
+            return True
+    title = _doc_title(doc_name)
+    return len(title) >= 4 and title in query
+
+
+class ClauseIndex:
+    """
+    条文编号索引。
+    两张表 ((文件名, 条文编号) → 文本块, 条文编号 → [文件名]) 和文件名列表放在一个元组里,
+    重新加载时整体替换, 查询线程不需要加锁, 也不会看到加载了一半的索引。
+    """
+
+    def __init__(self):
+        self._tables: Tuple[Dict[Tuple[str, str], List[Dict]], Dict[str, List[str]], List[str]] = ({}, {}, [])
+
+    def __len__(self) -> int:
+        return len(self._tables[0])
+
+    def build(self, records: Iterable[Dict]):
+        """
+        用文本块记录重建索引, 记录格式 {"pk", "content", "doc_name", "page", "clause_id"}。
+        同一条被切成多块时按主键 (即写入顺序) 排列。
+        """
+        by_doc_clause = defaultdict(list)
+        for record in records:
+            if record["clause_id"]:
+                by_doc_clause[(record["doc_name"], record["clause_id"])].append(record)
+        by_clause = defaultdict(list)
+        for (doc_name, clause_id), chunks in by_doc_clause.items():
+            chunks.sort(key=lambda r: r["pk"])
+            by_clause[clause_id].append(doc_name)
+        for doc_names in by_clause.values():
+            doc_names.sort()
+        all_docs = sorted({doc_name for doc_name, _ in by_doc_clause})
+        self._tables = (dict(by_doc_clause), dict(by_clause), all_docs)
+
+    def load(self, client: MilvusClient):
+        """从 Milvus 文本集合加载所有带条文编号的文本块"""
+        iterator = client.query_iterator(
+            collection_name=config.TEXT_COLLECTION_NAME,
+            batch_size=LOAD_BATCH_SIZE,
+            filter='clause_id != ""',
+            output_fields=["pk", "chunk_text", "doc_name", "page", "clause_id"],
+        )
+        records = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                for row in batch:
+                    records.append({
+                        "pk": row["pk"],
+                        "content": row["chunk_text"],
+                        "doc_name": row["doc_name"],
+                        "page": row["page"],
+                        "clause_id": row["clause_id"],
+                    })
+        finally:
+            iterator.close()
+        self.build(records)
+        print(f"  > 条文索引: 加载 {len(self)} 条条文 ({len(records)} 个文本块)")
+
+    def lookup(self, clause_id: str, doc_name: str = None) -> List[Dict]:
+        """按条文编号查文本块; 不指定文件时返回所有文件中的该条"""
+        by_doc_clause, by_clause, _ = self._tables
+        if doc_name is not None:
+            return list(by_doc_clause.get((doc_name, clause_id), []))
+        chunks = []
+        for name in by_clause.get(clause_id, []):
+            chunks.extend(by_doc_clause[(name, clause_id)])
+        return chunks
+
+    def doc_names(self, clause_id: str) -> List[str]:
+        """含有该条文编号的文件"""
+        return list(self._tables[1].get(clause_id, []))
+
+    def match_query(self, query: str) -> List[Tuple[str, List[Dict]]]:
+        """
+        解析问题中的条文编号并查表, 返回 [(文件名, 该条的文本块)]。
+        问题点名了标准 (编号或名称) 时只查该标准, 该标准里没有这一条就不返回 (交给向量检索);
+        没有点名时返回所有含此编号的文件, 由调用方决定如何取舍。
+        """
+        clause_ids = extract_clause_ids(query)
+        if not clause_ids:
+            return []
+        by_doc_clause, by_clause, all_docs = self._tables
+        named = {name for name in all_docs if _mentions_doc(query, name)}
+        matches = []
+        for clause_id in clause_ids:
+            doc_names = by_clause.get(clause_id, [])
+            if named:
+                doc_names = [name for name in doc_names if name in named]
+            for name in doc_names:
+                matches.append((name, list(by_doc_clause[(name, clause_id)])))
+        return matches
@@ -0,0 +1,122 @@
+# backend/knowledge_base/embedding_cache.py
+# (V1 - 本地向量缓存)
+#
+# 按 (模型名, 维度, 内容哈希) 缓存嵌入向量, 重建集合 / 换索引 / 容器数据丢失后重新入库时
+# 不用再跑 m3e 和 CLIP, 直接从磁盘读向量。
+# 每个 (模型, 维度) 两个文件:
+#   {模型}_{维度}.f32   float32 矩阵 (memmap), 一行一个向量
+#   {模型}_{维度}.keys  一行一个内容哈希, 行号就是矩阵的行号 (只追加)
+
+import os
+import re
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 导入你的配置
+from utils import config
+
+_GROW_ROWS = 4096  # 矩阵文件每次至少扩容的行数
+
+
+def content_hash(text: str) -> str:
+    """文本块的内容哈希"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """单个 (模型, 维度) 的向量缓存, 线程安全"""
+
+    def __init__(self, model_name: str, dim: int, cache_dir: str = None):
+        cache_dir = cache_dir or config.EMBEDDING_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, f"{re.sub(r'[^0-9A-Za-z._-]', '_', model_name)}_{dim}")
+        self.dim = dim
+        self.matrix_path = base + ".f32"
+        self.keys_path = base + ".keys"
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._count = 0
+        self._capacity = 0
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.matrix_path):
+            open(self.matrix_path, "wb").close()
+        self._capacity = os.path.getsize(self.matrix_path) // (self.dim * 4)
+        if self._capacity:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                     shape=(self._capacity, self.dim))
+
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                # (最后一行没写完就崩溃的话没有换行符, 丢掉)
+                keys = [line.decode("utf-8") for line in f.read().split(b"\n")[:-1]]
+            # (先写向量再写键, 正常情况下键的行数不会超过向量行数; 矩阵文件被截断时多出的键作废)
+            keys = keys[:self._capacity]
+            # 截掉作废的部分, 之后追加的键才能和矩阵的行号对齐
+            valid_bytes = sum(len(key.encode("utf-8")) + 1 for key in keys)
+            if os.path.getsize(self.keys_path) > valid_bytes:
+                with open(self.keys_path, "r+b") as f:
+                    f.truncate(valid_bytes)
+        self._index = {key: row for row, key in enumerate(keys)}
+        self._count = len(keys)
+
+    def _ensure_capacity(self, extra: int):
+        if self._count + extra <= self._capacity:
+            return
+        new_capacity = max(self._count + extra, self._capacity * 2, _GROW_ROWS)
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self.matrix_path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._capacity = new_capacity
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                                 shape=(self._capacity, self.dim))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """按键取向量, 未命中的位置是 None"""
+        with self._lock:
+            rows = [self._index.get(key) for key in keys]
+            return [None if row is None else self._matrix[row].tolist() for row in rows]
+
+    def put_many(self, keys: List[str], vectors: List[List[float]]):
+        """写入新向量 (已存在的键跳过)"""
+        with self._lock:
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._index and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            self._ensure_capacity(len(new))
+            start = self._count
+            self._matrix[start:start + len(new)] = np.asarray(list(new.values()), dtype=np.float32)
+            self._matrix.flush()
+            with open(self.keys_path, "a", encoding="utf-8") as f:
+                f.write("".join(key + "\n" for key in new))
+            for offset, key in enumerate(new):
+                self._index[key] = start + offset
+            self._count += len(new)
+
+
+_caches: Dict[tuple, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(model_name: str, dim: int) -> Optional[EmbeddingCache]:
+    """取 (模型, 维度) 对应的缓存; 配置关闭缓存时返回 None"""
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _caches_lock:
+        key = (model_name, dim)
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(model_name, dim)
+        return _caches[key]
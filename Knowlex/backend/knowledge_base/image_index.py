@@ -0,0 +1,74 @@
+# backend/knowledge_base/image_index.py
+# (V1 - 页面图片索引)
+#
+# 内存索引: (文件名, 页码) → 该页的图片记录。
+# 检索结果的 Top-3 文本块所在页的插图直接查表, 不用每个请求都对图片集合做一次过滤查询。
+# 启动时从 Milvus 图片集合加载, 入库完成后重新加载。
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from pymilvus import MilvusClient
+
+# 导入你的配置
+from utils import config
+from backend.knowledge_base import image_store
+
+LOAD_BATCH_SIZE = 1000
+
+
+class PageImageIndex:
+    """
+    页面图片索引。表整体替换 (不原地修改), 查询线程不需要加锁, 也不会看到加载了一半的索引。
+    """
+
+    def __init__(self):
+        self._table: Dict[Tuple[str, int], List[Dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def build(self, records: Iterable[Dict]):
+        """用图片记录 {"pk", "image_path", "refs"} 重建索引, 每个出现位置 (refs) 各记一次"""
+        table = defaultdict(list)
+        for record in records:
+            for ref in record["refs"]:
+                table[image_store.parse_image_ref(ref)].append(record)
+        self._table = dict(table)
+
+    def load(self, client: MilvusClient):
+        """从 Milvus 图片集合加载所有图片的 主键 / 路径 / 出现位置 (不含向量)"""
+        iterator = client.query_iterator(
+            collection_name=config.IMAGE_COLLECTION_NAME,
+            batch_size=LOAD_BATCH_SIZE,
+            output_fields=["pk", "image_path", "refs"],
+        )
+        records = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                records.extend({"pk": row["pk"], "image_path": row["image_path"], "refs": row["refs"]}
+                               for row in batch)
+        finally:
+            iterator.close()
+        self.build(records)
+        print(f"  > 页面图片索引: {len(records)} 张图片, 分布在 {len(self)} 页")
+
+    def lookup(self, pages: Iterable[Tuple[str, int]], limit: int = 10) -> List[Tuple[Dict, str, int]]:
+        """
+        按页查图片, 返回 [(图片记录, 文件名, 页码)], 按 pages 的顺序排列。
+        同一张图出现在多个查询页时只返回第一处; 最多 limit 张。
+        """
+        table = self._table
+        results, seen = [], set()
+        for doc_name, page in pages:
+            for record in table.get((doc_name, page), ()):
+                if record["pk"] in seen:
+                    continue
+                seen.add(record["pk"])
+                results.append((record, doc_name, page))
+                if len(results) >= limit:
+                    return results
+        return results
@@ -0,0 +1,206 @@
+# backend/knowledge_base/image_store.py
+# (V1 - 图片按需提取 + 磁盘 LRU 缓存)
+#
+# 懒提取模式 (config.IMAGE_LAZY_EXTRACT) 下, 入库时不把 PDF 里的图片写到磁盘,
+# 图片行的 image_path 只记录引用 "{PDF 路径}::xref={xref}"。
+# 检索结果真正要返回某张图时才从 PDF 里提取, 落到大小有上限的 LRU 磁盘缓存 (config.IMAGE_CACHE_DIR)。
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+
+# 导入你的配置
+from utils import config
+
+_REF_SEP = "::xref="
+_OPEN_PDFS_PER_THREAD = 8  # 每个线程最多保持打开的 PDF 数
+
+
+def make_pdf_ref(file_path: str, xref: int) -> str:
+    """PDF 内图片的引用 (存入图片行的 image_path 字段)"""
+    return f"{file_path}{_REF_SEP}{xref}"
+
+def is_pdf_ref(image_path: str) -> bool:
+    return _REF_SEP in image_path
+
+def parse_pdf_ref(image_path: str) -> Tuple[str, int]:
+    file_path, xref = image_path.rsplit(_REF_SEP, 1)
+    return file_path, int(xref)
+
+def image_ref_key(doc_name: str, page: int) -> str:
+    """图片出现位置 (doc_name, page) 在图片行 refs 字段里的写法"""
+    return f"{doc_name}#{page}"
+
+def parse_image_ref(ref: str) -> Tuple[str, int]:
+    doc_name, page = ref.rsplit("#", 1)
+    return doc_name, int(page)
+
+# --- 从 PDF 提取 ---
+
+_local = threading.local()
+
+def _open_pdf(file_path: str):
+    """
+    每个线程缓存最近打开的几个 PDF (fitz 文档不能跨线程共用),
+    同一个 PDF 的多张图片只打开一次。
+    """
+    docs = getattr(_local, "docs", None)
+    if docs is None:
+        docs = _local.docs = OrderedDict()
+    # (按 mtime 区分, 文件被替换后不会从旧的已打开文档里取图)
+    key = (file_path, os.stat(file_path).st_mtime_ns)
+    if key in docs:
+        docs.move_to_end(key)
+        return docs[key]
+    doc = fitz.open(file_path)
+    docs[key] = doc
+    if len(docs) > _OPEN_PDFS_PER_THREAD:
+        docs.popitem(last=False)[1].close()
+    return doc
+
+def extract_image(image_ref: str) -> Tuple[bytes, str]:
+    """按引用从 PDF 提取图片, 返回 (字节, 扩展名)"""
+    file_path, xref = parse_pdf_ref(image_ref)
+    base_image = _open_pdf(file_path).extract_image(xref)
+    if not base_image:
+        raise ValueError(f"PDF 中没有图片 xref={xref}: {file_path}")
+    return base_image["image"], base_image["ext"]
+
+def open_image(image_path: str) -> Union[str, io.BytesIO]:
+    """返回可以交给 Image.open 的对象: 普通文件返回路径, 引用返回内存中的字节"""
+    if not is_pdf_ref(image_path):
+        return image_path
+    return io.BytesIO(extract_image(image_path)[0])
+
+def find_pdf_ref(file_path: str, page: int, image_hash: str, matches) -> Optional[str]:
+    """
+    在 PDF 第 page 页 (从 1 开始) 里找属于去重键 image_hash 的图片, 返回它的引用。
+    matches(图片字节, image_hash) 判断是否属于 (感知哈希键允许少量位不同)。
+    """
+    with fitz.open(file_path) as doc:
+        if not 1 <= page <= len(doc):
+            return None
+        for img in doc.load_page(page - 1).get_images(full=True):
+            base_image = doc.extract_image(img[0])
+            if base_image and matches(base_image["image"], image_hash):
+                return make_pdf_ref(file_path, img[0])
+    return None
+
+# --- 磁盘 LRU 缓存 ---
+
+class ImageCache:
+    """
+    按图片哈希缓存提取出的图片文件, 总大小超过 max_bytes 时删除最久未用的文件。
+    访问顺序用文件 mtime 记录, 重启后从目录恢复。线程安全。
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or config.IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # 哈希 -> (路径, 大小), 最久未用在前
+        self._total = 0
+        self.hits = self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name.rsplit(".", 1)[0], path, stat.st_size))
+        for _, image_hash, path, size in sorted(entries):
+            self._files[image_hash] = (path, size)
+            self._total += size
+
+    def get(self, image_hash: str) -> Optional[str]:
+        with self._lock:
+            entry = self._files.get(image_hash)
+            if entry is None or not os.path.exists(entry[0]):
+                self.misses += 1
+                return None
+            self._files.move_to_end(image_hash)
+            self.hits += 1
+        try:
+            os.utime(entry[0])
+        except OSError:
+            pass  # (刚好被其他线程淘汰, 由 resolve_image 重新提取)
+        return entry[0]
+
+    def put(self, image_hash: str, image_bytes: bytes, ext: str) -> str:
+        path = os.path.join(self.cache_dir, f"{image_hash}.{ext}")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._files.pop(image_hash, None)
+            if old:
+                self._total -= old[1]
+            self._files[image_hash] = (path, len(image_bytes))
+            self._total += len(image_bytes)
+            evicted = self._evict()
+        for old_path in evicted:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        return path
+
+    def _evict(self) -> List[str]:
+        """超出上限时弹出最久未用的条目 (至少保留刚写入的那个), 返回要删除的文件"""
+        evicted = []
+        while self._total > self.max_bytes and len(self._files) > 1:
+            _, (path, size) = self._files.popitem(last=False)
+            self._total -= size
+            evicted.append(path)
+        return evicted
+
+    def discard(self, image_hash: str):
+        with self._lock:
+            entry = self._files.pop(image_hash, None)
+            if entry:
+                self._total -= entry[1]
+        if entry and os.path.exists(entry[0]):
+            os.remove(entry[0])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._total, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ImageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
+
+def resolve_image(image_path: str, image_hash: str) -> str:
+    """
+    返回图片在磁盘上的路径 (检索结果里返回给调用方的路径)。
+    普通文件原样返回; 引用先查缓存, 未命中时从 PDF 提取并写入缓存。
+    """
+    if not is_pdf_ref(image_path):
+        return image_path
+    cache = get_cache()
+    path = cache.get(image_hash)
+    if path is None or not os.path.exists(path):
+        image_bytes, ext = extract_image(image_path)
+        path = cache.put(image_hash, image_bytes, ext)
+    return path
+
+def discard_image(image_path: str, image_hash: str):
+    """图片行被删除时清理它的文件: 普通文件直接删除, 引用只清掉缓存 (不能动原 PDF)"""
+    if is_pdf_ref(image_path):
+        get_cache().discard(image_hash)
+    elif os.path.exists(image_path):
+        os.remove(image_path)
@@ -0,0 +1,131 @@
+# backend/knowledge_base/keyword_index.py
+# (V1 - 关键词倒排索引 + BM25)
+#
+# 向量召回对 "后浇带"、"穿墙管"、"HRB400" 这类精确术语不敏感。
+# 这里对文本块建字符级倒排索引: 中文按二元组 (bigram) 切分, 字母数字串 (C30, GB50444, 3.2.1) 整体作为一个词,
+# 用 BM25 打分, 结果与向量召回按 RRF (倒数排名) 融合后再交给 Reranker。
+# 启动时从 Milvus 文本集合加载, 入库完成后重新加载。
+
+import re
+import math
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from pymilvus import MilvusClient
+
+# 导入你的配置
+from utils import config
+
+LOAD_BATCH_SIZE = 1000
+
+_TOKEN_PATTERN = re.compile(r"[㐀-鿿]+|[a-z0-9]+(?:\.[0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """切词: 中文连续段切成二元组 (单字段保留单字), 字母数字串整体保留"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class KeywordIndex:
+    """
+    BM25 倒排索引。每个词的倒排表是 (文本块序号数组, BM25 词权重数组),
+    词权重在建索引时按 k1 / b 和文本块长度算好, 查询时只需按 idf 加权求和。
+    整体替换 (不原地修改), 查询线程不需要加锁。
+    """
+
+    def __init__(self):
+        self._tables: Tuple[Dict[str, Tuple[np.ndarray, np.ndarray, float]], List[Dict]] = ({}, [])
+
+    def __len__(self) -> int:
+        return len(self._tables[1])
+
+    def build(self, records: Iterable[Dict], k1: float = None, b: float = None):
+        """用文本块记录 {"pk", "content", "doc_name", "page", "clause_id"} 重建索引"""
+        k1 = config.BM25_K1 if k1 is None else k1
+        b = config.BM25_B if b is None else b
+        records = list(records)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(len(records), dtype=np.float32)
+        for i, record in enumerate(records):
+            counts = Counter(tokenize(record["content"]))
+            lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        avg_length = float(lengths.mean()) if len(records) else 1.0
+        norm = k1 * (1 - b + b * lengths / max(avg_length, 1e-6))
+
+        table = {}
+        n = len(records)
+        for term, entries in postings.items():
+            ids = np.fromiter((i for i, _ in entries), dtype=np.int32, count=len(entries))
+            tf = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            table[term] = (ids, tf * (k1 + 1) / (tf + norm[ids]), idf)
+        self._tables = (table, records)
+
+    def load(self, client: MilvusClient):
+        """从 Milvus 文本集合加载所有文本块"""
+        iterator = client.query_iterator(
+            collection_name=config.TEXT_COLLECTION_NAME,
+            batch_size=LOAD_BATCH_SIZE,
+            output_fields=["pk", "chunk_text", "doc_name", "page", "clause_id"],
+        )
+        records = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                for row in batch:
+                    records.append({
+                        "pk": row["pk"],
+                        "content": row["chunk_text"],
+                        "doc_name": row["doc_name"],
+                        "page": row["page"],
+                        "clause_id": row.get("clause_id", ""),
+                    })
+        finally:
+            iterator.close()
+        self.build(records)
+        print(f"  > 关键词索引: {len(records)} 个文本块, {len(self._tables[0])} 个词")
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, Dict]]:
+        """BM25 检索, 返回 [(分数, 文本块记录)] (分数从高到低, 只含命中至少一个词的文本块)"""
+        table, records = self._tables
+        terms = [term for term in set(tokenize(query)) if term in table]
+        if not terms or not records:
+            return []
+        scores = np.zeros(len(records), dtype=np.float32)
+        for term in terms:
+            ids, weights, idf = table[term]
+            scores[ids] += idf * weights
+        hit = np.flatnonzero(scores)
+        k = min(k, len(hit))
+        top = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), records[i]) for i in top]
+
+
+def rrf_fuse(ranked_lists: List[List], key, k: int = None) -> List:
+    """
+    倒数排名融合 (Reciprocal Rank Fusion): 每个结果得分 sum(1 / (k + 名次)),
+    key(item) 用来识别不同列表里的同一个结果 (保留第一次出现的那个)。
+    """
+    k = config.RRF_K if k is None else k
+    scores, items = defaultdict(float), {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked, start=1):
+            item_key = key(item)
+            scores[item_key] += 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    return [items[item_key] for item_key in sorted(scores, key=lambda x: scores[x], reverse=True)]
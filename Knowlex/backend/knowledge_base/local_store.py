@@ -0,0 +1,746 @@
+# backend/knowledge_base/local_store.py
+# (V1 - 进程内向量检索引擎)
+#
+# config.VECTOR_BACKEND = "local" 时代替 Milvus: 实现入库和检索用到的 MilvusClient 接口
+# (create_collection / insert / upsert / delete / get / query / query_iterator / search / flush ...),
+# 语料能放进内存的开发机、CI 和小型部署不用再起 Milvus 容器。
+#
+# 存储 (每个集合一个目录, 位于 config.LOCAL_STORE_DIR):
+#   meta.json     字段定义、度量方式、索引参数
+#   vectors.bin   向量矩阵 (float32 / float16), 只追加, 通过 np.memmap 映射
+#   rows.jsonl    标量字段的操作日志 (写入/删除), 启动时重放
+#   ivf.npz       IVF 索引 (聚类中心 + 倒排表), flush 时按需重建
+# 检索: 行数少时 NumPy 分块精确计算; 超过 LOCAL_IVF_MIN_ROWS 后用 IVF 只算 nprobe 个簇。
+# 过滤表达式支持 ==, !=, <, <=, >, >=, in, not in, and, or, not, json_contains(_any/_all)。
+
+import os
+import re
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from pymilvus import DataType
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# 导入你的配置
+from utils import config
+
+SEARCH_BLOCK_ROWS = 65536   # 精确检索时每块计算的行数 (控制 float16 转 float32 的临时内存)
+COMPACT_DEAD_RATIO = 0.3    # 已删除的行超过这个比例时, flush 会重写文件
+IVF_TRAIN_ITERS = 10        # IVF 聚类 (k-means) 迭代次数
+IVF_TRAIN_POINTS_PER_LIST = 64
+
+
+# --- 1. 过滤表达式 ---
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<num>-?\d+(?:\.\d+)?)
+      | (?P<op>==|!=|>=|<=|>|<|&&|\|\||[()\[\],])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+def _tokenize(expr: str) -> List[Tuple[str, Any]]:
+    tokens, pos = [], 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN_PATTERN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"无法解析的过滤表达式: {expr!r} (位置 {pos})")
+        pos = m.end()
+        if m.group("str") is not None:
+            tokens.append(("value", re.sub(r"\\(.)", r"\1", m.group("str")[1:-1])))
+        elif m.group("num") is not None:
+            num = m.group("num")
+            tokens.append(("value", float(num) if "." in num else int(num)))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            name = m.group("name")
+            if name.lower() in ("and", "or", "not", "in"):
+                tokens.append(("op", name.lower()))
+            elif name.lower() in ("true", "false"):
+                tokens.append(("value", name.lower() == "true"))
+            else:
+                tokens.append(("name", name))
+    return tokens
+
+_COMPARE = {
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    ">": lambda a, b: a is not None and a > b, ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b, "<=": lambda a, b: a is not None and a <= b,
+}
+_JSON_FUNCS = {
+    "json_contains": lambda values, arg: arg in values,
+    "json_contains_any": lambda values, arg: any(v in values for v in arg),
+    "json_contains_all": lambda values, arg: all(v in values for v in arg),
+}
+
+class _FilterParser:
+    """把过滤表达式编译成 row -> bool 的函数 (递归下降)"""
+
+    def __init__(self, expr: str):
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take(self, kind: str = None, value: Any = None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (value is not None and token[1] != value):
+            raise ValueError(f"过滤表达式语法错误: 期望 {value or kind}, 实际 {token[1]!r}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self) -> Callable[[Dict], bool]:
+        predicate = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"过滤表达式语法错误: 多余的 {self._peek()[1]!r}")
+        return predicate
+
+    def _or(self):
+        parts = [self._and()]
+        while self._peek() in (("op", "or"), ("op", "||")):
+            self.pos += 1
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else (lambda row: any(p(row) for p in parts))
+
+    def _and(self):
+        parts = [self._not()]
+        while self._peek() in (("op", "and"), ("op", "&&")):
+            self.pos += 1
+            parts.append(self._not())
+        return parts[0] if len(parts) == 1 else (lambda row: all(p(row) for p in parts))
+
+    def _not(self):
+        if self._peek() == ("op", "not"):
+            self.pos += 1
+            inner = self._not()
+            return lambda row: not inner(row)
+        return self._atom()
+
+    def _list(self) -> List:
+        self._take("op", "[")
+        values = []
+        while self._peek() != ("op", "]"):
+            values.append(self._take("value"))
+            if self._peek() == ("op", ","):
+                self.pos += 1
+        self._take("op", "]")
+        return values
+
+    def _atom(self):
+        if self._peek() == ("op", "("):
+            self.pos += 1
+            inner = self._or()
+            self._take("op", ")")
+            return inner
+        name = self._take("name")
+        if name.lower() in _JSON_FUNCS:
+            func = _JSON_FUNCS[name.lower()]
+            self._take("op", "(")
+            field = self._take("name")
+            self._take("op", ",")
+            arg = self._list() if self._peek() == ("op", "[") else self._take("value")
+            self._take("op", ")")
+            return lambda row: func(row.get(field) or [], arg)
+        kind, op = self._peek()
+        if op == "not":  # field not in [...]
+            self.pos += 1
+            self._take("op", "in")
+            values = set(self._list())
+            return lambda row: row.get(name) not in values
+        if op == "in":
+            self.pos += 1
+            values = set(self._list())
+            return lambda row: row.get(name) in values
+        if op not in _COMPARE:
+            raise ValueError(f"过滤表达式语法错误: {name} 后面缺少比较运算符")
+        self.pos += 1
+        value, compare = self._take("value"), _COMPARE[op]
+        return lambda row: compare(row.get(name), value)
+
+def compile_filter(expr: Optional[str]) -> Optional[Callable[[Dict], bool]]:
+    """编译过滤表达式; 空表达式返回 None (不过滤)"""
+    if not expr or not expr.strip():
+        return None
+    return _FilterParser(expr).parse()
+
+
+# --- 2. 集合 ---
+
+def _default_value(field) -> Any:
+    value = getattr(field, "default_value", None)
+    if value is None:
+        return None
+    kind = value.WhichOneof("data") if hasattr(value, "WhichOneof") else None
+    return getattr(value, kind) if kind else value
+
+def _schema_to_meta(schema) -> Dict:
+    fields = []
+    for field in schema.fields:
+        fields.append({
+            "name": field.name,
+            "type": int(field.dtype),
+            "is_primary": bool(field.is_primary),
+            "auto_id": bool(field.auto_id or (field.is_primary and getattr(schema, "auto_id", False))),
+            "dim": int(field.params["dim"]) if "dim" in (field.params or {}) else None,
+            "default": _default_value(field),
+        })
+    return {"fields": fields, "metric": "L2", "index": {"index_type": "FLAT", "params": {}},
+            "dtype": config.LOCAL_STORE_DTYPE}
+
+def _write_json(path: str, data: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class LocalCollection:
+    """
+    一个集合: 向量按 "位置" 追加存放 (upsert 写新位置并把旧位置标记为删除),
+    标量字段放在内存的 rows 列表里 (与位置一一对应, 已删除为 None)。线程安全。
+    """
+
+    def __init__(self, path: str, meta: Dict):
+        self.path = path
+        self.meta = meta
+        self.fields = meta["fields"]
+        self.pk_field = next(f["name"] for f in self.fields if f["is_primary"])
+        self.auto_id = next(f["auto_id"] for f in self.fields if f["is_primary"])
+        vector = next(f for f in self.fields if f["type"] == int(DataType.FLOAT_VECTOR))
+        self.vector_field, self.dim = vector["name"], vector["dim"]
+        self.scalar_fields = [f["name"] for f in self.fields if f["name"] != self.vector_field]
+        self.defaults = {f["name"]: f["default"] for f in self.fields if f["default"] is not None}
+        self.dtype = np.dtype(meta.get("dtype", "float32"))
+        self._lock = threading.RLock()
+        self._load()
+
+    # --- 加载 / 持久化 ---
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_path = self._file("vectors.bin")
+        stored = os.path.getsize(vector_path) // row_bytes if os.path.exists(vector_path) else 0
+        self._rows: List[Optional[Dict]] = [None] * stored
+        log_path = self._file("rows.jsonl")
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # (上次写到一半中断的最后一行)
+                    if entry["pos"] >= stored:
+                        break  # (日志比向量文件新: 向量没写完, 这一行作废)
+                    self._rows[entry["pos"]] = entry.get("row")
+        self._pk_pos = {row[self.pk_field]: pos for pos, row in enumerate(self._rows) if row is not None}
+        self._alive = np.array([row is not None for row in self._rows], dtype=bool)
+        self._next_pk = max([pk for pk in self._pk_pos if isinstance(pk, int)], default=0) + 1
+        self._map(stored)
+        self._norms = self._compute_norms()
+        self._load_ivf()
+        self._vector_file = open(vector_path, "ab")
+        self._log_file = open(log_path, "a", encoding="utf-8")
+
+    def _map(self, rows: int):
+        """把向量文件前 rows 行映射进来; 之后追加的行先放在内存的 _tail 里"""
+        self._mapped = (np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(rows, self.dim))
+                        if rows else np.empty((0, self.dim), dtype=self.dtype))
+        self._tail: List[np.ndarray] = []
+        self._tail_mat = np.empty((0, self.dim), dtype=self.dtype)
+
+    def _matrix_blocks(self, start: int = 0):
+        """按块产出 (起始位置, float32 向量块)"""
+        mapped = len(self._mapped)
+        for i in range(start, mapped, SEARCH_BLOCK_ROWS):
+            yield i, np.asarray(self._mapped[i:min(i + SEARCH_BLOCK_ROWS, mapped)], dtype=np.float32)
+        if len(self._tail_mat):
+            yield mapped, self._tail_mat.astype(np.float32, copy=False)
+
+    def _compute_norms(self) -> np.ndarray:
+        """每行向量的平方范数 (L2 距离用)"""
+        norms = [np.einsum("ij,ij->i", block, block) for _, block in self._matrix_blocks()]
+        return np.concatenate(norms) if norms else np.empty(0, dtype=np.float32)
+
+    def _vectors(self, positions: np.ndarray) -> np.ndarray:
+        """按位置取向量 (float32)"""
+        mapped = len(self._mapped)
+        if len(positions) and positions.max() < mapped:
+            return np.asarray(self._mapped[positions], dtype=np.float32)
+        out = np.empty((len(positions), self.dim), dtype=np.float32)
+        in_map = positions < mapped
+        out[in_map] = self._mapped[positions[in_map]]
+        out[~in_map] = self._tail_mat[positions[~in_map] - mapped]
+        return out
+
+    def flush(self):
+        """落盘并重新映射; 删除的行太多时压缩; 行数够多时 (重) 建 IVF 索引"""
+        with self._lock:
+            self._vector_file.flush()
+            os.fsync(self._vector_file.fileno())
+            self._log_file.flush()
+            os.fsync(self._log_file.fileno())
+            total = len(self._rows)
+            if total and (total - len(self._pk_pos)) / total > COMPACT_DEAD_RATIO:
+                self._compact()
+            elif self._tail:
+                self._map(total)
+            self._maybe_build_ivf()
+
+    def _compact(self):
+        """只保留有效行, 重写向量文件和日志 (位置重新编号, IVF 索引作废)"""
+        live = np.flatnonzero(self._alive)
+        self._vector_file.close()
+        self._log_file.close()
+        tmp_vectors, tmp_log = self._file("vectors.bin.tmp"), self._file("rows.jsonl.tmp")
+        with open(tmp_vectors, "wb") as f:
+            for i in range(0, len(live), SEARCH_BLOCK_ROWS):
+                f.write(self._vectors(live[i:i + SEARCH_BLOCK_ROWS]).astype(self.dtype).tobytes())
+        with open(tmp_log, "w", encoding="utf-8") as f:
+            for new_pos, pos in enumerate(live):
+                f.write(json.dumps({"pos": new_pos, "row": self._rows[pos]}, ensure_ascii=False) + "\n")
+        self._mapped = None  # (Windows 下替换文件前要先释放映射)
+        os.replace(tmp_vectors, self._file("vectors.bin"))
+        os.replace(tmp_log, self._file("rows.jsonl"))
+        self._remove_ivf()
+        print(f"  > (local) 压缩集合 {os.path.basename(self.path)}: {len(self._rows)} → {len(live)} 行")
+        self._load()
+
+    # --- 写入 ---
+
+    def _append(self, rows: List[Dict]):
+        vectors = np.asarray([row[self.vector_field] for row in rows], dtype=self.dtype).reshape(-1, self.dim)
+        start = len(self._rows)
+        # (先写向量再写日志: 中途中断时日志里不会有指向不存在向量的行)
+        self._vector_file.write(vectors.tobytes())
+        self._vector_file.flush()
+        self._alive = np.concatenate([self._alive, np.ones(len(rows), dtype=bool)])
+        lines = []
+        for offset, row in enumerate(rows):
+            scalars = {name: row.get(name, self.defaults.get(name)) for name in self.scalar_fields}
+            old = self._pk_pos.get(scalars[self.pk_field])
+            if old is not None:
+                self._mark_deleted(old, lines)
+            self._rows.append(scalars)
+            self._pk_pos[scalars[self.pk_field]] = start + offset
+            lines.append({"pos": start + offset, "row": scalars})
+        self._write_log(lines)
+        self._tail.append(vectors)
+        self._tail_mat = np.concatenate(self._tail) if len(self._tail) > 1 else vectors
+        vectors32 = vectors.astype(np.float32, copy=False)
+        self._norms = np.concatenate([self._norms, np.einsum("ij,ij->i", vectors32, vectors32)])
+
+    def _mark_deleted(self, pos: int, lines: List[Dict]):
+        self._rows[pos] = None
+        self._alive[pos] = False
+        lines.append({"pos": pos, "row": None})
+
+    def _write_log(self, lines: List[Dict]):
+        self._log_file.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+        self._log_file.flush()
+
+    def insert(self, data: List[Dict]) -> Dict:
+        with self._lock:
+            if self.auto_id:
+                ids = list(range(self._next_pk, self._next_pk + len(data)))
+                self._next_pk += len(data)
+                data = [dict(row, **{self.pk_field: pk}) for pk, row in zip(ids, data)]
+            else:
+                ids = [row[self.pk_field] for row in data]
+            if data:
+                self._append(data)
+        return {"insert_count": len(data), "ids": ids}
+
+    def upsert(self, data: List[Dict]) -> Dict:
+        with self._lock:
+            if data:
+                self._append(data)
+        return {"upsert_count": len(data)}
+
+    def delete(self, ids: List = None, filter: str = None) -> Dict:
+        with self._lock:
+            if ids is not None:
+                positions = [self._pk_pos[pk] for pk in ids if pk in self._pk_pos]
+            else:
+                positions = self._match(compile_filter(filter))
+            lines = []
+            for pos in positions:
+                del self._pk_pos[self._rows[pos][self.pk_field]]
+                self._mark_deleted(pos, lines)
+            self._write_log(lines)
+        return {"delete_count": len(positions)}
+
+    # --- 读取 ---
+
+    def _match(self, predicate) -> List[int]:
+        return [pos for pos, row in enumerate(self._rows)
+                if row is not None and (predicate is None or predicate(row))]
+
+    def _output(self, pos: int, output_fields: Optional[List[str]]) -> Dict:
+        row = self._rows[pos]
+        if not output_fields or output_fields == ["*"]:
+            return dict(row)
+        out = {self.pk_field: row[self.pk_field]}
+        for name in output_fields:
+            if name == self.vector_field:
+                out[name] = self._vectors(np.array([pos]))[0].tolist()
+            elif name in row:
+                out[name] = row[name]
+        return out
+
+    def get(self, ids: List, output_fields: List[str] = None) -> List[Dict]:
+        with self._lock:
+            return [self._output(self._pk_pos[pk], output_fields) for pk in ids if pk in self._pk_pos]
+
+    def query(self, filter: str = "", output_fields: List[str] = None, limit: int = None,
+              offset: int = 0) -> List[Dict]:
+        with self._lock:
+            positions = self._match(compile_filter(filter))
+            positions = positions[offset:offset + limit] if limit else positions[offset:]
+            return [self._output(pos, output_fields) for pos in positions]
+
+    def count(self) -> int:
+        return len(self._pk_pos)
+
+    # --- 检索 ---
+
+    def _scores(self, block: np.ndarray, norms: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """返回 (查询数, 行数) 的距离: L2 越小越近; IP / COSINE 越大越近"""
+        dots = queries @ block.T
+        metric = self.meta["metric"]
+        if metric == "L2":
+            return norms[None, :] - 2 * dots + np.einsum("ij,ij->i", queries, queries)[:, None]
+        if metric == "COSINE":
+            return dots / (np.sqrt(norms)[None, :] * np.linalg.norm(queries, axis=1)[:, None] + 1e-12)
+        return dots
+
+    def _top_k(self, scores: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """对一行分数取前 k (已按距离排序)"""
+        sign = 1 if self.meta["metric"] == "L2" else -1
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        part = np.argpartition(sign * scores, k - 1)[:k]
+        order = part[np.argsort(sign * scores[part], kind="stable")]
+        return positions[order], scores[order]
+
+    def _search_filtered(self, query: np.ndarray, mask: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """带过滤条件的精确检索: 只计算满足条件的行"""
+        cand = np.flatnonzero(self._alive & mask)
+        scores = self._scores(self._vectors(cand), self._norms[cand], query[None, :])[0]
+        return self._top_k(scores, cand, k)
+
+    def _search_ivf(self, query: np.ndarray, mask: Optional[np.ndarray], nprobe: int,
+                    k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """IVF 检索: 只计算最近的 nprobe 个簇, 加上建索引之后新增的行"""
+        centroids, offsets, members, upto, ivf_vectors, ivf_norms = self._ivf
+        lists = np.argsort(self._centroid_scores(centroids, query[None, :])[0])[:nprobe]
+        # (同一簇的向量在 ivf_vectors 里连续存放, 按簇切片直接计算, 不用逐行收集)
+        spans = [(offsets[l], offsets[l + 1]) for l in lists if offsets[l + 1] > offsets[l]]
+        scores = [self._scores(np.asarray(ivf_vectors[a:b], dtype=np.float32), ivf_norms[a:b], query[None, :])[0]
+                  for a, b in spans]
+        positions = [members[a:b] for a, b in spans]
+        tail = np.arange(upto, len(self._rows))
+        if len(tail):
+            scores.append(self._scores(self._vectors(tail), self._norms[tail], query[None, :])[0])
+            positions.append(tail)
+        if not scores:
+            return self._top_k(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), k)
+        scores, positions = np.concatenate(scores), np.concatenate(positions)
+        keep = self._alive[positions] if mask is None else (self._alive[positions] & mask[positions])
+        return self._top_k(scores[keep], positions[keep], k)
+
+    def search(self, data: List[List[float]], limit: int = 10, filter: str = "",
+               output_fields: List[str] = None, search_params: Dict = None) -> List[List[Dict]]:
+        queries = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = ((search_params or {}).get("params") or {}).get("nprobe", config.LOCAL_IVF_NPROBE)
+        with self._lock:
+            predicate = compile_filter(filter)
+            mask = None
+            if predicate is not None:
+                mask = np.zeros(len(self._rows), dtype=bool)
+                mask[self._match(predicate)] = True
+            if self._ivf is not None:
+                hits = [self._search_ivf(query, mask, nprobe, limit) for query in queries]
+            elif mask is not None:
+                hits = [self._search_filtered(query, mask, limit) for query in queries]
+            else:
+                hits = self._search_all(queries, limit)
+            results = []
+            for positions, scores in hits:
+                results.append([{
+                    "id": self._rows[pos][self.pk_field],
+                    "distance": float(score),
+                    "entity": {k: v for k, v in self._output(pos, output_fields).items() if k != self.pk_field},
+                } for pos, score in zip(positions, scores)])
+        return results
+
+    def _search_all(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """精确检索: 分块计算距离, 每块取前 k 后合并"""
+        best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        for start, block in self._matrix_blocks():
+            positions = np.arange(start, start + len(block))
+            alive = self._alive[positions]
+            scores = self._scores(block, self._norms[positions], queries)
+            for i in range(len(queries)):
+                merged_pos = np.concatenate([best[i][0], positions[alive]])
+                merged_scores = np.concatenate([best[i][1], scores[i][alive]])
+                best[i] = self._top_k(merged_scores, merged_pos, k)
+        return best
+
+    # --- IVF 索引 ---
+
+    def _centroid_scores(self, centroids: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """查询到各聚类中心的距离 (越小越近)"""
+        if self.meta["metric"] == "L2":
+            return (np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2 * queries @ centroids.T)
+        return -(queries @ centroids.T)
+
+    def _load_ivf(self):
+        self._ivf = None
+        path = self._file("ivf.npz")
+        if os.path.exists(path):
+            data = np.load(path)
+            members = data["members"]
+            if int(data["upto"]) <= len(self._rows):
+                ivf_vectors = (np.memmap(self._file("ivf_vectors.bin"), dtype=self.dtype, mode="r",
+                                         shape=(len(members), self.dim))
+                               if len(members) else np.empty((0, self.dim), dtype=self.dtype))
+                self._ivf = (data["centroids"], data["offsets"], members, int(data["upto"]),
+                             ivf_vectors, data["norms"])
+
+    def _remove_ivf(self):
+        self._ivf = None
+        for name in ("ivf.npz", "ivf_vectors.bin"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+    def _maybe_build_ivf(self):
+        live = len(self._pk_pos)
+        if self.meta["index"]["index_type"] == "FLAT" or live < config.LOCAL_IVF_MIN_ROWS:
+            return
+        indexed = 0 if self._ivf is None else self._ivf[3]
+        if self._ivf is not None and len(self._rows) - indexed <= config.LOCAL_IVF_REBUILD_RATIO * indexed:
+            return
+        self._build_ivf()
+
+    def _build_ivf(self):
+        """
+        k-means 聚类出 nlist 个中心, 每行归入最近的中心。
+        倒排表按 CSR 格式存放 (offsets + members), 向量按簇的顺序另存一份 (ivf_vectors.bin)。
+        """
+        live = np.flatnonzero(self._alive)
+        nlist = int(min(self.meta["index"]["params"].get("nlist", 128), max(len(live) // 39, 1)))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(live, size=min(len(live), nlist * IVF_TRAIN_POINTS_PER_LIST), replace=False)
+        sample_vectors = self._vectors(np.sort(sample))
+        centroids = sample_vectors[rng.choice(len(sample_vectors), size=nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERS):
+            assign = np.argmin(self._centroid_scores(centroids, sample_vectors), axis=1)
+            for c in range(nlist):
+                members = sample_vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        if self.meta["metric"] != "L2":
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        assign = np.empty(len(live), dtype=np.int64)
+        for i in range(0, len(live), SEARCH_BLOCK_ROWS):
+            block = self._vectors(live[i:i + SEARCH_BLOCK_ROWS])
+            assign[i:i + len(block)] = np.argmin(self._centroid_scores(centroids, block), axis=1)
+        members = live[np.argsort(assign, kind="stable")]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+
+        self._ivf = None  # (Windows 下替换文件前要先释放映射)
+        with open(self._file("ivf_vectors.tmp"), "wb") as f:
+            for i in range(0, len(members), SEARCH_BLOCK_ROWS):
+                f.write(self._vectors(members[i:i + SEARCH_BLOCK_ROWS]).astype(self.dtype).tobytes())
+        np.savez(self._file("ivf.tmp.npz"), centroids=centroids, offsets=offsets, members=members,
+                 norms=self._norms[members], upto=len(self._rows))
+        os.replace(self._file("ivf_vectors.tmp"), self._file("ivf_vectors.bin"))
+        os.replace(self._file("ivf.tmp.npz"), self._file("ivf.npz"))
+        self._load_ivf()
+        print(f"  > (local) 集合 {os.path.basename(self.path)} 建立 IVF 索引: {len(live)} 行, {nlist} 个簇")
+
+    def close(self):
+        with self._lock:
+            self._vector_file.close()
+            self._log_file.close()
+
+
+# --- 3. 客户端 (MilvusClient 接口) ---
+
+class _IndexParams(list):
+    def add_index(self, field_name: str, index_type: str = "FLAT", metric_type: str = "L2",
+                  params: Dict = None, **kwargs):
+        self.append({"field_name": field_name, "index_type": index_type,
+                     "metric_type": metric_type, "params": params or {}})
+
+class _QueryIterator:
+    def __init__(self, rows: List[Dict], batch_size: int):
+        self._rows, self._batch_size, self._pos = rows, batch_size, 0
+
+    def next(self) -> List[Dict]:
+        batch = self._rows[self._pos:self._pos + self._batch_size]
+        self._pos += len(batch)
+        return batch
+
+    def close(self):
+        self._rows = []
+
+
+class LocalVectorClient:
+    """MilvusClient 的进程内替代 (只实现本项目用到的接口)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            if name not in self._collections:
+                meta_path = os.path.join(self._dir(name), "meta.json")
+                if not os.path.exists(meta_path):
+                    raise ValueError(f"collection '{name}' does not exist")
+                with open(meta_path, encoding="utf-8") as f:
+                    self._collections[name] = LocalCollection(self._dir(name), json.load(f))
+            return self._collections[name]
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return os.path.exists(os.path.join(self._dir(collection_name), "meta.json"))
+
+    def list_collections(self, **kwargs) -> List[str]:
+        return sorted(name for name in os.listdir(self.root) if self.has_collection(name))
+
+    def create_collection(self, collection_name: str, schema=None, **kwargs):
+        if self.has_collection(collection_name):
+            return
+        os.makedirs(self._dir(collection_name), exist_ok=True)
+        _write_json(os.path.join(self._dir(collection_name), "meta.json"), _schema_to_meta(schema))
+
+    def describe_collection(self, collection_name: str, **kwargs) -> Dict:
+        """集合的字段定义 (格式与 MilvusClient.describe_collection 相同)"""
+        with open(os.path.join(self._dir(collection_name), "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        fields = [{"name": field["name"], "type": DataType(field["type"]), "is_primary": field["is_primary"],
+                   "auto_id": field["auto_id"], "params": {"dim": field["dim"]} if field["dim"] else {}}
+                  for field in meta["fields"]]
+        return {"collection_name": collection_name, "fields": fields}
+
+    def drop_collection(self, collection_name: str, **kwargs):
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        if os.path.isdir(self._dir(collection_name)):
+            for name in os.listdir(self._dir(collection_name)):
+                os.remove(os.path.join(self._dir(collection_name), name))
+            os.rmdir(self._dir(collection_name))
+
+    @staticmethod
+    def prepare_index_params(**kwargs) -> _IndexParams:
+        return _IndexParams()
+
+    def create_index(self, collection_name: str, index_params: _IndexParams, **kwargs):
+        """记录度量方式和索引类型 (FLAT = 只做精确检索; 其他类型都用 IVF)"""
+        collection = self._collection(collection_name)
+        for index in index_params:
+            if index["field_name"] == collection.vector_field:
+                with collection._lock:
+                    collection.meta["metric"] = index["metric_type"]
+                    collection.meta["index"] = {"index_type": index["index_type"], "params": index["params"]}
+                    _write_json(os.path.join(collection.path, "meta.json"), collection.meta)
+
+    def load_collection(self, collection_name: str, **kwargs):
+        self._collection(collection_name)
+
+    def release_collection(self, collection_name: str, **kwargs):
+        pass
+
+    def flush(self, collection_name: str, **kwargs):
+        self._collection(collection_name).flush()
+
+    def insert(self, collection_name: str, data: List[Dict], **kwargs) -> Dict:
+        return self._collection(collection_name).insert(data)
+
+    def upsert(self, collection_name: str, data: List[Dict], **kwargs) -> Dict:
+        return self._collection(collection_name).upsert(data)
+
+    def delete(self, collection_name: str, ids: List = None, filter: str = None, **kwargs) -> Dict:
+        return self._collection(collection_name).delete(ids=ids, filter=filter)
+
+    def get(self, collection_name: str, ids: List, output_fields: List[str] = None, **kwargs) -> List[Dict]:
+        if not isinstance(ids, list):
+            ids = [ids]
+        return self._collection(collection_name).get(ids, output_fields)
+
+    def query(self, collection_name: str, filter: str = "", output_fields: List[str] = None,
+              limit: int = None, ids: List = None, offset: int = 0, **kwargs) -> List[Dict]:
+        if ids is not None:
+            return self.get(collection_name, ids, output_fields)
+        return self._collection(collection_name).query(filter, output_fields, limit, offset)
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, filter: str = "",
+                       output_fields: List[str] = None, **kwargs) -> _QueryIterator:
+        return _QueryIterator(self.query(collection_name, filter, output_fields), batch_size)
+
+    def search(self, collection_name: str, data: List[List[float]], limit: int = 10, filter: str = "",
+               output_fields: List[str] = None, search_params: Dict = None, **kwargs) -> List[List[Dict]]:
+        return self._collection(collection_name).search(data, limit, filter, output_fields, search_params)
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> Dict:
+        return {"row_count": self._collection(collection_name).count()}
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
+
+
+_clients: Dict[str, LocalVectorClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(root: str = None) -> LocalVectorClient:
+    """同一目录在进程内只打开一次 (入库和检索共用同一份内存数据)"""
+    root = os.path.abspath(root or config.LOCAL_STORE_DIR)
+    with _clients_lock:
+        if root not in _clients:
+            _clients[root] = LocalVectorClient(root)
+        return _clients[root]
+
+
+# --- 4. 检索器 (代替 LangChain Milvus 检索器) ---
+
+class LocalTextRetriever(BaseRetriever):
+    """在本地文本集合里检索 k 个最近的文本块, 返回的 Document 与 LangChain Milvus 检索器一致"""
+
+    client: Any
+    embeddings: Any
+    collection_name: str
+    text_field: str = "chunk_text"
+    k: int = 10
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        hits = self.client.search(self.collection_name, [self.embeddings.embed_query(query)], limit=self.k)[0]
+        docs = []
+        for hit in hits:
+            metadata = dict(hit["entity"], pk=hit["id"])
+            docs.append(Document(page_content=metadata.pop(self.text_field, ""), metadata=metadata))
+        return docs
+
+    def get_relevant_documents(self, query: str, **kwargs) -> List[Document]:
+        return self.invoke(query, **kwargs)
@@ -1 +1,168 @@
-#AI说暂时不需要
\ No newline at end of file
+# backend/knowledge_base/mate_store.py
+# (V1 - 增量入库清单)
+#
+# 记录 data/ 下每个文件的 内容哈希 / mtime / 大小 以及它在 Milvus 中对应的主键,
+# 入库时只处理 新增/修改 的文件, 并删除已移除文件的数据行。
+
+import os
+import json
+import hashlib
+from typing import Dict, List, Tuple
+
+# 导入你的配置
+from utils import config
+
+MANIFEST_VERSION = 1
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """流式计算文件内容的 SHA-256 (大文件不会一次读入内存)"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def file_state(file_path: str) -> Dict:
+    """
+    文件的 内容哈希 / mtime / 大小, 在解析之前记录。
+    (先 stat 再算哈希: 之后文件再被改写, mtime 就和清单对不上, 下次 diff 会重新比对哈希并重新入库)
+    """
+    stat = os.stat(file_path)
+    return {"sha256": file_sha256(file_path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+class ManifestStore:
+    """
+    文件清单: {相对路径: {"sha256", "mtime", "size", "text_pks", "image_pks"}}
+    (text_pks 是文本行的自增主键; image_pks 是该文件引用的图片哈希, 图片行可被多个文件共享)
+    以 JSON 存在 config.MANIFEST_PATH, 写入时先写临时文件再替换, 中途崩溃不会写坏。
+
+    正在入库的文件是 "partial": True 的条目, 每写入一批就把主键追加到日志文件 (清单路径 + ".journal"),
+    不用每批重写整个清单; 加载时在清单上重放日志, save() 之后清空日志。
+    中途失败的文件因此也有主键记录, 被删除或修改时能清掉已写入的行。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.MANIFEST_PATH
+        self.journal_path = self.path + ".journal"
+        self.files: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self):
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break  # (最后一行可能只写了一半)
+                    self._apply(op)
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        # (日志里的操作都已在清单里; 替换后、删除前崩溃也没关系, 重放结果相同)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _apply(self, op: Dict):
+        name = op["file"]
+        if op["op"] == "begin":
+            self.files[name] = dict(op["state"], text_pks=[], image_pks=[], partial=True)
+        elif op["op"] == "add":
+            entry = self.files[name]
+            known = set(entry["image_pks"])
+            entry["text_pks"].extend(op["text_pks"])
+            entry["image_pks"].extend(h for h in op["image_pks"] if h not in known)
+        elif op["op"] == "finish":
+            self.files[name].pop("partial", None)
+        elif op["op"] == "set":
+            self.files[name] = op["entry"]
+        elif op["op"] == "remove":
+            self.files.pop(name, None)
+
+    def _log(self, op: Dict):
+        """应用一条操作并追加到日志 (fsync 后才返回)"""
+        self._apply(op)
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get(self, relative_filename: str) -> Dict:
+        return self.files.get(relative_filename)
+
+    def diff(self, file_list: List[Tuple[str, str]]) -> Tuple[List, List, List[str], List]:
+        """
+        对比清单与当前文件列表 [(绝对路径, 相对路径)]。
+        返回 (新增文件, 修改文件, 已删除的相对路径, 待续传文件)。
+        mtime 和大小都没变的文件直接视为未修改, 不重新计算哈希;
+        只是 mtime 变了但内容哈希相同的文件 (如被重新拷贝) 只更新 mtime。
+        上次没入库完的文件 (partial): 内容没变的从断点续传, 变了的按修改处理 (清掉已写入的行后重新入库)。
+        """
+        added, changed, resumed = [], [], []
+        seen = set()
+        for file_path, relative_filename in file_list:
+            seen.add(relative_filename)
+            entry = self.files.get(relative_filename)
+            if entry is None:
+                added.append((file_path, relative_filename))
+                continue
+
+            stat = os.stat(file_path)
+            if entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                if file_sha256(file_path) != entry["sha256"]:
+                    changed.append((file_path, relative_filename))
+                    continue
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            if entry.get("partial"):
+                resumed.append((file_path, relative_filename))
+
+        removed = [name for name in self.files if name not in seen]
+        return added, changed, removed, resumed
+
+    def set_file(self, relative_filename: str, state: Dict,
+                 text_pks: List[int], image_pks: List[str]):
+        """记录一个入库完成的文件; state 是解析前 file_state 的结果 (不在这里重新读文件)"""
+        self._log({"op": "set", "file": relative_filename, "entry": {
+            "sha256": state["sha256"],
+            "mtime": state["mtime"],
+            "size": state["size"],
+            "text_pks": list(text_pks),
+            "image_pks": list(image_pks),
+        }})
+
+    def begin_file(self, relative_filename: str, state: Dict):
+        """开始入库一个文件: 在写入它的第一行之前记一个 partial 条目"""
+        self._log({"op": "begin", "file": relative_filename, "state": state})
+
+    def add_pks(self, relative_filename: str, text_pks: List[int] = (), image_pks: List[str] = ()):
+        """记下 partial 条目新写入的一批主键"""
+        self._log({"op": "add", "file": relative_filename,
+                   "text_pks": list(text_pks), "image_pks": list(image_pks)})
+
+    def finish_file(self, relative_filename: str):
+        """文件的行全部写入, partial 条目转为正式条目"""
+        self._log({"op": "finish", "file": relative_filename})
+
+    def remove_file(self, relative_filename: str) -> Dict:
+        entry = self.files.get(relative_filename)
+        if entry is not None:
+            self._log({"op": "remove", "file": relative_filename})
+        return entry
+
+    def fingerprint(self) -> str:
+        """整个知识库的指纹 (所有文件的 相对路径 + 内容哈希), 任何文件增删改都会改变"""
+        h = hashlib.sha256()
+        for name in sorted(self.files):
+            h.update(f"{name}\0{self.files[name]['sha256']}\n".encode("utf-8"))
+        return h.hexdigest()
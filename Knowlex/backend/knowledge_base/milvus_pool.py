@@ -0,0 +1,187 @@
+# backend/knowledge_base/milvus_pool.py
+# (V1 - 进程内共享的 Milvus 连接池)
+#
+# 入库、检索、索引加载都通过 vector_store.get_client() 拿到同一个 MilvusPool:
+#   - MILVUS_POOL_SIZE 个独立的 gRPC 通道 (MilvusClient(dedicated=True)), 轮流使用, 第一次用到时才连接;
+#   - 每次调用都带超时 (MILVUS_TIMEOUT, flush / 建索引等慢操作用 MILVUS_SLOW_TIMEOUT), 不会无限等待;
+#   - 连接类错误 (Milvus 重启、网络中断、超时) 时丢弃该通道, 按指数退避重连并重试, 最多 MILVUS_RETRIES 次。
+#     insert 不重试 (不是幂等的, 超时后重试可能写入重复行; 入库失败时重新运行即可:
+#     没入库完的文件从清单记下的最后一批之后续传, 之后写入的行先删掉, 见 ingest_pipeline.py)。
+#   - health() 用短超时探测 Milvus 是否可用、集合是否存在 (GET /api/health, /api/ready)。
+# Milvus 重启后, 下一次调用会自动重连, 不需要重新部署 API。
+
+import time
+import threading
+from itertools import count
+from typing import Dict, List
+
+import grpc
+from pymilvus import MilvusClient
+from pymilvus.exceptions import (
+    MilvusException, ConnectError, MilvusUnavailableException, ConnectionNotExistException,
+)
+
+# 导入你的配置
+from utils import config
+from utils import metrics
+from utils.logger import log_event
+
+# 不经过 Milvus 服务的方法 (直接转给 MilvusClient 类)
+_LOCAL_METHODS = {"prepare_index_params", "create_schema", "create_field_schema"}
+# 不能安全重试的方法
+_NO_RETRY_METHODS = {"insert"}
+# 可能耗时较长的方法 (用 MILVUS_SLOW_TIMEOUT)
+_SLOW_METHODS = {"flush", "create_index", "load_collection", "create_collection", "compact"}
+
+_TRANSIENT_ERRORS = (ConnectError, MilvusUnavailableException, ConnectionNotExistException,
+                     ConnectionError, TimeoutError)
+_TRANSIENT_GRPC_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED}
+_TRANSIENT_MESSAGES = ("unavailable", "deadline", "timeout", "timed out", "connect", "channel")
+
+
+def is_transient(error: Exception) -> bool:
+    """连接类错误 (重连后可能成功) → True; 参数错误、集合不存在等 → False"""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, grpc.RpcError):
+        return error.code() in _TRANSIENT_GRPC_CODES
+    if isinstance(error, MilvusException):
+        # (pymilvus 把 gRPC 的超时/不可用包装成普通 MilvusException, 只能看错误信息)
+        message = str(error).lower()
+        return any(word in message for word in _TRANSIENT_MESSAGES)
+    return False
+
+
+class MilvusPool:
+    """
+    MilvusClient 接口的连接池 (client.search(...) 等写法不变)。
+    每个方法调用: 取一个通道 → 带超时调用 → 连接类错误时换新通道重试。
+    """
+
+    def __init__(self, uri: str = None, size: int = None, timeout: float = None,
+                 retries: int = None, backoff: float = None):
+        self.uri = uri or config.MILVUS_URI
+        self.size = max(1, size or config.MILVUS_POOL_SIZE)
+        self.timeout = timeout or config.MILVUS_TIMEOUT
+        self.retries = config.MILVUS_RETRIES if retries is None else retries
+        self.backoff = config.MILVUS_RETRY_BACKOFF if backoff is None else backoff
+        self._slots: List[MilvusClient] = [None] * self.size
+        self._lock = threading.Lock()
+        # (每个通道一把连接锁: 连接在 self._lock 之外进行, 一个通道连接很慢时不挡住其他通道)
+        self._connect_locks = [threading.Lock() for _ in range(self.size)]
+        self._next = count()
+
+    def _connect(self) -> MilvusClient:
+        # (dedicated: 每个通道单独一条 gRPC 连接, 不与其他 MilvusClient 共用)
+        return MilvusClient(uri=self.uri, timeout=self.timeout, dedicated=True)
+
+    def _acquire(self):
+        """
+        轮流取一个通道, 没连接的先连接 (同一通道同时只有一个线程在连接)。
+        轮到的通道正被其他线程连接时, 先借用一个已连好的通道, 不跟着等。
+        """
+        slot = next(self._next) % self.size
+        with self._lock:
+            client = self._slots[slot]
+            if client is None and self._connect_locks[slot].locked():
+                ready = [(i, c) for i, c in enumerate(self._slots) if c is not None]
+                if ready:
+                    return ready[slot % len(ready)]
+        if client is not None:
+            return slot, client
+        with self._connect_locks[slot]:
+            with self._lock:
+                client = self._slots[slot]
+            if client is None:
+                client = self._connect()
+                with self._lock:
+                    self._slots[slot] = client
+        return slot, client
+
+    def _discard(self, slot: int, client: MilvusClient):
+        """丢弃出错的通道, 下次用到时重新连接"""
+        with self._lock:
+            if self._slots[slot] is not client:
+                return
+            self._slots[slot] = None
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def call(self, method: str, *args, **kwargs):
+        """带超时和重试地调用 MilvusClient 的方法"""
+        kwargs.setdefault("timeout", config.MILVUS_SLOW_TIMEOUT if method in _SLOW_METHODS else self.timeout)
+        attempts = 1 if method in _NO_RETRY_METHODS else 1 + self.retries
+        for attempt in range(attempts):
+            slot, client = None, None
+            try:
+                slot, client = self._acquire()
+                return getattr(client, method)(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                if client is not None:
+                    self._discard(slot, client)
+                if attempt == attempts - 1:
+                    metrics.ERRORS.labels("milvus").inc()
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                metrics.MILVUS_RETRIES.labels(method).inc()
+                log_event("milvus_retry", level="warning", method=method, attempt=attempt + 1,
+                          delay=delay, error=repr(e))
+                time.sleep(delay)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in _LOCAL_METHODS:
+            return getattr(MilvusClient, name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def health(self, collection_names: List[str] = ()) -> Dict:
+        """
+        健康检查 (不重试, 用 MILVUS_HEALTH_TIMEOUT): 能否连通 Milvus, 各集合是否存在。
+        连不上时丢弃该通道, 下一次调用重新连接。
+        """
+        started = time.perf_counter()
+        result = {"backend": "milvus", "uri": self.uri, "ok": False, "collections": {}, "error": None}
+        slot, client = None, None
+        try:
+            slot, client = self._acquire()
+            client.get_server_version(timeout=config.MILVUS_HEALTH_TIMEOUT)
+            for name in collection_names:
+                result["collections"][name] = client.has_collection(name, timeout=config.MILVUS_HEALTH_TIMEOUT)
+            result["ok"] = all(result["collections"].values())
+            if not result["ok"]:
+                result["error"] = "集合不存在"
+        except Exception as e:
+            if client is not None and is_transient(e):
+                self._discard(slot, client)
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        with self._lock:
+            result["connected_channels"] = sum(1 for client in self._slots if client is not None)
+        return result
+
+    def close(self):
+        with self._lock:
+            clients, self._slots = self._slots, [None] * self.size
+        for client in clients:
+            if client is not None:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+
+
+_pools: Dict[str, MilvusPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(uri: str = None) -> MilvusPool:
+    """同一 URI 在进程内只有一个连接池 (入库、检索、索引加载共用)"""
+    uri = uri or config.MILVUS_URI
+    with _pools_lock:
+        if uri not in _pools:
+            _pools[uri] = MilvusPool(uri)
+        return _pools[uri]
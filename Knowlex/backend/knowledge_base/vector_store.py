@@ -2,47 +2,132 @@
 # (V2 - 图文多模态版)
 
 from pymilvus import MilvusClient, FieldSchema, CollectionSchema, DataType
-from langchain_community.vectorstores import Milvus
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-from typing import List, Dict
+from langchain_core.retrievers import BaseRetriever
+from typing import Any, List, Dict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+import os
+import threading
 import torch
 from transformers import CLIPProcessor, CLIPModel
 
 # 导入你的配置
 from utils import config 
+from utils import model_registry
+from backend.knowledge_base import embedding_cache
+from backend.knowledge_base import image_store
+from backend.knowledge_base import local_store
+from backend.knowledge_base import milvus_pool
+from backend.data_process import pdf_processor
+
+# --- 0. 数据版本 ---
+# 每次写入/删除 Milvus 后加一; 检索结果缓存 (rag/query_cache.py) 按版本失效
+
+_data_version = 0
+_version_lock = threading.Lock()
+
+def bump_data_version():
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+
+def data_version() -> int:
+    return _data_version
 
 # --- 1. 嵌入模型加载 ---
 
 def get_text_embedding_model():
     """获取文本嵌入模型 (m3e-base)"""
     print("正在加载 文本嵌入模型...")
+    _set_embed_threads()
     return HuggingFaceEmbeddings(
         model_name=config.EMBEDDING_MODEL_NAME, 
-        model_kwargs={'device': 'cpu'} # 嵌入计算用 CPU
+        model_kwargs={'device': 'cpu'}, # 嵌入计算用 CPU
+        encode_kwargs={'batch_size': config.TEXT_EMBED_BATCH_SIZE}
     )
 
+def _set_embed_threads():
+    """按配置限制 torch 的 CPU 线程数 (0 = 不限制, 使用 torch 默认值)"""
+    if config.EMBED_THREADS > 0:
+        torch.set_num_threads(config.EMBED_THREADS)
+
 def get_image_embedding_models():
     """获取图片嵌入模型 (CLIP)"""
     print("正在加载 图片嵌入模型 (CLIP)...")
     device = "cuda" if torch.cuda.is_available() else "cpu"
     model = CLIPModel.from_pretrained(config.IMAGE_EMBEDDING_MODEL).to(device)
+    model.eval()
     processor = CLIPProcessor.from_pretrained(config.IMAGE_EMBEDDING_MODEL)
     return model, processor, device
 
+# (进程内共享: 入库和检索用同一份模型, 第一次用到时才加载; 见 utils/model_registry.py)
+text_embedding_model = model_registry.register("text_embedding", lambda: get_text_embedding_model())
+image_embedding_models = model_registry.register("image_embedding", lambda: get_image_embedding_models())
+
 # --- 2. Milvus 初始化 (升级版) ---
+def get_client():
+    """
+    按 config.VECTOR_BACKEND 返回向量库客户端: Milvus 连接池 (带超时/重试/重连, 见 milvus_pool.py),
+    或接口相同的进程内引擎。进程内所有模块共用同一个客户端。
+    """
+    if config.VECTOR_BACKEND == "local":
+        return local_store.get_client()
+    return milvus_pool.get_pool()
+
+def health() -> Dict:
+    """向量库健康检查: 能否连通、文本/图片集合是否存在"""
+    collection_names = [config.TEXT_COLLECTION_NAME, config.IMAGE_COLLECTION_NAME]
+    client = get_client()
+    if isinstance(client, milvus_pool.MilvusPool):
+        return client.health(collection_names)
+    collections = {name: client.has_collection(name) for name in collection_names}
+    return {"backend": "local", "ok": all(collections.values()), "collections": collections,
+            "error": None if all(collections.values()) else "集合不存在"}
+
+def _embedding_index_params(client: MilvusClient):
+    """向量字段的索引参数 (IVF_FLAT + L2)"""
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name="embedding", index_type="IVF_FLAT",
+                           metric_type="L2", params={"nlist": 128})
+    return index_params
+
+def _schema_mismatch(client, collection_name: str, schema: CollectionSchema) -> List[str]:
+    """对比已有集合与期望的 schema (字段名、类型、主键、自增、向量维度), 返回不一致之处 (空 = 一致)"""
+    description = client.describe_collection(collection_name)
+    existing = {field["name"]: field for field in description["fields"]}
+    problems = []
+    for field in schema.fields:
+        current = existing.pop(field.name, None)
+        if current is None:
+            problems.append(f"缺少字段 {field.name}")
+            continue
+        if DataType(current["type"]) != field.dtype:
+            problems.append(f"{field.name} 类型为 {DataType(current['type']).name}, 应为 {field.dtype.name}")
+        if bool(current.get("is_primary")) != bool(field.is_primary):
+            problems.append(f"{field.name} 主键设置不同")
+        elif field.is_primary and bool(current.get("auto_id", description.get("auto_id"))) != bool(field.auto_id):
+            problems.append(f"{field.name} 自增设置不同")
+        dim = (field.params or {}).get("dim")
+        if dim and int((current.get("params") or {}).get("dim", 0)) != int(dim):
+            problems.append(f"{field.name} 维度为 {current['params'].get('dim')}, 应为 {dim}")
+    problems += [f"多余字段 {name}" for name in existing]
+    return problems
+
 def initialize_milvus():
     """
     (后端启动时调用)
     检查并创建 两个 Milvus 集合 (文本 + 图片)
     """
-    print("正在连接 Milvus...")
-    client = MilvusClient(uri=config.MILVUS_URI)
+    print(f"正在连接 向量库 ({config.VECTOR_BACKEND})...")
+    client = get_client()
     
     # 1. 定义 Schema - 文本
     text_schema = CollectionSchema([
-        FieldSchema(name="pk", dtype=DataType.VARCHAR, is_primary=True, auto_id=True, max_length=100),
+        # (Milvus 的自增主键只支持 INT64)
+        FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
         FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=config.TEXT_EMBEDDING_DIM),
         FieldSchema(name="chunk_text", dtype=DataType.VARCHAR, max_length=65535),
         FieldSchema(name="doc_name", dtype=DataType.VARCHAR, max_length=500),
@@ -50,32 +135,54 @@ def initialize_milvus():
         FieldSchema(name="clause_id", dtype=DataType.VARCHAR, max_length=100, default_value=""),
     ], description="知识库 文本块")
     
-    # 2. 定义 Schema - 图片
+    # 2. 定义 Schema - 图片 (每张不同的图片一行, 主键是图片内容哈希)
     image_schema = CollectionSchema([
-        FieldSchema(name="pk", dtype=DataType.VARCHAR, is_primary=True, auto_id=True, max_length=100),
+        FieldSchema(name="pk", dtype=DataType.VARCHAR, is_primary=True, auto_id=False, max_length=64),
         FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=config.IMAGE_EMBEDDING_DIM),
         FieldSchema(name="image_path", dtype=DataType.VARCHAR, max_length=1000), # 存储图片路径
-        FieldSchema(name="doc_name", dtype=DataType.VARCHAR, max_length=500),
-        FieldSchema(name="page", dtype=DataType.INT64),
+        FieldSchema(name="doc_name", dtype=DataType.VARCHAR, max_length=500), # 首次出现的文件
+        FieldSchema(name="page", dtype=DataType.INT64),                      # 首次出现的页码
+        FieldSchema(name="refs", dtype=DataType.JSON), # 所有出现位置 ["doc_name#page", ...]
     ], description="知识库 图片")
 
-    # 3. 创建 文本集合
+    # 3. 旧版本建的集合 schema 不同 (如旧的文本主键不是自增 INT64、图片主键不是内容哈希), 写入会失败:
+    #    按配置删除重建 (清空入库清单, 下次入库全部重新导入), 或直接报错
     collection_name_text = config.TEXT_COLLECTION_NAME
+    collection_name_image = config.IMAGE_COLLECTION_NAME
+    mismatched = {}
+    for name, schema in ((collection_name_text, text_schema), (collection_name_image, image_schema)):
+        if client.has_collection(name):
+            problems = _schema_mismatch(client, name, schema)
+            if problems:
+                mismatched[name] = problems
+    if mismatched:
+        detail = "; ".join(f"{name}: {', '.join(problems)}" for name, problems in mismatched.items())
+        if not config.REBUILD_ON_SCHEMA_MISMATCH:
+            raise RuntimeError(
+                f"向量库集合的 schema 与当前版本不一致 ({detail})。"
+                f"请删除这两个集合后重新入库, 或设置 config.REBUILD_ON_SCHEMA_MISMATCH = True 自动重建。"
+            )
+        print(f"警告: 集合 schema 与当前版本不一致 ({detail}), 删除并重建文本/图片集合, 需要重新入库。")
+        # (两个集合一起重建, 否则清空清单后重新入库会在未重建的集合里写入重复行)
+        for name in (collection_name_text, collection_name_image):
+            client.drop_collection(name)
+        if os.path.exists(config.MANIFEST_PATH):
+            os.remove(config.MANIFEST_PATH)
+        bump_data_version()
+
+    # 4. 创建 文本集合
     if not client.has_collection(collection_name_text):
-        client.create_collection(collection_name_text, text_schema, consistency_level="Strong")
-        client.create_index(collection_name_text, "embedding", 
-                            {"index_type": "IVF_FLAT", "params": {"nlist": 128}, "metric_type": "L2"})
+        client.create_collection(collection_name_text, schema=text_schema, consistency_level="Strong")
+        client.create_index(collection_name_text, _embedding_index_params(client))
         print(f"创建 文本集合: {collection_name_text}")
     
-    # 4. 创建 图片集合
-    collection_name_image = config.IMAGE_COLLECTION_NAME
+    # 5. 创建 图片集合
     if not client.has_collection(collection_name_image):
-        client.create_collection(collection_name_image, image_schema, consistency_level="Strong")
-        client.create_index(collection_name_image, "embedding", 
-                            {"index_type": "IVF_FLAT", "params": {"nlist": 128}, "metric_type": "L2"})
+        client.create_collection(collection_name_image, schema=image_schema, consistency_level="Strong")
+        client.create_index(collection_name_image, _embedding_index_params(client))
         print(f"创建 图片集合: {collection_name_image}")
 
-    # 5. 加载集合到内存
+    # 6. 加载集合到内存
     client.load_collection(collection_name_text)
     client.load_collection(collection_name_image)
     print(f"Milvus 集合 '{collection_name_text}' 和 '{collection_name_image}' 加载到内存。")
@@ -83,82 +190,358 @@ def initialize_milvus():
 
 # --- 3. 数据写入功能 (升级版) ---
 
-def add_text_documents(client: MilvusClient, text_docs: List[Document]):
-    """将 LangChain 文本块 批量插入 Milvus"""
-    if not text_docs:
-        print("没有 文本块 需要插入。")
-        return
-    
-    embeddings_model = get_text_embedding_model()
-    data = []
-    print(f"准备插入 {len(text_docs)} 条 文本块...")
-    
-    for doc in text_docs:
+def _group_pks(doc_names: List[str], pks: List[int]) -> Dict[str, List[int]]:
+    """把 insert 返回的主键按 doc_name 分组 (两者顺序一一对应)"""
+    grouped = defaultdict(list)
+    for name, pk in zip(doc_names, pks):
+        grouped[name].append(pk)
+    return dict(grouped)
+
+def embed_text_rows(text_model, text_docs: List[Document]) -> List[Dict]:
+    """
+    把一批文本块编码成待写入 Milvus 的行。
+    text_model: 返回文本嵌入模型的函数 (如 text_embedding_model)。
+    先查本地向量缓存, 只有未命中的文本块才送进模型 (一次 embed_documents 调用)。
+    """
+    texts = [doc.page_content for doc in text_docs]
+    cache = embedding_cache.get_cache(config.EMBEDDING_MODEL_NAME, config.TEXT_EMBEDDING_DIM)
+    keys = [embedding_cache.content_hash(text) for text in texts]
+    embeddings = cache.get_many(keys) if cache is not None else [None] * len(texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        computed = text_model().embed_documents([texts[i] for i in missing])
+        for i, embedding in zip(missing, computed):
+            embeddings[i] = embedding
+        if cache is not None:
+            cache.put_many([keys[i] for i in missing], computed)
+
+    rows = []
+    for doc, embedding in zip(text_docs, embeddings):
         meta = doc.metadata
-        data.append({
+        rows.append({
             "chunk_text": doc.page_content,
-            "embedding": embeddings_model.embed_query(doc.page_content),
+            "embedding": embedding,
             "doc_name": meta.get("doc_name"),
             "page": meta.get("page"),
             "clause_id": meta.get("clause_id", "")
         })
-    
-    client.insert(collection_name=config.TEXT_COLLECTION_NAME, data=data)
-    print(f"{len(data)} 条 文本块 插入 Milvus 成功。")
-    client.flush([config.TEXT_COLLECTION_NAME])
+    return rows
 
-def add_image_documents(client: MilvusClient, image_infos: List[Dict]):
-    """将 图片元数据 批量插入 Milvus"""
-    if not image_infos:
-        print("没有 图片 需要插入。")
-        return
+def insert_text_rows(client: MilvusClient, rows: List[Dict]) -> Dict[str, List[int]]:
+    """写入一批文本行, 返回 {doc_name: [主键, ...]}"""
+    res = client.insert(collection_name=config.TEXT_COLLECTION_NAME, data=rows)
+    bump_data_version()
+    return _group_pks([row["doc_name"] for row in rows], res["ids"])
 
-    model, processor, device = get_image_embedding_models()
-    data = []
-    print(f"准备插入 {len(image_infos)} 张 图片...")
+def _load_image(image_path: str) -> Image.Image:
+    """
+    解码图片 (在线程池中运行)。
+    大图先缩小到短边 IMAGE_DECODE_SIZE (CLIP 预处理本来就会缩到 224), 减少后续预处理开销。
+    懒提取的图片 (PDF 引用) 直接从 PDF 读到内存解码, 不落盘。
+    """
+    img = Image.open(image_store.open_image(image_path))
+    target = config.IMAGE_DECODE_SIZE
+    img.draft("RGB", (target, target))  # (JPEG 直接按缩小尺寸解码, 其他格式无影响)
+    img = img.convert("RGB")
+    short_side = min(img.size)
+    if short_side > target:
+        scale = target / short_side
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.BICUBIC)
+    return img
 
-    for info in image_infos:
+def _decoded_batches(image_infos: List[Dict], batch_size: int, workers: int):
+    """
+    线程池并行解码, 按批产出 [(info, img)]。
+    最多预取 IMAGE_PREFETCH_BATCHES 批, CLIP 编码当前批时下一批已在解码, 内存有上限。
+    解码失败的图片单独跳过, 不影响同批其他图片。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for i in range(0, len(image_infos), batch_size):
+            batch = image_infos[i:i + batch_size]
+            pending.append([(info, pool.submit(_load_image, info['image_path'])) for info in batch])
+            if len(pending) > config.IMAGE_PREFETCH_BATCHES:
+                yield _collect_decoded(pending.popleft())
+        while pending:
+            yield _collect_decoded(pending.popleft())
+
+def _collect_decoded(futures: List) -> List:
+    decoded = []
+    for info, future in futures:
         try:
-            # 1. 打开图片
-            img = Image.open(info['image_path']).convert("RGB")
-            
-            # 2. 用 CLIP 编码
-            inputs = processor(images=img, return_tensors="pt", padding=True).to(device)
-            with torch.no_grad():
-                image_features = model.get_image_features(**inputs)
-            
-            embedding = image_features[0].cpu().numpy().tolist() # 获取向量
-            
-            # 3. 准备数据
-            data.append({
-                "image_path": info['image_path'],
-                "embedding": embedding,
-                "doc_name": info.get("doc_name"),
-                "page": info.get("page")
-            })
+            decoded.append((info, future.result()))
         except Exception as e:
             print(f"警告: 处理图片 {info['image_path']} 失败: {e}")
+    return decoded
 
-    if not data:
-        print("没有图片数据被成功处理。")
-        return
+def _encode_images(model, processor, device, images: List[Image.Image]) -> List[List[float]]:
+    """CLIP 批量编码, 一次前向"""
+    inputs = processor(images=images, return_tensors="pt", padding=True).to(device)
+    with torch.no_grad():
+        image_features = model.get_image_features(**inputs)
+    if not isinstance(image_features, torch.Tensor):
+        # (transformers 5.x 返回 ModelOutput, 投影后的向量在 pooler_output)
+        image_features = image_features.pooler_output
+    return image_features.cpu().numpy().tolist()
+
+def group_image_refs(image_infos: List[Dict]) -> Dict[str, Dict]:
+    """把逐次出现的图片信息按 image_hash 合并: {hash: {"image_path", "refs": [...]}} (保持首次出现顺序)"""
+    groups: Dict[str, Dict] = {}
+    for info in image_infos:
+        group = groups.setdefault(info["image_hash"], {"image_path": info["image_path"], "refs": []})
+        ref = image_store.image_ref_key(info["doc_name"], info["page"])
+        if ref not in group["refs"]:
+            group["refs"].append(ref)
+    return groups
 
-    client.insert(collection_name=config.IMAGE_COLLECTION_NAME, data=data)
-    print(f"{len(data)} 张 图片 插入 Milvus 成功。")
-    client.flush([config.IMAGE_COLLECTION_NAME])
+GET_BATCH_SIZE = 1000
+
+def _get_image_rows(client: MilvusClient, image_hashes: List[str],
+                    output_fields: List[str] = None) -> Dict[str, Dict]:
+    """按主键 (图片哈希) 取回已入库的图片行 (默认含向量, 用于更新 refs 后 upsert)"""
+    output_fields = output_fields or ["embedding", "image_path", "doc_name", "page", "refs"]
+    rows = {}
+    for i in range(0, len(image_hashes), GET_BATCH_SIZE):
+        res = client.get(collection_name=config.IMAGE_COLLECTION_NAME, ids=image_hashes[i:i + GET_BATCH_SIZE],
+                         output_fields=output_fields)
+        for row in res:
+            rows[row["pk"]] = row
+    return rows
+
+def iter_image_pks(client: MilvusClient):
+    """逐个产出图片集合里所有的主键 (图片哈希)"""
+    iterator = client.query_iterator(collection_name=config.IMAGE_COLLECTION_NAME,
+                                     batch_size=GET_BATCH_SIZE, output_fields=["pk"])
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            for row in batch:
+                yield row["pk"]
+    finally:
+        iterator.close()
+
+def _image_row(image_hash: str, image_path: str, embedding: List[float], refs: List[str]) -> Dict:
+    doc_name, page = image_store.parse_image_ref(refs[0])
+    return {
+        "pk": image_hash,
+        "embedding": embedding,
+        "image_path": image_path,
+        "doc_name": doc_name,
+        "page": page,
+        "refs": refs
+    }
+
+def image_pks_by_doc(image_hash: str, refs: List[str], grouped: Dict[str, List[str]]):
+    """把一张图片的出现位置登记到 {doc_name: [图片哈希]} 里"""
+    for ref in refs:
+        doc_pks = grouped.setdefault(image_store.parse_image_ref(ref)[0], [])
+        if image_hash not in doc_pks:
+            doc_pks.append(image_hash)
+
+def split_image_groups(client: MilvusClient, groups: Dict[str, Dict], seen: set = None):
+    """
+    把合并后的图片分成 (需要编码的新图片列表, 只需合并 refs 的已知图片 {hash: group})。
+    已知 = 本次入库已经处理过 (seen) 或 Milvus 里已存在。
+    """
+    seen = seen or set()
+    unseen = [h for h in groups if h not in seen]
+    existing = _get_image_rows(client, unseen, output_fields=["pk"]) if unseen else {}
+    new_items, known = [], {}
+    for image_hash, group in groups.items():
+        if image_hash in seen or image_hash in existing:
+            known[image_hash] = group
+        else:
+            new_items.append(dict(image_hash=image_hash, **group))
+    return new_items, known
+
+def merge_image_refs(client: MilvusClient, groups: Dict[str, Dict]) -> int:
+    """把出现位置合并进已入库的图片行 (不重新编码), 返回更新的行数"""
+    rows = _get_image_rows(client, list(groups))
+    updated = []
+    for image_hash, row in rows.items():
+        refs = list(row["refs"])
+        new_refs = [ref for ref in groups[image_hash]["refs"] if ref not in refs]
+        if new_refs:
+            updated.append(_image_row(image_hash, row["image_path"], row["embedding"], refs + new_refs))
+    if updated:
+        client.upsert(collection_name=config.IMAGE_COLLECTION_NAME, data=updated)
+        bump_data_version()
+    return len(updated)
+
+def iter_image_rows(image_models, items: List[Dict], batch_size: int = None):
+    """
+    对新图片 [{"image_hash", "image_path", "refs"}] 解码 + CLIP 编码, 按批产出待写入的图片行。
+    image_models: 返回 (model, processor, device) 的函数 (如 image_embedding_models), 只在需要编码时调用。
+    本地向量缓存里已有的图片直接产出, 不解码也不过模型。
+    """
+    batch_size = batch_size or config.IMAGE_EMBED_BATCH_SIZE
+    cache = embedding_cache.get_cache(config.IMAGE_EMBEDDING_MODEL, config.IMAGE_EMBEDDING_DIM)
+    if cache is not None:
+        cached = cache.get_many([item["image_hash"] for item in items])
+        hits = [_image_row(item["image_hash"], item["image_path"], embedding, item["refs"])
+                for item, embedding in zip(items, cached) if embedding is not None]
+        for i in range(0, len(hits), batch_size):
+            yield hits[i:i + batch_size]
+        items = [item for item, embedding in zip(items, cached) if embedding is None]
+
+    for decoded in _decoded_batches(items, batch_size, config.IMAGE_DECODE_WORKERS):
+        if not decoded:
+            continue
+        model, processor, device = image_models()
+        try:
+            embeddings = _encode_images(model, processor, device, [img for _, img in decoded])
+        except Exception:
+            # (整批失败时逐张重试, 只跳过有问题的那张)
+            embeddings, ok = [], []
+            for info, img in decoded:
+                try:
+                    embeddings.extend(_encode_images(model, processor, device, [img]))
+                    ok.append((info, img))
+                except Exception as e:
+                    print(f"警告: 处理图片 {info['image_path']} 失败: {e}")
+            decoded = ok
+        if decoded:
+            if cache is not None:
+                cache.put_many([info["image_hash"] for info, _ in decoded], embeddings)
+            yield [_image_row(info["image_hash"], info["image_path"], embedding, info["refs"])
+                   for (info, _), embedding in zip(decoded, embeddings)]
+
+def upsert_image_rows(client: MilvusClient, rows: List[Dict]):
+    """写入图片行 (主键是内容哈希, upsert 可重复执行, 中途失败重跑也不会产生重复行)"""
+    client.upsert(collection_name=config.IMAGE_COLLECTION_NAME, data=rows)
+    bump_data_version()
+
+# --- 3.1 数据删除 (增量入库用) ---
+
+DELETE_BATCH_SIZE = 5000
+
+def quote_str(value: str) -> str:
+    """把字符串转成 Milvus 过滤表达式里的字面量 (转义反斜杠和双引号, Windows 路径也安全)"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def delete_rows(client: MilvusClient, collection_name: str, pks: List):
+    """按主键分批删除"""
+    for i in range(0, len(pks), DELETE_BATCH_SIZE):
+        client.delete(collection_name=collection_name, ids=pks[i:i + DELETE_BATCH_SIZE])
+        bump_data_version()
+
+def delete_doc_rows(client: MilvusClient, doc_name: str, after_pk: int = None):
+    """
+    按 doc_name 删除 文本集合 里的所有行。
+    用于清单里没有记录主键的文件 (首次启用清单前入库的旧数据, 或上次入库中途失败的残留)。
+    after_pk: 只删主键大于它的行 (自增主键递增, 即断点之后写入但没记进清单的行)。
+    (图片行以内容哈希为主键、用 upsert 写入, 重跑不会产生重复, 不需要清理)
+    """
+    expr = f"doc_name == {quote_str(doc_name)}"
+    if after_pk is not None:
+        expr += f" and pk > {int(after_pk)}"
+    client.delete(collection_name=config.TEXT_COLLECTION_NAME, filter=expr)
+    bump_data_version()
+
+def _relocate_pdf_ref(image_hash: str, image_path: str, doc_name: str, refs: List[str]) -> str:
+    """
+    懒提取的图片引用指向被移除的文件时, 改为指向仍引用它的其他 PDF 中的同一张图
+    (在对应页里按去重键查找); 找不到则保留原值。
+    """
+    if not image_store.is_pdf_ref(image_path):
+        return image_path
+    file_path, _ = image_store.parse_pdf_ref(image_path)
+    if not os.path.normpath(file_path).endswith(os.path.normpath(doc_name)):
+        return image_path
+    for ref in refs:
+        other_doc, page = image_store.parse_image_ref(ref)
+        other_path = os.path.join(config.DATA_DIR, other_doc)
+        if not (other_doc.endswith(".pdf") and os.path.exists(other_path)):
+            continue
+        try:
+            new_ref = image_store.find_pdf_ref(other_path, page, image_hash, pdf_processor.same_image)
+        except Exception as e:
+            print(f"警告: 在 {other_doc} 第 {page} 页查找图片失败: {e}")
+            continue
+        if new_ref:
+            return new_ref
+    return image_path
+
+def remove_image_refs(client: MilvusClient, doc_name: str, image_hashes: List[str]):
+    """
+    从图片行里去掉某个文件的出现位置 (文件被修改/删除时调用)。
+    不再被任何文件引用的图片整行删除 (连同落盘的图片文件), 其余的更新 refs 后 upsert。
+    """
+    rows = _get_image_rows(client, list(image_hashes))
+    to_delete, to_update = [], []
+    for image_hash, row in rows.items():
+        refs = [ref for ref in row["refs"] if image_store.parse_image_ref(ref)[0] != doc_name]
+        if not refs:
+            to_delete.append(image_hash)
+        elif len(refs) != len(row["refs"]):
+            image_path = _relocate_pdf_ref(image_hash, row["image_path"], doc_name, refs)
+            to_update.append(_image_row(image_hash, image_path, row["embedding"], refs))
+    delete_rows(client, config.IMAGE_COLLECTION_NAME, to_delete)
+    for image_hash in to_delete:
+        image_store.discard_image(rows[image_hash]["image_path"], image_hash)
+    if to_update:
+        client.upsert(collection_name=config.IMAGE_COLLECTION_NAME, data=to_update)
+        bump_data_version()
 
 
 # --- 4. 检索功能 (为 RAG 链准备) ---
 
-def get_text_retriever():
-    """获取 文本检索器 (LangChain)"""
-    embeddings = get_text_embedding_model()
-    store = Milvus(
-        embedding_function=embeddings,
-        connection_args={"uri": config.MILVUS_URI},
+TEXT_TOP_K = 10  # 向量粗召回的文本块数, 后续 rerank
+# (与 LangChain Milvus 检索器对 IVF_FLAT 的默认搜索参数一致)
+TEXT_SEARCH_PARAMS = {"metric_type": "L2", "params": {"nprobe": 10}}
+
+class TextRetriever(BaseRetriever):
+    """
+    Milvus 文本检索器 (LangChain 接口): 走共享的连接池 (search_text_chunks),
+    代替 LangChain 的 Milvus 向量库 (它会另开一条没有超时和重连的连接)。
+    """
+
+    client: Any
+    embeddings: Any
+    k: int = TEXT_TOP_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return search_text_chunks(self.client, [self.embeddings.embed_query(query)], self.k)[0]
+
+    def get_relevant_documents(self, query: str, **kwargs) -> List[Document]:
+        return self.invoke(query, **kwargs)
+
+def get_text_retriever(embeddings=None):
+    """获取 文本检索器 (LangChain); embeddings 默认为共享的文本嵌入模型"""
+    embeddings = embeddings or text_embedding_model()
+    if config.VECTOR_BACKEND == "local":
+        return local_store.LocalTextRetriever(
+            client=get_client(), embeddings=embeddings,
+            collection_name=config.TEXT_COLLECTION_NAME, k=TEXT_TOP_K,
+        )
+    return TextRetriever(client=get_client(), embeddings=embeddings) # 召回10个，后续 rerank
+
+def search_text_chunks(client: MilvusClient, vectors: List[List[float]], k: int = TEXT_TOP_K) -> List[List[Document]]:
+    """
+    批量向量检索: 一次调用带多个查询向量, 返回每个向量的 k 个最近文本块。
+    Document 的格式与 get_text_retriever 返回的一致 (离线批量生成结果用)。
+    """
+    if not vectors:
+        return []
+    results = client.search(
         collection_name=config.TEXT_COLLECTION_NAME,
-        text_field="chunk_text",
-        auto_id=True,
+        data=vectors,
+        anns_field="embedding",
+        limit=k,
+        output_fields=["chunk_text", "doc_name", "page", "clause_id"],
+        # (本地引擎用自己的 nprobe 配置)
+        search_params=None if config.VECTOR_BACKEND == "local" else TEXT_SEARCH_PARAMS,
     )
-    return store.as_retriever(search_kwargs={"k": 10}) # 召回10个，后续 rerank
+    docs = []
+    for hits in results:
+        row_docs = []
+        for hit in hits:
+            # (主键: 旧版 pymilvus 为 "id", 新版按主键字段名 "pk")
+            metadata = dict(hit["entity"], pk=hit["id"] if "id" in hit else hit["pk"])
+            row_docs.append(Document(page_content=metadata.pop("chunk_text", ""), metadata=metadata))
+        docs.append(row_docs)
+    return docs
 
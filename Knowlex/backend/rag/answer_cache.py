@@ -0,0 +1,184 @@
+# rag/answer_cache.py
+# (V1 - 语义答案缓存)
+#
+# 很多问题只是换了个说法 ("后浇带防水施工要求" / "后浇带防水应符合哪些规范"), 每个都要让 LLM 重新生成一遍。
+# 这里在生成前加一层缓存, 键由两部分组成:
+#   1. 检索到的来源集合 (Top-3 条款的 文件名 / 页码 / 条文编号 / 内容哈希, 不计顺序) —— 必须完全相同
+#   2. 问题向量 (m3e) —— 与缓存里同一来源集合下的问题余弦相似度 >= 阈值
+# 两者都满足时直接返回缓存的答案。
+# 用 SQLite 持久化 (重启后仍然有效), 按最近使用淘汰 (最多 max_entries 条);
+# 命中时只在内存里更新最近使用时间, 攒够 LAST_USED_FLUSH 条 (或下一次写入/关闭时) 才批量写回, 读不提交事务。
+# 知识库指纹 (mate_store 清单) 或 LLM 模型变化时整体清空, 重新入库后不会返回旧答案。
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 导入你的配置
+from utils import config
+
+LAST_USED_FLUSH = 256  # 内存里攒多少条命中的最近使用时间后写回 SQLite
+
+
+def sources_key(retrieval_dict: Dict) -> str:
+    """检索结果的来源集合键 (与条款顺序无关)"""
+    items = sorted(
+        "\0".join((str(c.get("doc_name")), str(c.get("page")), c.get("clause_id") or "",
+                   hashlib.sha1(c["content"].encode("utf-8")).hexdigest()))
+        for c in retrieval_dict["clauses"]
+    )
+    return hashlib.sha1("\n".join(items).encode("utf-8")).hexdigest()
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存, 线程安全。全部条目在内存里按来源集合分桶 (一个桶通常只有几条),
+    查询时只和同一桶里的问题向量比较; SQLite 只负责持久化。
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, threshold: float = None):
+        self.path = path or config.ANSWER_CACHE_PATH
+        self.max_entries = max_entries or config.ANSWER_CACHE_SIZE
+        self.threshold = config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, sources TEXT NOT NULL, query TEXT NOT NULL,"
+            " embedding BLOB NOT NULL, answer TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+        # id → (来源集合键, 单位化的问题向量, 答案), 按最近使用排序 (最久未用的在前)
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, str]]" = OrderedDict()
+        self._buckets: Dict[str, List[int]] = {}
+        self._touched: Dict[int, float] = {}  # 命中后还没写回的 id → 最近使用时间
+        self._hits = self._misses = 0
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT id, sources, embedding, answer FROM answers ORDER BY last_used"
+        ).fetchall()
+        for entry_id, key, blob, answer in rows:
+            self._add(entry_id, key, np.frombuffer(blob, dtype=np.float32), answer)
+        if rows:
+            print(f"  > 语义答案缓存: 已加载 {len(rows)} 条")
+
+    def _add(self, entry_id: int, key: str, vec: np.ndarray, answer: str):
+        self._entries[entry_id] = (key, vec, answer)
+        self._buckets.setdefault(key, []).append(entry_id)
+
+    def _remove(self, entry_id: int):
+        self._touched.pop(entry_id, None)
+        key = self._entries.pop(entry_id)[0]
+        bucket = self._buckets[key]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def validate(self, tag: str):
+        """tag (知识库指纹 + LLM 模型等) 与上次不同时清空缓存; 启动入库完成后调用"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'tag'").fetchone()
+            if row is not None and row[0] == tag:
+                return
+            if self._entries:
+                print(f"知识库或模型已变化, 清空语义答案缓存 ({len(self._entries)} 条)")
+            self._clear_locked()
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tag', ?)", (tag,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+            self._db.commit()
+
+    def _clear_locked(self):
+        self._db.execute("DELETE FROM answers")
+        self._entries.clear()
+        self._buckets.clear()
+        self._touched.clear()
+
+    def _write_touched_locked(self):
+        """把命中过的最近使用时间写回 (不提交, 由调用方提交)"""
+        if self._touched:
+            self._db.executemany("UPDATE answers SET last_used = ? WHERE id = ?",
+                                 [(used, entry_id) for entry_id, used in self._touched.items()])
+            self._touched.clear()
+
+    def flush(self):
+        """写回内存里的最近使用时间"""
+        with self._lock:
+            if self._touched:
+                self._write_touched_locked()
+                self._db.commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def get(self, embedding: Sequence[float], retrieval_dict: Dict) -> Optional[str]:
+        """同一来源集合下最相似的问题达到阈值时返回它的答案, 否则返回 None"""
+        key = sources_key(retrieval_dict)
+        vec = _unit(embedding)
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id in self._buckets.get(key, ()):
+                sim = float(np.dot(self._entries[entry_id][1], vec))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(best_id)
+            self._touched[best_id] = time.time()
+            if len(self._touched) >= LAST_USED_FLUSH:
+                self._write_touched_locked()
+                self._db.commit()
+            return self._entries[best_id][2]
+
+    def put(self, query: str, embedding: Sequence[float], retrieval_dict: Dict, answer: str):
+        """写入一条答案; 超过 max_entries 时淘汰最久未用的条目"""
+        if not answer:
+            return
+        key = sources_key(retrieval_dict)
+        vec = _unit(embedding)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO answers (sources, query, embedding, answer, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, query, vec.tobytes(), answer, time.time()),
+            )
+            self._add(cursor.lastrowid, key, vec, answer)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                entry_id = next(iter(self._entries))
+                self._remove(entry_id)
+                evicted.append((entry_id,))
+            if evicted:
+                self._db.executemany("DELETE FROM answers WHERE id = ?", evicted)
+            self._write_touched_locked()
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self._hits, "misses": self._misses}
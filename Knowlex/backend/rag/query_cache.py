@@ -0,0 +1,119 @@
+# rag/query_cache.py
+# (V1 - 查询缓存)
+#
+# 两级缓存, 都按 数据版本 (vector_store.data_version) 失效:
+#   1. 检索结果缓存: 规范化后的问题 → run_retrieval_pipeline 的结果
+#   2. 问题向量缓存: 问题 → m3e 向量 (CachedQueryEmbeddings 包装检索器的嵌入模型)
+# 入库写入/删除 Milvus 后版本加一, 旧版本的条目在下次访问时作废。
+
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils import metrics
+
+
+def normalize_query(query: str) -> str:
+    """规范化问题作为缓存键: 全角转半角 (NFKC)、合并空白、英文转小写"""
+    return " ".join(unicodedata.normalize("NFKC", query).split()).lower()
+
+
+class VersionedLRUCache:
+    """
+    有容量上限 (LRU) 和过期时间 (TTL) 的缓存, 每个条目记录写入时的数据版本,
+    读取时版本不一致或已过期即视为未命中。线程安全。
+    ttl_seconds <= 0 表示不过期。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 键 -> (版本, 过期时间, 值)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: str, version: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and (self.ttl <= 0 or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any, version: int):
+        with self._lock:
+            if self._version is None or version > self._version:
+                # (数据版本变了, 旧条目全部作废)
+                self._entries.clear()
+                self._version = version
+            elif version < self._version:
+                return  # (计算期间数据已更新, 结果可能是旧的, 不缓存)
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    包装文本嵌入模型: embed_query 先查缓存 (按原始问题文本, 保证向量完全一致),
+    embed_documents 原样转发。version_fn 返回当前数据版本。
+    embeddings 可以是返回模型的函数 (如 vector_store.text_embedding_model), 缓存未命中时才加载模型。
+    """
+
+    def __init__(self, embeddings, cache: VersionedLRUCache, version_fn: Callable[[], int]):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.version_fn = version_fn
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings() if callable(self._embeddings) else self._embeddings
+
+    @embeddings.setter
+    def embeddings(self, embeddings):
+        self._embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        version = self.version_fn()
+        embedding = self.cache.get(text, version)
+        if embedding is None:
+            with metrics.stage_timer("embed"):
+                embedding = self.embeddings.embed_query(text)
+            self.cache.put(text, embedding, version)
+        return list(embedding)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量版 embed_query: 缓存未命中的问题合并成一次 embed_documents 调用"""
+        version = self.version_fn()
+        embeddings = [self.cache.get(text, version) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for text, embedding in computed.items():
+                self.cache.put(text, embedding, version)
+            embeddings = [computed[text] if embedding is None else embedding
+                          for text, embedding in zip(texts, embeddings)]
+        return [list(embedding) for embedding in embeddings]
@@ -0,0 +1,127 @@
+# rag/rerank_batcher.py
+# (V1 - Reranker 跨请求微批)
+#
+# 并发请求各自只有 ~10 对 (query, 文本块), 逐个调用 compute_score 时大模型会连续跑很多次小批量前向。
+# 这里把并发请求的打分对放进同一个队列, 后台线程最多等 max_wait_ms 毫秒 (或凑满 max_batch 对)
+# 合并成一次 compute_score, 再把分数按原顺序分回给各个调用方。
+# 只有一个请求在等待时不做等待, 单请求的延迟不变。
+# pair_seconds 记录每对的打分耗时 (只算 score_fn, 不含排队和模型加载), 供级联重排估算延迟预算。
+
+import time
+import queue
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# 导入你的配置
+from utils import config
+
+EMA_ALPHA = 0.2  # 每对耗时变慢时的滑动平均系数
+
+
+def update_estimate(previous: Optional[float], value: float, alpha: float = EMA_ALPHA) -> float:
+    """
+    每对耗时的估计: 变慢时按滑动平均上调 (偶发的一次慢调用只影响一部分),
+    变快时立即采用新值 (一次慢调用不会让估计一直偏高)。
+    """
+    if previous is None or value < previous:
+        return value
+    return alpha * value + (1 - alpha) * previous
+
+
+class _Request:
+    """一个调用方的打分请求"""
+
+    def __init__(self, pairs: List[Tuple[str, str]]):
+        self.pairs = pairs
+        self.scores: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class RerankBatcher:
+    """
+    score_fn: 接收 [(query, 文本), ...] 返回分数列表的函数 (如 reranker.compute_score)。
+    prepare: 每批打分前调用 (如加载模型), 耗时不计入 pair_seconds。
+    score() 线程安全, 阻塞到本请求的分数算完为止。
+    """
+
+    def __init__(self, score_fn: Callable[[List[Tuple[str, str]]], Sequence[float]],
+                 max_batch: int = None, max_wait_ms: float = None, prepare: Callable[[], object] = None):
+        self.score_fn = score_fn
+        self.prepare = prepare
+        self.pair_seconds: Optional[float] = None  # 每对的打分耗时估计
+        self.max_batch = max_batch or config.RERANK_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.RERANK_BATCH_WAIT_MS) / 1000
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._waiting = 0  # 已提交、还没算完的请求数
+        self._thread = None
+        self.batches = self.pairs_scored = 0
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+                self._thread.start()
+
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """对 pairs 打分, 返回与 pairs 顺序一致的分数"""
+        if not pairs:
+            return []
+        self._ensure_thread()
+        request = _Request(list(pairs))
+        with self._lock:
+            self._waiting += 1
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.scores
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        """以 first 开头凑一批: 还有其他请求在等时, 最多等 max_wait 秒或凑满 max_batch 对"""
+        batch, size = [first], len(first.pairs)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    others_waiting = self._waiting > len(batch)
+                remaining = deadline - time.monotonic()
+                if not others_waiting or remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            pairs = [pair for request in batch for pair in request.pairs]
+            try:
+                if self.prepare is not None:
+                    self.prepare()
+                compute_started = time.perf_counter()
+                scores = self.score_fn(pairs)
+                self.pair_seconds = update_estimate(
+                    self.pair_seconds, (time.perf_counter() - compute_started) / len(pairs))
+                if not isinstance(scores, (list, tuple)):  # (只有一对时返回的是单个分数)
+                    scores = [scores]
+                start = 0
+                for request in batch:
+                    request.scores = list(scores[start:start + len(request.pairs)])
+                    start += len(request.pairs)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            with self._lock:
+                self._waiting -= len(batch)
+                self.batches += 1
+                self.pairs_scored += len(pairs)
+            for request in batch:
+                request.done.set()
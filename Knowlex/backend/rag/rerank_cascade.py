@@ -0,0 +1,108 @@
+# rag/rerank_cascade.py
+# (V1 - 级联重排 + 延迟预算)
+#
+# 候选文本块先经过便宜的一级排序, 只有留下来的才交给 bge-reranker-large:
+#   1. 一级排序: 有小模型 (如 bge-reranker-base) 时用它打分, 否则沿用召回阶段的顺序 (RRF / 向量)
+#   2. 剪枝: 只保留前 keep 个 (只在有小模型时剪枝; 召回顺序太粗, 按它剪枝会丢掉好的候选)
+#   3. 提前结束: 小模型第一名领先第二名超过 margin 时, 直接用一级排序的结果
+#   4. 延迟预算: 按大模型的每对耗时估算, 超出本请求的预算时退回一级排序的结果;
+#      超预算时每隔 probe_seconds 仍调用一次大模型 (探测), 耗时恢复正常后估计随之恢复
+# 没有小模型时一级分数为召回名次的 RRF 分数 1 / (RRF_K + 名次), 不返回 None。
+
+import time
+import threading
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# 导入你的配置
+from utils import config
+from backend.rag.rerank_batcher import update_estimate
+
+Scorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+
+class RerankCascade:
+    """
+    large: 大模型打分函数 (必需); cheap: 小模型打分函数 (可选, None 表示用召回顺序, 此时不剪枝, 只有延迟预算)。
+    pair_seconds: 返回大模型每对耗时估计的函数 (如 RerankBatcher.pair_seconds, 不含排队和模型加载);
+                  不传时按 large 调用的总耗时自己估计。
+    rank() 返回 [(分数, 文本块)], 按分数从高到低。
+    """
+
+    def __init__(self, large: Scorer, cheap: Optional[Scorer] = None, keep: int = None,
+                 margin: float = None, budget_ms: float = None,
+                 pair_seconds: Callable[[], Optional[float]] = None, probe_seconds: float = None):
+        self.large = large
+        self.cheap = cheap
+        self.keep = keep or config.RERANK_CASCADE_KEEP
+        self.margin = config.RERANK_EARLY_EXIT_MARGIN if margin is None else margin
+        self.budget = (config.RERANK_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+        self.probe_seconds = config.RERANK_BUDGET_PROBE_SECONDS if probe_seconds is None else probe_seconds
+        self._pair_seconds_fn = pair_seconds
+        self._pair_seconds: Optional[float] = None  # 自己估计的大模型每对耗时
+        self._last_large: Optional[float] = None     # 上次调用大模型的时间 (time.monotonic)
+        self._lock = threading.Lock()
+        self.stats = {"large": 0, "early_exit": 0, "over_budget": 0, "probe": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def pair_seconds(self) -> Optional[float]:
+        return self._pair_seconds_fn() if self._pair_seconds_fn is not None else self._pair_seconds
+
+    def _first_stage(self, query: str, docs: List[Document]) -> List[Tuple[float, Document]]:
+        if self.cheap is None:
+            return [(1.0 / (config.RRF_K + rank), doc) for rank, doc in enumerate(docs, start=1)]
+        scores = self.cheap([(query, doc.page_content) for doc in docs])
+        return sorted(zip(scores, docs), key=lambda x: x[0], reverse=True)
+
+    def _over_budget(self, started: float, pairs: int) -> bool:
+        estimate = self.pair_seconds()
+        if self.budget <= 0 or estimate is None:
+            return False
+        return time.perf_counter() - started + estimate * pairs > self.budget
+
+    def _claim_probe(self) -> bool:
+        """超预算时是否仍调用大模型 (距上次调用已过 probe_seconds; 并发请求中只有一个去探测)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._last_large is not None and now - self._last_large < self.probe_seconds:
+                return False
+            self._last_large = now
+            return True
+
+    def rank(self, query: str, docs: List[Document], started: float = None) -> List[Tuple[float, Document]]:
+        """started: 请求开始的时间 (time.perf_counter), 延迟预算从这里算起"""
+        if not docs:
+            return []
+        started = time.perf_counter() if started is None else started
+        ranked = self._first_stage(query, docs)
+
+        # 提前结束: 一级排序的第一名已经遥遥领先
+        if (self.cheap is not None and self.margin > 0 and len(ranked) > 1
+                and ranked[0][0] - ranked[1][0] >= self.margin):
+            self._count("early_exit")
+            return ranked
+
+        keep = self.keep if self.cheap is not None else len(ranked)
+        survivors = [doc for _, doc in ranked[:keep]]
+        # 延迟预算: 预计超时就不再调用大模型 (定期探测一次, 否则一次慢调用会让大模型再也不被调用)
+        if self._over_budget(started, len(survivors)):
+            if not self._claim_probe():
+                self._count("over_budget")
+                return ranked
+            self._count("probe")
+
+        large_started = time.perf_counter()
+        scores = self.large([(query, doc.page_content) for doc in survivors])
+        per_pair = (time.perf_counter() - large_started) / len(survivors)
+        with self._lock:
+            self._last_large = time.monotonic()
+            if self._pair_seconds_fn is None:
+                self._pair_seconds = update_estimate(self._pair_seconds, per_pair)
+            self.stats["large"] += 1
+        reranked = sorted(zip(scores, survivors), key=lambda x: x[0], reverse=True)
+        # (被剪掉的候选按一级排序接在后面)
+        return reranked + ranked[keep:]
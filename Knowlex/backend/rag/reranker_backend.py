@@ -0,0 +1,136 @@
+# rag/reranker_backend.py
+# (V1 - Reranker 推理后端: PyTorch / ONNX Runtime int8)
+#
+# 服务器没有 GPU 时, FlagReranker 的 fp16 不起作用, fp32 的 PyTorch 大模型占了查询的大部分耗时和内存。
+# ONNX 后端把 cross-encoder 导出成 ONNX 图, 做动态 int8 量化 (权重 int8, 激活运行时量化),
+# 用 ONNX Runtime 在 CPU 上推理 (可控制 intra-op 线程数)。
+# 接口与 FlagReranker.compute_score 相同; 用 config.RERANKER_BACKEND 选择:
+#   "flag" = FlagReranker (PyTorch), "onnx" = ONNX fp32, "onnx-int8" = ONNX 动态 int8 量化
+# 导出的模型缓存在 config.RERANK_ONNX_DIR, 只在第一次加载时导出。
+# 切换后端前用 benchmark/rerank_parity.py 检查 Top-1 / Top-3 排序是否一致。
+
+import os
+import shutil
+import importlib.util
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+# 导入你的配置
+from utils import config
+
+try:
+    import onnxruntime as ort
+except ImportError:  # (可选依赖: 只有选 ONNX 后端时才需要, 见 requirements.txt)
+    ort = None
+
+ONNX_OPSET = 17
+
+
+def _require(*packages: str):
+    """检查 ONNX 后端的可选依赖, 缺哪个就在错误信息里写哪个"""
+    missing = [name for name in packages if importlib.util.find_spec(name) is None]
+    if missing:
+        raise ImportError(f"ONNX Reranker 缺少依赖 {', '.join(missing)}, "
+                          f"请安装: pip install {' '.join(missing)}")
+
+def _export_dir(model_name: str) -> str:
+    return os.path.join(config.RERANK_ONNX_DIR, model_name.strip("/\\").replace("/", "__").replace("\\", "__"))
+
+def export_onnx(model_name: str, quantize: bool = True) -> str:
+    """
+    导出 ONNX 模型 (fp32), quantize=True 时再做动态 int8 量化, 返回要加载的模型文件路径。
+    已导出的直接复用; 先写临时目录/文件再改名, 中途中断不会留下半个模型。
+    """
+    out_dir = _export_dir(model_name)
+    fp32_dir = os.path.join(out_dir, "fp32")
+    fp32_path = os.path.join(fp32_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target):
+        return target
+
+    # (导出和量化都需要 onnx; 已导出的模型只用 onnxruntime 加载)
+    _require("onnx")
+    if not os.path.exists(fp32_path):
+        print(f"正在导出 ONNX 模型: {model_name} → {fp32_dir}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        sample = tokenizer(["问题"], ["文本块"], return_tensors="pt")
+        # (按 forward 的参数顺序传入; bge-reranker (XLM-R) 没有 token_type_ids)
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        tmp_dir = fp32_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[name] for name in input_names), os.path.join(tmp_dir, "model.onnx"),
+                input_names=input_names, output_names=["logits"],
+                dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names},
+                              "logits": {0: "batch"}},
+                opset_version=ONNX_OPSET, dynamo=False,
+            )
+        tokenizer.save_pretrained(tmp_dir)
+        shutil.rmtree(fp32_dir, ignore_errors=True)
+        os.replace(tmp_dir, fp32_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"正在量化 ONNX 模型 (动态 int8): {int8_path}")
+        tmp_path = int8_path + ".tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return target
+
+
+class OnnxReranker:
+    """ONNX Runtime (CPU) 上的 cross-encoder, compute_score 与 FlagReranker 用法相同"""
+
+    def __init__(self, model_name: str, quantize: bool = True, threads: int = None, max_length: int = None):
+        if ort is None:
+            _require("onnxruntime")
+        path = export_onnx(model_name, quantize)
+        self.model_path = path
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(_export_dir(model_name), "fp32"))
+        self.max_length = max_length or config.RERANK_MAX_LENGTH
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = config.RERANK_ONNX_THREADS if threads is None else threads
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {inp.name for inp in self.session.get_inputs()}
+
+    def compute_score(self, sentence_pairs: Union[Sequence[Tuple[str, str]], Tuple[str, str]],
+                      batch_size: int = 32, max_length: int = None, **kwargs) -> Union[List[float], float]:
+        """返回每对的原始分数 (logit); 只有一对时返回单个分数 (与 FlagReranker 一致)"""
+        pairs = [sentence_pairs] if isinstance(sentence_pairs[0], str) else list(sentence_pairs)
+        # 按长度从长到短分批, 同一批里 padding 更少
+        order = np.argsort([-(len(q) + len(p)) for q, p in pairs], kind="stable")
+        scores = np.empty(len(pairs), dtype=np.float32)
+        for i in range(0, len(pairs), batch_size):
+            batch = order[i:i + batch_size]
+            encoded = self.tokenizer(
+                [pairs[j][0] for j in batch], [pairs[j][1] for j in batch],
+                padding=True, truncation=True, max_length=max_length or self.max_length, return_tensors="np",
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            logits = self.session.run(None, feeds)[0]
+            scores[batch] = logits.reshape(len(batch), -1)[:, 0]
+        scores = scores.tolist()
+        return scores[0] if len(scores) == 1 else scores
+
+
+def load_reranker(model_name: str, backend: str = None):
+    """按后端加载 Reranker (默认 config.RERANKER_BACKEND)"""
+    backend = backend or config.RERANKER_BACKEND
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxReranker(model_name, quantize=backend == "onnx-int8")
+    if backend != "flag":
+        raise ValueError(f"未知的 RERANKER_BACKEND: {backend} (可选 flag / onnx / onnx-int8)")
+    from FlagEmbedding import FlagReranker
+    return FlagReranker(model_name, use_fp16=True)  # (没有 GPU 时 fp16 不起作用)
@@ -0,0 +1,12 @@
+# tests/conftest.py
+# 单元测试: 只测纯逻辑模块, 不需要 Milvus 和模型下载。
+# 运行: cd Knowlex/backend && python -m pytest -q tests
+
+import os
+import sys
+
+_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# (模块里既有 "from utils import config", 也有 "from backend.xxx import yyy")
+for path in (_BACKEND, os.path.dirname(_BACKEND)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
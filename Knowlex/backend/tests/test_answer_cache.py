@@ -0,0 +1,111 @@
+# tests/test_answer_cache.py
+
+import pytest
+
+from backend.rag import answer_cache
+from backend.rag.answer_cache import SemanticAnswerCache, sources_key
+
+
+def _retrieval(*clauses):
+    return {"clauses": [{"doc_name": doc, "page": page, "clause_id": clause_id, "content": content}
+                        for doc, page, clause_id, content in clauses], "images": []}
+
+SOURCES = _retrieval(("a.pdf", 3, "3.2.1", "后浇带应采用补偿收缩混凝土。"),
+                     ("b.pdf", 7, "", "防水层施工前基层应干燥。"))
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path / "answers.db"), max_entries=3, threshold=0.9)
+    yield cache
+    cache.close()
+
+
+def test_sources_key_ignores_order_but_not_content():
+    reordered = {"clauses": list(reversed(SOURCES["clauses"]))}
+    assert sources_key(reordered) == sources_key(SOURCES)
+    edited = _retrieval(("a.pdf", 3, "3.2.1", "后浇带应采用普通混凝土。"), ("b.pdf", 7, "", "防水层施工前基层应干燥。"))
+    assert sources_key(edited) != sources_key(SOURCES)
+
+
+def test_similarity_threshold(cache):
+    cache.put("后浇带防水施工要求", [1.0, 0.0, 0.0], SOURCES, "答案 A")
+    # 余弦 0.95 ≥ 0.9 命中; 向量长度不影响
+    assert cache.get([0.95 * 3, 0.312 * 3, 0.0], SOURCES) == "答案 A"
+    # 余弦约 0.8, 未命中
+    assert cache.get([0.8, 0.6, 0.0], SOURCES) is None
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_different_sources_miss(cache):
+    cache.put("q", [1.0, 0.0], SOURCES, "答案 A")
+    other = _retrieval(("a.pdf", 4, "3.2.2", "其他条文。"))
+    assert cache.get([1.0, 0.0], other) is None
+
+
+def test_best_match_wins(cache):
+    cache.put("q1", [1.0, 0.0], SOURCES, "答案 1")
+    cache.put("q2", [0.96, 0.28], SOURCES, "答案 2")
+    assert cache.get([0.93, 0.37], SOURCES) == "答案 2"
+    assert cache.get([1.0, 0.05], SOURCES) == "答案 1"
+
+
+def test_empty_answer_is_not_cached(cache):
+    cache.put("q", [1.0, 0.0], SOURCES, "")
+    assert len(cache) == 0
+
+
+def test_evicts_least_recently_used(cache):
+    keys = [_retrieval((f"{i}.pdf", 1, "", f"内容 {i}")) for i in range(4)]
+    for i in range(3):
+        cache.put(f"q{i}", [1.0, 0.0], keys[i], f"答案 {i}")
+    assert cache.get([1.0, 0.0], keys[0]) == "答案 0"  # (0 变成最近使用)
+    cache.put("q3", [1.0, 0.0], keys[3], "答案 3")
+    assert len(cache) == 3
+    assert cache.get([1.0, 0.0], keys[1]) is None
+    assert [cache.get([1.0, 0.0], keys[i]) for i in (0, 2, 3)] == ["答案 0", "答案 2", "答案 3"]
+
+
+def test_persists_and_restores_recency(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "LAST_USED_FLUSH", 1000)
+    path = str(tmp_path / "answers.db")
+    keys = [_retrieval((f"{i}.pdf", 1, "", f"内容 {i}")) for i in range(3)]
+    cache = SemanticAnswerCache(path, max_entries=3, threshold=0.9)
+    for i in range(3):
+        cache.put(f"q{i}", [1.0, 0.0], keys[i], f"答案 {i}")
+    cache.get([1.0, 0.0], keys[0])
+    cache.close()  # (关闭时写回命中的最近使用时间)
+
+    reopened = SemanticAnswerCache(path, max_entries=3, threshold=0.9)
+    assert len(reopened) == 3
+    assert reopened.get([1.0, 0.0], keys[2]) == "答案 2"
+    reopened.put("q3", [1.0, 0.0], _retrieval(("3.pdf", 1, "", "内容 3")), "答案 3")
+    # 最久未用的是 1 (0 在重启前被命中过)
+    assert reopened.get([1.0, 0.0], keys[1]) is None
+    assert reopened.get([1.0, 0.0], keys[0]) == "答案 0"
+    reopened.close()
+
+
+def test_validate_clears_on_tag_change(tmp_path):
+    path = str(tmp_path / "answers.db")
+    cache = SemanticAnswerCache(path, max_entries=10, threshold=0.9)
+    cache.validate("fingerprint-1|llm-a")
+    cache.put("q", [1.0, 0.0], SOURCES, "答案")
+    # 同样的 tag: 保留
+    cache.validate("fingerprint-1|llm-a")
+    assert cache.get([1.0, 0.0], SOURCES) == "答案"
+    cache.close()
+
+    reopened = SemanticAnswerCache(path, max_entries=10, threshold=0.9)
+    reopened.validate("fingerprint-1|llm-a")
+    assert len(reopened) == 1
+    # 知识库指纹变了
+    reopened.validate("fingerprint-2|llm-a")
+    assert len(reopened) == 0
+    reopened.put("q", [1.0, 0.0], SOURCES, "新答案")
+    # LLM 模型变了
+    reopened.validate("fingerprint-2|llm-b")
+    assert reopened.get([1.0, 0.0], SOURCES) is None
+    reopened.close()
+    again = SemanticAnswerCache(path, max_entries=10, threshold=0.9)
+    assert len(again) == 0
+    again.close()
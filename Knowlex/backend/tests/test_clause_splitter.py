@@ -0,0 +1,59 @@
+# tests/test_clause_splitter.py
+
+from backend.data_process.clause_splitter import (
+    find_clauses, last_clause_id, normalize_clause_numbers, split_clauses,
+)
+
+
+def _ids(text, current_clause="", min_chars=5):
+    return [clause_id for _, clause_id in split_clauses(text, current_clause, min_chars)]
+
+
+def test_three_level_clauses():
+    text = "3.2.1 管道安装完成后应进行水压试验。\n3.2.2 阀门安装前应做强度试验。"
+    assert _ids(text) == ["3.2.1", "3.2.2"]
+
+
+def test_appendix_and_four_level_clauses():
+    text = "A.0.1 本附录适用于检验批。\n4.1.2.3 钢筋的品种应符合设计要求。"
+    assert _ids(text) == ["A.0.1", "4.1.2.3"]
+
+
+def test_section_heading_is_two_level_clause():
+    text = "3.2 材料\n3.2.1 材料进场时应检查合格证明文件。"
+    assert _ids(text) == ["3.2", "3.2.1"]
+    assert _ids("3.2材料\n3.2.1 材料进场时应检查合格证明文件。") == ["3.2", "3.2.1"]
+
+
+def test_wrapped_line_starting_with_decimal_is_not_a_clause():
+    text = "3.2.1 管道安装完成后应进行水压试验，试验压力应按\n1.5倍的设计压力进行试验。"
+    assert _ids(text) == ["3.2.1"]
+    assert last_clause_id(text) == "3.2.1"
+
+
+def test_wrapped_decimal_with_space_or_unit_is_not_a_clause():
+    for line in ("1.5 倍的设计压力进行试验。", "2.5米范围内不得堆放材料", "0.5 毫米", "1.2 当墙体高度超过规定时，应设置构造柱。"):
+        text = "4.3.2 防水层的厚度应符合下列规定，\n" + line
+        assert _ids(text) == ["4.3.2"], line
+
+
+def test_text_before_first_clause_keeps_current_clause():
+    text = "继续上一页的条文内容，这一段没有编号。\n5.1.1 新的条文开始。"
+    assert _ids(text, current_clause="4.9.9") == ["4.9.9", "5.1.1"]
+
+
+def test_toc_entries_have_empty_clause_id():
+    text = "3.2 材料 ·············· (12)\n3.2.1 一般规定 ·············· (12)\n"
+    assert [clause_id for _, clause_id in find_clauses(text)] == ["", ""]
+
+
+def test_short_segments_merge_into_next():
+    text = "3.2 材料\n3.2.1 材料进场时应检查合格证明文件和检验报告，并应按规定抽样复验。"
+    segments = split_clauses(text, min_chars=30)
+    assert len(segments) == 1
+    assert segments[0][1] == "3.2.1" and segments[0][0].startswith("3.2 材料")
+
+
+def test_broken_clause_numbers_are_joined():
+    assert normalize_clause_numbers("3\n. 1\n. 2 条文") == "3.1.2 条文"
+    assert _ids("3. 1. 2 条文内容在这里。") == ["3.1.2"]
@@ -0,0 +1,98 @@
+# tests/test_embedding_cache.py
+
+import os
+
+import numpy as np
+
+from utils import config
+from backend.knowledge_base import embedding_cache
+from backend.knowledge_base.embedding_cache import EmbeddingCache, content_hash
+
+DIM = 4
+
+
+def _vec(i):
+    return [float(i), i + 0.5, -float(i), 1.0]
+
+def _filled(tmp_path, count):
+    cache = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    keys = [content_hash(f"文本块 {i}") for i in range(count)]
+    cache.put_many(keys, [_vec(i) for i in range(count)])
+    return cache, keys
+
+
+def test_hit_and_miss(tmp_path):
+    cache, keys = _filled(tmp_path, 3)
+    assert cache.get_many([keys[1], "missing", keys[0]]) == [_vec(1), None, _vec(0)]
+    assert len(cache) == 3
+    # 模型名里的 "/" 不会变成子目录
+    assert sorted(os.listdir(tmp_path)) == ["m3e_base_4.f32", "m3e_base_4.keys"]
+
+
+def test_existing_keys_are_not_overwritten(tmp_path):
+    cache, keys = _filled(tmp_path, 2)
+    cache.put_many([keys[0], keys[0], "new"], [_vec(9), _vec(8), _vec(7)])
+    assert len(cache) == 3
+    assert cache.get_many([keys[0], "new"]) == [_vec(0), _vec(7)]
+
+
+def test_reopen_after_restart(tmp_path):
+    cache, keys = _filled(tmp_path, 5)
+    del cache
+    reopened = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert len(reopened) == 5
+    assert reopened.get_many(keys) == [_vec(i) for i in range(5)]
+    # 另一个维度是独立的缓存
+    assert len(EmbeddingCache("m3e/base", 8, str(tmp_path))) == 0
+
+
+def test_grows_past_initial_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_GROW_ROWS", 2)
+    cache, keys = _filled(tmp_path, 3)
+    cache.put_many(["a", "b", "c"], [_vec(10), _vec(11), _vec(12)])
+    reopened = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert reopened.get_many(keys + ["c"]) == [_vec(0), _vec(1), _vec(2), _vec(12)]
+
+
+def test_truncated_keys_tail_is_dropped(tmp_path):
+    cache, keys = _filled(tmp_path, 3)
+    # 崩溃时最后一个键只写了一半
+    with open(cache.keys_path, "a", encoding="utf-8") as f:
+        f.write("deadbeef")
+    reopened = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert len(reopened) == 3
+    reopened.put_many(["next"], [_vec(5)])
+    again = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert again.get_many(keys + ["next", "deadbeef"]) == [_vec(0), _vec(1), _vec(2), _vec(5), None]
+
+
+def test_truncated_matrix_drops_extra_keys(tmp_path):
+    cache, keys = _filled(tmp_path, 3)
+    del cache
+    # 矩阵文件只剩 2 行多一点: 第 3 个键没有对应的向量
+    with open(os.path.join(tmp_path, "m3e_base_4.f32"), "r+b") as f:
+        f.truncate(2 * DIM * 4 + 3)
+    reopened = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get_many(keys) == [_vec(0), _vec(1), None]
+    # 之后写入的键和向量仍然对齐
+    reopened.put_many([keys[2], "x"], [_vec(7), _vec(8)])
+    again = EmbeddingCache("m3e/base", DIM, str(tmp_path))
+    assert again.get_many(keys + ["x"]) == [_vec(0), _vec(1), _vec(7), _vec(8)]
+
+
+def test_vectors_are_float32(tmp_path):
+    cache = EmbeddingCache("clip", DIM, str(tmp_path))
+    cache.put_many(["k"], [[0.1, 0.2, 0.3, 0.4]])
+    assert cache.get_many(["k"])[0] == np.asarray([0.1, 0.2, 0.3, 0.4], dtype=np.float32).tolist()
+
+
+def test_get_cache_respects_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_cache, "_caches", {})
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", False)
+    assert embedding_cache.get_cache("m3e", DIM) is None
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", True)
+    cache = embedding_cache.get_cache("m3e", DIM)
+    assert cache is embedding_cache.get_cache("m3e", DIM)
+    assert embedding_cache.get_cache("m3e", 8) is not cache
@@ -0,0 +1,84 @@
+# tests/test_image_dedup.py
+
+import io
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from utils import config
+from backend.data_process import pdf_processor
+from backend.data_process.pdf_processor import PHashIndex, image_key, is_phash_key, same_image
+
+
+@pytest.fixture(autouse=True)
+def _phash_dedup(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_PHASH_DEDUP", True)
+    monkeypatch.setattr(config, "IMAGE_PHASH_MAX_DISTANCE", 4)
+
+
+def _encode(img, fmt, **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+def _drawing(seed=0):
+    img = Image.new("RGB", (240, 160), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        x = (seed * 37 + i * 41) % 200
+        draw.rectangle([x, 10 + i * 22, x + 30 + i * 5, 30 + i * 22], fill=(20 * i, 80, 200 - 20 * i))
+    return img
+
+def _flip_bits(key, count):
+    bits = int(key[1:], 16)
+    for i in range(count):
+        bits ^= 1 << (i * 9)
+    return f"d{bits:016x}"
+
+
+def test_reencoded_image_gets_same_key():
+    img = _drawing()
+    png_key = image_key(_encode(img, "PNG"))
+    jpeg_key = image_key(_encode(img, "JPEG", quality=70))
+    assert is_phash_key(png_key)
+    assert same_image(_encode(img, "JPEG", quality=70), png_key)
+    infos = [{"image_hash": png_key, "image_path": "a.pdf#xref=1"},
+             {"image_hash": jpeg_key, "image_path": "b.pdf#xref=2"}]
+    assert [info["image_hash"] for info in PHashIndex().canonicalize(infos)] == [png_key, png_key]
+
+
+def test_blank_images_fall_back_to_content_hash():
+    white = image_key(_encode(Image.new("RGB", (100, 100), "white"), "PNG"))
+    grey = image_key(_encode(Image.new("RGB", (50, 80), (200, 200, 200)), "PNG"))
+    assert not is_phash_key(white) and not is_phash_key(grey)
+    assert white != grey
+
+
+def test_index_merges_only_within_distance():
+    index = PHashIndex()
+    base = "d" + "5a3c" * 4
+    assert index.resolve(base) == base
+    assert index.resolve(_flip_bits(base, 3)) == base
+    far = _flip_bits(base, 6)
+    assert index.resolve(far) == far
+    # 内容哈希键原样返回
+    assert index.resolve("a" * 40) == "a" * 40
+
+
+def test_index_prefers_nearest_known_key():
+    index = PHashIndex()
+    base = "d" + "0f" * 8
+    near = _flip_bits(base, 1)
+    index.add(_flip_bits(base, 4))
+    index.add(near)
+    assert index.resolve(base) == near
+
+
+def test_saved_filename_depends_only_on_key(tmp_path):
+    img = _drawing(seed=3)
+    key_jpeg, path_jpeg = pdf_processor.save_image_bytes(_encode(img, "JPEG", quality=70), "jpeg", str(tmp_path))
+    key_png, path_png = pdf_processor.save_image_bytes(_encode(img, "PNG"), "png", str(tmp_path))
+    assert key_png == key_jpeg and path_png == path_jpeg
+    assert os.listdir(tmp_path) == [os.path.basename(path_png)]
+    assert Image.open(path_png).format == "PNG"
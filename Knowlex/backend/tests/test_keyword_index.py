@@ -0,0 +1,90 @@
+# tests/test_keyword_index.py
+
+from pymilvus import CollectionSchema, DataType, FieldSchema
+
+from utils import config
+from backend.knowledge_base.keyword_index import KeywordIndex, rrf_fuse, tokenize
+from backend.knowledge_base.local_store import LocalVectorClient
+
+
+def _index(*contents):
+    index = KeywordIndex()
+    index.build({"pk": i, "content": text, "doc_name": "d.pdf", "page": 1, "clause_id": ""}
+                for i, text in enumerate(contents))
+    return index
+
+def _pks(results):
+    return [record["pk"] for _, record in results]
+
+
+def test_tokenize_bigrams_and_terms():
+    assert tokenize("后浇带") == ["后浇", "浇带"]
+    assert tokenize("采用 HRB400 钢筋, 见 3.2.1 条") == ["采用", "hrb400", "钢筋", "见", "3.2.1", "条"]
+    # 全角字母数字先规范化
+    assert tokenize("ＧＢ５０４４４") == ["gb50444"]
+
+
+def test_exact_term_ranks_first():
+    index = _index("混凝土浇筑完成后应及时养护。",
+                   "后浇带应在两侧混凝土龄期达到 42 天后再施工。",
+                   "钢筋的品种应符合设计要求。")
+    results = index.search("后浇带什么时候施工", k=3)
+    assert _pks(results)[0] == 1
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+
+
+def test_rare_terms_weigh_more():
+    index = _index("管道 管道 管道 阀门", "管道 HRB400", "管道 阀门", "管道")
+    assert _pks(index.search("管道 HRB400", k=1)) == [1]
+
+
+def test_shorter_chunk_wins_on_equal_tf():
+    index = _index("穿墙管" + "。其他内容" * 20, "穿墙管的防水做法")
+    assert _pks(index.search("穿墙管", k=2)) == [1, 0]
+
+
+def test_no_hits_and_empty_index():
+    assert _index("混凝土").search("HRB400") == []
+    assert KeywordIndex().search("混凝土") == []
+    assert len(_index("a", "b")) == 2
+
+
+def test_load_from_collection(tmp_path):
+    client = LocalVectorClient(str(tmp_path))
+    client.create_collection(config.TEXT_COLLECTION_NAME, schema=CollectionSchema([
+        FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=2),
+        FieldSchema(name="chunk_text", dtype=DataType.VARCHAR, max_length=1000),
+        FieldSchema(name="doc_name", dtype=DataType.VARCHAR, max_length=100),
+        FieldSchema(name="page", dtype=DataType.INT64),
+        FieldSchema(name="clause_id", dtype=DataType.VARCHAR, max_length=100, default_value=""),
+    ]))
+    pks = client.insert(config.TEXT_COLLECTION_NAME, [
+        {"embedding": [0.0, 1.0], "chunk_text": "后浇带的施工要求", "doc_name": "a.pdf", "page": 2},
+        {"embedding": [1.0, 0.0], "chunk_text": "钢筋的品种", "doc_name": "b.pdf", "page": 5, "clause_id": "4.1.2"},
+    ])["ids"]
+    index = KeywordIndex()
+    index.load(client)
+    [(_, record)] = index.search("钢筋")
+    assert record == {"pk": pks[1], "content": "钢筋的品种", "doc_name": "b.pdf", "page": 5, "clause_id": "4.1.2"}
+
+
+def test_rrf_fuse_rewards_agreement():
+    dense = ["a", "b", "c"]
+    keyword = ["b", "d"]
+    assert rrf_fuse([dense, keyword], key=lambda x: x, k=60) == ["b", "a", "d", "c"]
+
+
+def test_rrf_fuse_keeps_first_occurrence():
+    dense = [{"pk": 1, "from": "dense"}, {"pk": 2, "from": "dense"}]
+    keyword = [{"pk": 2, "from": "keyword"}, {"pk": 3, "from": "keyword"}]
+    fused = rrf_fuse([dense, keyword], key=lambda item: item["pk"], k=1)
+    assert [item["pk"] for item in fused] == [2, 1, 3]
+    assert fused[0]["from"] == "dense"
+
+
+def test_rrf_fuse_uses_config_k(monkeypatch):
+    monkeypatch.setattr(config, "RRF_K", 0)
+    # k = 0: 第一名 1 分, 两个列表各第二名 0.5 + 0.5 分, 同分时保持先出现的顺序
+    assert rrf_fuse([["a", "b"], ["c", "b"]], key=lambda x: x) == ["a", "b", "c"]
+    assert rrf_fuse([], key=lambda x: x) == []
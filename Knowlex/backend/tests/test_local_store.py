@@ -0,0 +1,116 @@
+# tests/test_local_store.py
+
+import numpy as np
+import pytest
+from pymilvus import CollectionSchema, DataType, FieldSchema
+
+from utils import config
+from backend.knowledge_base.local_store import LocalVectorClient, compile_filter
+
+DIM = 8
+NLIST = 8
+
+
+# --- 过滤表达式 ---
+
+_ROW = {"doc_name": 'a"b.pdf', "page": 3, "clause_id": "3.2.1", "refs": ["a.pdf#1", "b.pdf#2"]}
+
+@pytest.mark.parametrize("expr, expected", [
+    ('doc_name == "a\\"b.pdf"', True),
+    ("page != 3", False),
+    ("page >= 3 and page < 4", True),
+    ("page > 5 or clause_id == '3.2.1'", True),
+    ("not (page == 3)", False),
+    ("page in [1, 2, 3]", True),
+    ("clause_id not in ['3.2.1', '3.2.2']", False),
+    ("page == 3 && (clause_id == 'x' || doc_name != 'y')", True),
+    ('json_contains(refs, "b.pdf#2")', True),
+    ('json_contains_any(refs, ["c.pdf#1", "a.pdf#1"])', True),
+    ('json_contains_all(refs, ["a.pdf#1", "c.pdf#1"])', False),
+    ("missing > 1", False),
+])
+def test_filter_expressions(expr, expected):
+    assert compile_filter(expr)(_ROW) is expected
+
+def test_empty_filter_matches_everything():
+    assert compile_filter("") is None and compile_filter("   ") is None
+
+@pytest.mark.parametrize("expr", ["page ==", "page 3", "(page == 3", "page == 3 page", "page ~ 3"])
+def test_filter_syntax_errors(expr):
+    with pytest.raises(ValueError):
+        compile_filter(expr)
+
+
+# --- IVF 检索 ---
+
+def _client(root, index_type="IVF_FLAT"):
+    client = LocalVectorClient(str(root))
+    schema = CollectionSchema([
+        FieldSchema(name="pk", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=DIM),
+        FieldSchema(name="group", dtype=DataType.INT64),
+    ])
+    client.create_collection("texts", schema=schema)
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name="embedding", index_type=index_type, metric_type="L2",
+                           params={"nlist": NLIST})
+    client.create_index("texts", index_params)
+    return client
+
+def _clustered(count, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=10, size=(NLIST, DIM))
+    labels = rng.integers(0, NLIST, size=count)
+    return (centers[labels] + rng.normal(size=(count, DIM))).astype(np.float32), labels
+
+def _ids(hits):
+    return [hit["id"] for hit in hits]
+
+@pytest.fixture
+def ivf_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_IVF_MIN_ROWS", 400)
+    vectors, labels = _clustered(800)
+    client = _client(tmp_path / "ivf")
+    client.insert("texts", [{"embedding": v.tolist(), "group": int(g)} for v, g in zip(vectors, labels)])
+    client.flush("texts")
+    return client, vectors, labels
+
+def test_ivf_is_built_after_flush(ivf_client):
+    client, _, _ = ivf_client
+    assert client._collection("texts")._ivf is not None
+
+def test_ivf_probing_all_lists_matches_exact_search(ivf_client, tmp_path):
+    client, vectors, _ = ivf_client
+    exact = _client(tmp_path / "flat", index_type="FLAT")
+    exact.insert("texts", [{"embedding": v.tolist(), "group": 0} for v in vectors])
+    queries = vectors[:5] + 0.1
+    full = client.search("texts", queries.tolist(), limit=10, search_params={"params": {"nprobe": NLIST}})
+    flat = exact.search("texts", queries.tolist(), limit=10)
+    assert [_ids(hits) for hits in full] == [_ids(hits) for hits in flat]
+    for hits in full:
+        distances = [hit["distance"] for hit in hits]
+        assert distances == sorted(distances)
+
+def test_ivf_respects_filter_and_deletes(ivf_client):
+    client, vectors, labels = ivf_client
+    query = vectors[0].tolist()
+    nearest = client.search("texts", [query], limit=1)[0][0]["id"]
+    client.delete("texts", ids=[nearest])
+    hits = client.search("texts", [query], limit=20, filter=f"group == {int(labels[0])}",
+                         output_fields=["group"], search_params={"params": {"nprobe": NLIST}})[0]
+    assert nearest not in _ids(hits)
+    assert hits and all(hit["entity"]["group"] == labels[0] for hit in hits)
+
+def test_ivf_finds_rows_added_after_index(ivf_client):
+    client, vectors, _ = ivf_client
+    new = (vectors[0] + 50).tolist()
+    pk = client.insert("texts", [{"embedding": new, "group": -1}])["ids"][0]
+    assert client.search("texts", [new], limit=1)[0][0]["id"] == pk
+
+def test_ivf_survives_reopen(ivf_client, tmp_path):
+    client, vectors, _ = ivf_client
+    before = client.search("texts", vectors[:3].tolist(), limit=5)
+    client.close()
+    reopened = LocalVectorClient(str(tmp_path / "ivf"))
+    assert reopened._collection("texts")._ivf is not None
+    assert [_ids(h) for h in reopened.search("texts", vectors[:3].tolist(), limit=5)] == [_ids(h) for h in before]
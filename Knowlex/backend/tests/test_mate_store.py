@@ -0,0 +1,148 @@
+# tests/test_mate_store.py
+
+import os
+
+from backend.knowledge_base.mate_store import ManifestStore, file_sha256, file_state
+
+
+def _write(data_dir, name, content, mtime=1_000_000):
+    path = data_dir / name
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+def _store(tmp_path):
+    return ManifestStore(str(tmp_path / "out" / "manifest.json"))
+
+def _names(files):
+    return [name for _, name in files]
+
+def _ingested(tmp_path, files):
+    """建一个清单, files: {相对路径: 内容}; 返回 (清单, 数据目录, 文件列表)"""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir(exist_ok=True)
+    store = _store(tmp_path)
+    file_list = []
+    for i, (name, content) in enumerate(files.items()):
+        path = _write(data_dir, name, content)
+        store.set_file(name, file_state(path), [i * 10, i * 10 + 1], [f"img{i}"])
+        file_list.append((path, name))
+    store.save()
+    return store, data_dir, file_list
+
+
+def test_file_state(tmp_path):
+    path = _write(tmp_path, "a.pdf", b"abc", mtime=1234)
+    assert file_state(path) == {"sha256": file_sha256(path), "mtime": 1234, "size": 3}
+    assert file_sha256(path) == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_diff_added_changed_removed(tmp_path):
+    store, data_dir, file_list = _ingested(tmp_path, {"a.pdf": b"aaa", "b.pdf": b"bbb", "c.pdf": b"ccc"})
+    b_path = _write(data_dir, "b.pdf", b"bbb v2", mtime=2_000_000)
+    new_path = _write(data_dir, "d.pdf", b"ddd")
+    current = [file_list[0], (b_path, "b.pdf"), (new_path, "d.pdf")]
+    added, changed, removed, resumed = store.diff(current)
+    assert _names(added) == ["d.pdf"]
+    assert _names(changed) == ["b.pdf"]
+    assert removed == ["c.pdf"]
+    assert resumed == []
+
+
+def test_unchanged_file_is_not_rehashed(tmp_path, monkeypatch):
+    store, _, file_list = _ingested(tmp_path, {"a.pdf": b"aaa"})
+    def fail(*args, **kwargs):
+        raise AssertionError("mtime 和大小没变, 不应重新计算哈希")
+    monkeypatch.setattr("backend.knowledge_base.mate_store.file_sha256", fail)
+    assert store.diff(file_list) == ([], [], [], [])
+
+
+def test_same_size_edit_with_new_mtime_is_changed(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {"a.pdf": b"aaa"})
+    path = _write(data_dir, "a.pdf", b"aab", mtime=1_000_001)
+    assert _names(store.diff([(path, "a.pdf")])[1]) == ["a.pdf"]
+
+
+def test_touched_file_only_refreshes_mtime(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {"a.pdf": b"aaa"})
+    before = dict(store.get("a.pdf"))
+    path = _write(data_dir, "a.pdf", b"aaa", mtime=3_000_000)
+    assert store.diff([(path, "a.pdf")]) == ([], [], [], [])
+    entry = store.get("a.pdf")
+    assert entry["mtime"] == 3_000_000
+    assert {k: v for k, v in entry.items() if k != "mtime"} == {k: v for k, v in before.items() if k != "mtime"}
+
+
+def test_save_and_reload(tmp_path):
+    store, _, _ = _ingested(tmp_path, {"a.pdf": b"aaa", "b.pdf": b"bbb"})
+    reloaded = _store(tmp_path)
+    assert reloaded.files == store.files
+    assert not os.path.exists(store.path + ".tmp")
+
+
+def test_fingerprint(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {"a.pdf": b"aaa", "b.pdf": b"bbb"})
+    fingerprint = store.fingerprint()
+    # 只和 相对路径 + 内容哈希 有关: mtime / 主键变了不影响, 顺序无关
+    store.files["a.pdf"]["mtime"] = 5
+    store.files["b.pdf"]["text_pks"] = []
+    assert store.fingerprint() == fingerprint
+    assert _store(tmp_path).fingerprint() == fingerprint
+    store.set_file("b.pdf", file_state(_write(data_dir, "b.pdf", b"b2")), [], [])
+    assert store.fingerprint() != fingerprint
+    store.remove_file("b.pdf")
+    only_a = ManifestStore(str(tmp_path / "only_a.json"))
+    only_a.files = {"a.pdf": {"sha256": store.get("a.pdf")["sha256"]}}
+    assert store.fingerprint() == only_a.fingerprint() != fingerprint
+
+
+def test_partial_entry_survives_crash_via_journal(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {"a.pdf": b"aaa"})
+    path = _write(data_dir, "b.pdf", b"bbb")
+    store.begin_file("b.pdf", file_state(path))
+    store.add_pks("b.pdf", text_pks=[7, 8])
+    store.add_pks("b.pdf", text_pks=[9], image_pks=["h1", "h2"])
+    store.add_pks("b.pdf", image_pks=["h2"])
+    # (没有 save 就崩溃: 清单里还没有 b.pdf, 靠日志重放)
+    reloaded = _store(tmp_path)
+    entry = reloaded.get("b.pdf")
+    assert entry["partial"] is True
+    assert entry["text_pks"] == [7, 8, 9] and entry["image_pks"] == ["h1", "h2"]
+    assert reloaded.get("a.pdf") == store.get("a.pdf")
+
+    reloaded.finish_file("b.pdf")
+    reloaded.save()
+    assert not os.path.exists(reloaded.journal_path)
+    assert "partial" not in _store(tmp_path).get("b.pdf")
+
+
+def test_journal_replay_after_save_is_idempotent(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {"a.pdf": b"aaa"})
+    store.begin_file("b.pdf", file_state(_write(data_dir, "b.pdf", b"bbb")))
+    store.add_pks("b.pdf", text_pks=[1])
+    store.remove_file("a.pdf")
+    with open(store.journal_path, "rb") as f:
+        journal = f.read()
+    store.save()
+    # 清单已替换、日志还没删就崩溃: 在新清单上再重放一遍, 结果不变
+    with open(store.journal_path, "wb") as f:
+        f.write(journal + b'{"op": "add", "file": "b.pdf"')  # (最后一行只写了一半)
+    assert _store(tmp_path).files == store.files
+
+
+def test_partial_files_resume_or_change(tmp_path):
+    store, data_dir, _ = _ingested(tmp_path, {})
+    same = _write(data_dir, "same.pdf", b"same")
+    edited = _write(data_dir, "edited.pdf", b"old")
+    gone = _write(data_dir, "gone.pdf", b"gone")
+    for path, name in ((same, "same.pdf"), (edited, "edited.pdf"), (gone, "gone.pdf")):
+        store.begin_file(name, file_state(path))
+        store.add_pks(name, text_pks=[1, 2])
+    edited = _write(data_dir, "edited.pdf", b"new", mtime=2_000_000)
+    os.remove(gone)
+    added, changed, removed, resumed = store.diff([(same, "same.pdf"), (edited, "edited.pdf")])
+    assert added == [] and removed == ["gone.pdf"]
+    assert _names(changed) == ["edited.pdf"]
+    assert _names(resumed) == ["same.pdf"]
+    assert store.remove_file("gone.pdf")["text_pks"] == [1, 2]
+    assert store.remove_file("gone.pdf") is None
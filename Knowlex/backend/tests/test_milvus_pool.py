@@ -0,0 +1,163 @@
+# tests/test_milvus_pool.py
+
+import threading
+
+import grpc
+import pytest
+from pymilvus.exceptions import MilvusException
+
+from utils import config
+from utils import metrics
+from backend.knowledge_base import milvus_pool
+from backend.knowledge_base.milvus_pool import MilvusPool, is_transient
+
+
+class _FakeClient:
+    """假的 MilvusClient: 按 script 依次抛出异常或返回结果, 记录每次调用"""
+
+    def __init__(self, script, calls):
+        self.script = script
+        self.calls = calls
+        self.closed = False
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            self.calls.append((self, method, kwargs))
+            outcome = self.script.pop(0) if self.script else "ok"
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+        return call
+
+    def close(self):
+        self.closed = True
+
+
+class _RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(milvus_pool.time, "sleep", delays.append)
+    return delays
+
+def _pool(monkeypatch, script, size=1, retries=3, backoff=0.1):
+    """连接池 + 共享的调用脚本; 每次 _connect 都新建一个假客户端 (记在 pool.created)"""
+    pool = MilvusPool(uri="fake", size=size, timeout=7, retries=retries, backoff=backoff)
+    pool.calls, pool.created = [], []
+    def connect():
+        client = _FakeClient(script, pool.calls)
+        pool.created.append(client)
+        return client
+    monkeypatch.setattr(pool, "_connect", connect)
+    return pool
+
+def _retries(method):
+    return metrics.MILVUS_RETRIES.labels(method).get()
+
+
+def test_transient_errors_retry_with_backoff_and_reconnect(monkeypatch, sleeps):
+    pool = _pool(monkeypatch, [ConnectionError("reset"), MilvusException(message="deadline exceeded"), "hits"])
+    before = _retries("search")
+    assert pool.search("texts", data=[[0.0]]) == "hits"
+    assert len(pool.calls) == 3
+    assert sleeps == [0.1, 0.2]
+    assert _retries("search") - before == 2
+    # 每次出错都丢弃通道 (关闭旧客户端), 下一次重新连接
+    assert len(pool.created) == 3
+    assert [client.closed for client in pool.created] == [True, True, False]
+    assert pool._slots == [pool.created[-1]]
+
+
+def test_gives_up_after_retries(monkeypatch, sleeps):
+    pool = _pool(monkeypatch, [_RpcError(grpc.StatusCode.UNAVAILABLE)] * 10, retries=2, backoff=0.5)
+    errors_before = metrics.ERRORS.labels("milvus").get()
+    with pytest.raises(grpc.RpcError):
+        pool.query("texts", filter="")
+    assert len(pool.calls) == 3
+    assert sleeps == [0.5, 1.0]
+    assert metrics.ERRORS.labels("milvus").get() - errors_before == 1
+    assert pool._slots == [None]
+
+
+def test_non_transient_error_is_not_retried(monkeypatch, sleeps):
+    pool = _pool(monkeypatch, [MilvusException(message="collection not found"), "ok"])
+    with pytest.raises(MilvusException):
+        pool.describe_collection("missing")
+    assert len(pool.calls) == 1 and sleeps == []
+    # (不是连接问题, 通道保留)
+    assert pool._slots == pool.created and not pool.created[0].closed
+    assert pool.describe_collection("texts") == "ok"
+    assert len(pool.created) == 1
+
+
+def test_insert_is_never_retried(monkeypatch, sleeps):
+    pool = _pool(monkeypatch, [TimeoutError("timed out"), {"ids": [1]}])
+    with pytest.raises(TimeoutError):
+        pool.insert("texts", data=[{"x": 1}])
+    assert len(pool.calls) == 1 and sleeps == []
+    # 通道被丢弃, 下一次调用重新连接
+    assert pool._slots == [None] and pool.created[0].closed
+    assert pool.insert("texts", data=[{"x": 1}]) == {"ids": [1]}
+    assert len(pool.created) == 2
+
+
+def test_timeouts_per_method(monkeypatch, sleeps):
+    monkeypatch.setattr(config, "MILVUS_SLOW_TIMEOUT", 99)
+    pool = _pool(monkeypatch, [])
+    pool.search("texts", data=[[0.0]])
+    pool.flush("texts")
+    pool.query("texts", filter="", timeout=1)
+    assert [kwargs["timeout"] for _, _, kwargs in pool.calls] == [7, 99, 1]
+
+
+def test_round_robin_over_slots(monkeypatch, sleeps):
+    pool = _pool(monkeypatch, [], size=3)
+    for _ in range(6):
+        pool.get_server_version()
+    assert len(pool.created) == 3
+    assert [client for client, _, _ in pool.calls] == pool.created * 2
+
+
+def test_slow_connect_does_not_block_other_slots(monkeypatch, sleeps):
+    pool = MilvusPool(uri="fake", size=2, timeout=7, retries=0)
+    release, connecting = threading.Event(), threading.Event()
+    calls = []
+    def connect():
+        if not connecting.is_set():
+            connecting.set()
+            release.wait(5)  # (第一个通道连接卡住)
+        return _FakeClient([], calls)
+    monkeypatch.setattr(pool, "_connect", connect)
+
+    stuck = threading.Thread(target=pool.get_server_version)
+    stuck.start()
+    assert connecting.wait(5)
+    done = threading.Event()
+    other = threading.Thread(target=lambda: (pool.get_server_version(), done.set()))
+    other.start()
+    assert done.wait(2), "另一个通道被卡住的连接挡住了"
+    assert pool.health()["connected_channels"] == 1
+    release.set()
+    stuck.join(5)
+    other.join(5)
+    assert all(client is not None for client in pool._slots)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (ConnectionError("reset"), True),
+    (TimeoutError(), True),
+    (_RpcError(grpc.StatusCode.DEADLINE_EXCEEDED), True),
+    (_RpcError(grpc.StatusCode.INVALID_ARGUMENT), False),
+    (MilvusException(message="fail connecting to server"), True),
+    (MilvusException(message="field embedding not exist"), False),
+    (ValueError("bad"), False),
+])
+def test_is_transient(error, expected):
+    assert is_transient(error) is expected
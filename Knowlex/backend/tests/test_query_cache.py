@@ -0,0 +1,109 @@
+# tests/test_query_cache.py
+
+from backend.rag import query_cache
+from backend.rag.query_cache import CachedQueryEmbeddings, VersionedLRUCache, normalize_query
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class _CountingEmbeddings:
+    """按文本长度出向量, 记录每次调用"""
+
+    def __init__(self):
+        self.queries, self.batches = [], []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_normalize_query():
+    assert normalize_query("  后浇带  防水\n施工 ") == "后浇带 防水 施工"
+    assert normalize_query("ＨＲＢ４００ 钢筋") == normalize_query("hrb400   钢筋") == "hrb400 钢筋"
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = VersionedLRUCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", 1, version=0)
+    cache.put("b", 2, version=0)
+    assert cache.get("a", 0) == 1  # (a 变成最近使用)
+    cache.put("c", 3, version=0)
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == 1 and cache.get("c", 0) == 3
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_version_bump_invalidates():
+    cache = VersionedLRUCache(max_entries=10, ttl_seconds=0)
+    cache.put("a", 1, version=1)
+    cache.put("b", 2, version=1)
+    # 数据版本变了: 旧条目读不到, 且读过一次就删掉
+    assert cache.get("a", 2) is None
+    assert cache.stats()["size"] == 1
+    # 新版本写入时旧版本条目全部作废
+    cache.put("c", 3, version=2)
+    assert cache.stats()["size"] == 1
+    assert cache.get("b", 1) is None and cache.get("c", 2) == 3
+
+
+def test_stale_result_is_not_cached():
+    cache = VersionedLRUCache(max_entries=10, ttl_seconds=0)
+    cache.put("a", "new", version=3)
+    # (计算开始时还是版本 2, 结果可能是旧数据)
+    cache.put("b", "old", version=2)
+    assert cache.get("b", 2) is None and cache.get("b", 3) is None
+    assert cache.get("a", 3) == "new"
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(query_cache.time, "monotonic", clock)
+    cache = VersionedLRUCache(max_entries=10, ttl_seconds=60)
+    cache.put("a", 1, version=0)
+    clock.now += 59
+    assert cache.get("a", 0) == 1
+    clock.now += 2
+    assert cache.get("a", 0) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cached_query_embeddings():
+    model = _CountingEmbeddings()
+    version = {"value": 0}
+    loads = []
+    def load_model():
+        loads.append(1)
+        return model
+    embeddings = CachedQueryEmbeddings(load_model, VersionedLRUCache(10, 0), lambda: version["value"])
+    first = embeddings.embed_query("后浇带")
+    assert embeddings.embed_query("后浇带") == first and model.queries == ["后浇带"]
+    # 返回的是副本, 调用方改了也不影响缓存
+    first.append(9.0)
+    assert embeddings.embed_query("后浇带") == [3.0, 1.0]
+    # 缓存命中时不加载模型
+    assert len(loads) == 1
+    version["value"] = 1
+    embeddings.embed_query("后浇带")
+    assert model.queries == ["后浇带", "后浇带"]
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+
+
+def test_embed_queries_batches_misses():
+    model = _CountingEmbeddings()
+    embeddings = CachedQueryEmbeddings(model, VersionedLRUCache(10, 0), lambda: 0)
+    embeddings.embed_query("钢筋")
+    result = embeddings.embed_queries(["钢筋", "混凝土", "后浇带", "混凝土"])
+    assert result == [[2.0, 1.0], [3.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    # 未命中的问题去重后合并成一次调用
+    assert model.batches == [["混凝土", "后浇带"]]
+    assert embeddings.embed_queries(["后浇带"]) == [[3.0, 1.0]] and len(model.batches) == 1
@@ -0,0 +1,79 @@
+# tests/test_rerank_batcher.py
+
+import threading
+import time
+
+import pytest
+
+from backend.rag.rerank_batcher import RerankBatcher
+
+
+class _Recorder:
+    """按文本长度打分, 记录每次调用的批大小; 第一次调用可以很慢 (让其他请求排队)"""
+
+    def __init__(self, first_delay=0.0):
+        self.first_delay = first_delay
+        self.batch_sizes = []
+
+    def __call__(self, pairs):
+        if not self.batch_sizes and self.first_delay:
+            time.sleep(self.first_delay)
+        self.batch_sizes.append(len(pairs))
+        return [float(len(text)) for _, text in pairs]
+
+def _pairs(tag, n):
+    return [("q", f"{tag}" + "x" * i) for i in range(n)]
+
+def _concurrent(batcher, requests):
+    results = [None] * len(requests)
+    def run(i):
+        results[i] = batcher.score(requests[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_single_request_keeps_order():
+    batcher = RerankBatcher(_Recorder(), max_wait_ms=5)
+    assert batcher.score([("q", "ccc"), ("q", "a"), ("q", "bb")]) == [3.0, 1.0, 2.0]
+    assert batcher.score([]) == []
+    assert batcher.batches == 1 and batcher.pairs_scored == 3
+
+
+def test_concurrent_requests_share_batches():
+    scorer = _Recorder(first_delay=0.1)
+    batcher = RerankBatcher(scorer, max_batch=64, max_wait_ms=20)
+    requests = [_pairs(f"r{i}", 3 + i % 3) for i in range(8)]
+    results = _concurrent(batcher, requests)
+    # 每个调用方拿回自己那几对的分数
+    assert results == [[float(len(text)) for _, text in pairs] for pairs in requests]
+    assert len(scorer.batch_sizes) < len(requests)
+    assert sum(scorer.batch_sizes) == sum(len(pairs) for pairs in requests)
+
+
+def test_batches_respect_max_batch():
+    scorer = _Recorder(first_delay=0.1)
+    batcher = RerankBatcher(scorer, max_batch=8, max_wait_ms=20)
+    _concurrent(batcher, [_pairs(f"r{i}", 4) for i in range(6)])
+    assert max(scorer.batch_sizes) <= 8
+
+
+def test_single_pair_scalar_score():
+    batcher = RerankBatcher(lambda pairs: 0.5, max_wait_ms=0)
+    assert batcher.score([("q", "a")]) == [0.5]
+
+
+def test_error_reaches_caller_and_batcher_recovers():
+    calls = []
+    def flaky(pairs):
+        calls.append(len(pairs))
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        return [1.0] * len(pairs)
+    batcher = RerankBatcher(flaky, max_wait_ms=0)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        batcher.score(_pairs("a", 2))
+    assert batcher.score(_pairs("b", 2)) == [1.0, 1.0]
@@ -0,0 +1,99 @@
+# tests/test_rerank_cascade.py
+
+import time
+
+from langchain_core.documents import Document
+
+from backend.rag.rerank_batcher import RerankBatcher, update_estimate
+from backend.rag.rerank_cascade import RerankCascade
+
+
+def _docs(n):
+    return [Document(page_content=f"doc{i}" + "x" * i) for i in range(n)]
+
+def _length_scorer(pairs):
+    return [float(len(text)) for _, text in pairs]
+
+
+class _SlowOnce:
+    """第一次调用很慢 (冷启动 / CPU 抖动), 之后正常"""
+
+    def __init__(self, slow_seconds):
+        self.slow_seconds = slow_seconds
+        self.calls = 0
+
+    def __call__(self, pairs):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(self.slow_seconds)
+        return _length_scorer(pairs)
+
+
+def test_update_estimate_recovers_on_fast_call():
+    assert update_estimate(None, 1.0) == 1.0
+    assert update_estimate(1.0, 0.01) == 0.01
+    assert 0.01 < update_estimate(0.01, 1.0) < 1.0
+
+
+def test_without_cheap_model_large_scores_all():
+    cascade = RerankCascade(_length_scorer, keep=2, budget_ms=0)
+    ranked = cascade.rank("q", _docs(5))
+    # 没有一级模型时不按召回顺序剪枝, 全部候选都由大模型打分
+    assert [doc.page_content[:4] for _, doc in ranked] == ["doc4", "doc3", "doc2", "doc1", "doc0"]
+    assert [score for score, _ in ranked] == sorted((score for score, _ in ranked), reverse=True)
+
+
+def test_prunes_with_cheap_model():
+    cascade = RerankCascade(_length_scorer, cheap=lambda pairs: [-float(i) for i in range(len(pairs))],
+                            keep=2, margin=0, budget_ms=0)
+    ranked = cascade.rank("q", _docs(5))
+    assert all(score is not None for score, _ in ranked)
+    # 前 keep 个由大模型重排, 其余按一级排序接在后面
+    assert [doc.page_content[:4] for _, doc in ranked] == ["doc1", "doc0", "doc2", "doc3", "doc4"]
+
+
+def test_first_stage_fallback_has_scores():
+    large = _SlowOnce(0.3)
+    cascade = RerankCascade(large, budget_ms=100, probe_seconds=60)
+    cascade.rank("q", _docs(3))
+    ranked = cascade.rank("q", _docs(3))
+    assert cascade.stats["over_budget"] == 1
+    assert [doc.page_content[:4] for _, doc in ranked] == ["doc0", "doc1", "doc2"]
+    assert all(isinstance(score, float) for score, _ in ranked)
+
+
+def test_early_exit_skips_large_model():
+    calls = []
+    cascade = RerankCascade(lambda pairs: calls.append(pairs) or _length_scorer(pairs),
+                            cheap=lambda pairs: [10.0] + [0.0] * (len(pairs) - 1), margin=3.0, budget_ms=0)
+    ranked = cascade.rank("q", _docs(4))
+    assert calls == [] and cascade.stats["early_exit"] == 1
+    assert ranked[0][1].page_content == "doc0"
+
+
+def test_one_slow_call_does_not_disable_large_model():
+    large = _SlowOnce(0.3)
+    cascade = RerankCascade(large, keep=4, budget_ms=100, probe_seconds=0.2)
+    cascade.rank("q", _docs(6))
+    # 估计偏高: 预算内不再调用大模型, 但分数照常返回
+    ranked = cascade.rank("q", _docs(6))
+    assert cascade.stats["over_budget"] == 1
+    assert all(score is not None for score, _ in ranked)
+    # 过了 probe_seconds 之后探测一次, 耗时正常, 估计立即恢复
+    time.sleep(0.25)
+    cascade.rank("q", _docs(6))
+    assert cascade.stats["probe"] == 1
+    before = cascade.stats["large"]
+    cascade.rank("q", _docs(6))
+    assert cascade.stats["large"] == before + 1
+    assert cascade.stats["over_budget"] == 1
+
+
+def test_batcher_estimate_excludes_model_load():
+    loaded = []
+    batcher = RerankBatcher(_length_scorer, prepare=lambda: loaded or (time.sleep(0.3), loaded.append(1)))
+    cascade = RerankCascade(batcher.score, keep=4, budget_ms=100, pair_seconds=lambda: batcher.pair_seconds)
+    for _ in range(3):
+        cascade.rank("q", _docs(6))
+    assert batcher.pair_seconds < 0.01
+    assert cascade.stats == {"large": 3, "early_exit": 0, "over_budget": 0, "probe": 0}
@@ -4,6 +4,22 @@
 MILVUS_HOST = "localhost"  # 或 "127.0.0.1"
 MILVUS_PORT = "19530"      # Docker 映射的端口
 MILVUS_URI = f"http://{MILVUS_HOST}:{MILVUS_PORT}"
+# 连接池 (knowledge_base/milvus_pool.py: 进程内所有模块共用)
+MILVUS_POOL_SIZE = 4          # gRPC 通道数 (并发检索线程轮流使用)
+MILVUS_TIMEOUT = 10.0         # 每次调用的超时 (秒)
+MILVUS_SLOW_TIMEOUT = 300.0   # flush / 建索引 / 加载集合 等慢操作的超时 (秒)
+MILVUS_RETRIES = 3            # 连接类错误 (Milvus 重启、超时) 的重试次数, 每次重连
+MILVUS_RETRY_BACKOFF = 0.5    # 第一次重试前等待的秒数, 之后每次翻倍
+MILVUS_HEALTH_TIMEOUT = 2.0   # 健康检查的超时 (秒)
+
+# --- 向量库后端 ---
+# "milvus" = Milvus 服务 (MILVUS_URI); "local" = 进程内引擎 (knowledge_base/local_store.py, 不需要 Milvus 容器)
+VECTOR_BACKEND = "milvus"
+LOCAL_STORE_DIR = "./output/local_store"
+LOCAL_STORE_DTYPE = "float32"   # 本地引擎的向量存储精度: "float32" / "float16" (内存减半, 精度略降)
+LOCAL_IVF_MIN_ROWS = 20000      # 行数达到后建 IVF 索引 (之前全部精确检索)
+LOCAL_IVF_NPROBE = 16           # IVF 检索时计算的簇数
+LOCAL_IVF_REBUILD_RATIO = 0.2   # 建索引后新增的行超过已索引行数的这个比例时重建
 
 # --- Collection (表) 配置 ---
 TEXT_COLLECTION_NAME = "knowlex_texts"
@@ -12,6 +28,68 @@ TEXT_COLLECTION_NAME = "knowlex_texts"
 # (我们用 moka-ai/m3e-base, 它是 768 维)
 EMBEDDING_MODEL_NAME = "moka-ai/m3e-base"
 TEXT_EMBEDDING_DIM = 768 
+TEXT_EMBED_BATCH_SIZE = 64   # 文本嵌入 每批编码/插入的块数
+EMBED_THREADS = 0            # 嵌入计算的 CPU 线程数 (0 = torch 默认)
+
+# --- 本地向量缓存 (按 模型+维度+内容哈希 缓存 m3e / CLIP 向量, 重建向量库时免去重新编码) ---
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = "./output/embedding_cache"
+
+# --- 混合召回 (向量 + BM25 关键词, RRF 融合) ---
+HYBRID_RETRIEVAL = True
+KEYWORD_TOP_K = 10        # 关键词召回的文本块数
+RERANK_CANDIDATES = 12    # 融合后交给 Reranker 的文本块数
+RRF_K = 60                # RRF 融合常数: 分数 = sum(1 / (RRF_K + 名次))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# --- Reranker 推理后端 ---
+RERANKER_MODEL = "BAAI/bge-reranker-large"
+RERANKER_BACKEND = "flag"         # "flag" = FlagReranker (PyTorch); "onnx" / "onnx-int8" = ONNX Runtime (CPU, int8 为动态量化)
+RERANK_ONNX_DIR = "./output/onnx" # 导出 / 量化后的 ONNX 模型缓存目录
+RERANK_ONNX_THREADS = 0           # ONNX Runtime intra-op 线程数 (0 = 使用全部核心)
+RERANK_MAX_LENGTH = 512           # (query, 文本块) 对的最大 token 数
+RERANK_PARITY_TOP1 = 0.9          # 切换后端的一致性门槛: Top-1 相同的问题比例
+RERANK_PARITY_TOP3 = 0.9          # 切换后端的一致性门槛: Top-3 平均重合率
+
+# --- Reranker 跨请求微批 (并发请求的打分对合并成一次 compute_score) ---
+RERANK_MAX_BATCH = 64        # 一次打分最多合并的 (query, 文本块) 对数
+RERANK_BATCH_WAIT_MS = 5     # 有其他请求在排队时, 为凑批最多等待的毫秒数
+
+# --- 级联重排 (一级排序剪枝 → bge-reranker-large 只给留下的候选打分) ---
+RERANK_CASCADE = True
+RERANK_CASCADE_CHEAP_MODEL = ""   # 一级打分模型, 如 "BAAI/bge-reranker-base"; 留空 = 不剪枝, 大模型给全部候选打分 (只保留延迟预算)
+RERANK_CASCADE_KEEP = 8           # 一级模型排序后交给大模型的候选数 (配置了一级模型时才生效)
+RERANK_EARLY_EXIT_MARGIN = 3.0    # 一级模型第一名领先第二名超过这个分差时不再调用大模型 (0 = 关闭)
+RERANK_BUDGET_MS = 2000           # 每个请求的重排延迟预算, 预计超出时退回一级排序 (0 = 不限)
+RERANK_BUDGET_PROBE_SECONDS = 5   # 超预算时每隔多少秒仍调用一次大模型, 重新测量耗时
+
+# --- 查询缓存 (入库写入 Milvus 后自动失效) ---
+QUERY_CACHE_SIZE = 1024          # 检索结果缓存的最大条数 (按规范化后的问题)
+QUERY_CACHE_TTL = 3600           # 检索结果缓存的过期秒数 (0 = 不过期)
+QUERY_EMBED_CACHE_SIZE = 4096    # 问题向量缓存的最大条数
+QUERY_EMBED_CACHE_TTL = 0        # 问题向量缓存的过期秒数 (0 = 不过期)
+
+# --- 语义答案缓存 (来源相同 + 问题相似时复用 LLM 答案; 知识库或 LLM 模型变化时清空) ---
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = "./output/answer_cache.sqlite3"
+ANSWER_CACHE_SIZE = 10000        # 最多缓存的答案条数 (按最近使用淘汰)
+ANSWER_CACHE_THRESHOLD = 0.92    # 问题向量的余弦相似度阈值
+
+# --- /api/query 并发 ---
+QUERY_RETRIEVAL_WORKERS = 8   # 检索线程池大小 (同时运行的 Milvus 召回 + Rerank 数)
+QUERY_LLM_CONCURRENCY = 16    # 同时进行的 LLM 调用数
+
+# --- 离线批量生成提交文件 (output/result_generator.py) ---
+RESULT_BATCH_SIZE = 32   # 每批的问题数 (一次批量编码 + 一次多向量检索 + 一次合并打分)
+RESULT_WORKERS = 2       # 同时处理的批数
+
+# --- 模型加载 (utils/model_registry.py: 第一次用到时才加载, 每个进程一份) ---
+WARMUP_MODELS = ["text_embedding", "reranker", "reranker_cheap", "text_retriever", "llm_chain"] # API 启动时预热的模型 (未启用的跳过)
+WARMUP_IN_BACKGROUND = True # True: 后台预热, 服务先启动 (预热完成后 /api/ready 才返回 200); False: 预热完才接受请求
+
+# --- 监控 (GET /metrics, 结构化日志) ---
+LOG_JSON = True          # 请求日志输出为一行 JSON (False = 便于阅读的文本)
 
 # --- LLM 配置 ---
 LLM_MODEL_NAME = "gpt-3.5-turbo"
@@ -19,12 +97,47 @@ LLM_MODEL_NAME = "gpt-3.5-turbo"
 # --- 数据路径 ---
 DATA_DIR = "./data" # 存放 PDF 的目录
 
+# --- 入库并行配置 ---
+INGEST_WORKERS = 0        # 入库进程数: 0 = 自动 (CPU 核数), 1 = 单进程顺序处理
+INGEST_START_METHOD = "spawn"  # 入库子进程的启动方式: "spawn" / "forkserver" (不用 fork, 主进程是多线程的)
+PDF_PAGES_PER_TASK = 50   # 大 PDF 按页段拆分, 每个任务最多处理的页数
+PARSE_INFLIGHT_PER_WORKER = 2  # 每个进程最多挂起的解析任务数 (限制解析结果占用的内存)
+
+# --- 条文切分 (按 "3.2.1" 这类条文编号切分文本块, 并填写 clause_id) ---
+CLAUSE_CHUNKING = True
+CLAUSE_MIN_CHARS = 30       # 短于此长度的段 (节标题/页码) 并入下一条
+CLAUSE_LOOKBACK_PAGES = 3   # 页首没有编号的文字归属上一条, 最多向前追溯的页数
+
+# --- 流式入库管线 (解析 → 切分 → 嵌入 → 写入) ---
+PIPELINE_QUEUE_SIZE = 8        # 相邻阶段之间队列的容量 (满了上游就等待, 内存不随语料增长)
+MANIFEST_SAVE_INTERVAL = 5.0   # 入库过程中清单最多每隔几秒落盘一次
+
+# 增量入库清单 (记录每个文件的哈希和 Milvus 主键)
+# 入库中的文件先记为 partial 条目, 每写入一批就把主键追加到清单日志 (MANIFEST_PATH + ".journal");
+# 中断后重跑时, 内容没变的 partial 文件从最后写入的一批之后续传; 内容变了或已从 data/ 删除的按记下的主键清理
+MANIFEST_PATH = "./output/manifest.json"
+# 已有集合的 schema 与当前版本不一致时: True = 删除重建两个集合并清空清单 (重新入库); False = 启动报错
+REBUILD_ON_SCHEMA_MISMATCH = True
+
 # 1. 提取的图片存放路径
 OUTPUT_IMAGE_PATH = "./output/images" 
+# 图片按内容哈希去重; 开启后改用感知哈希 (dHash), 重新编码过的相同图片也会合并
+IMAGE_PHASH_DEDUP = False
+IMAGE_PHASH_MAX_DISTANCE = 4   # 感知哈希相差不超过几位 (共 64 位) 视为同一张图
+IMAGE_PHASH_MIN_STD = 8.0      # 缩略图灰度标准差低于此值 (空白/纯色图) 时不用感知哈希, 只按内容去重
+# 懒提取: 入库时不把 PDF 图片写到 OUTPUT_IMAGE_PATH, 只记录 (PDF, xref) 引用,
+# 检索结果用到某张图时才提取到 IMAGE_CACHE_DIR (LRU, 超过上限删除最久未用的图)
+IMAGE_LAZY_EXTRACT = True
+IMAGE_CACHE_DIR = "./output/image_cache"
+IMAGE_CACHE_MAX_MB = 512
 
 # 2. Milvus 中的“图片集合”名称
 IMAGE_COLLECTION_NAME = "knowlex_images"
 
 # 3. 图片嵌入模型 (CLIP)
 IMAGE_EMBEDDING_MODEL = "openai/clip-vit-base-patch32"
-IMAGE_EMBEDDING_DIM = 512 # CLIP-base 模型的维度
\ No newline at end of file
+IMAGE_EMBEDDING_DIM = 512 # CLIP-base 模型的维度
+IMAGE_EMBED_BATCH_SIZE = 32  # CLIP 每批编码的图片数
+IMAGE_DECODE_WORKERS = 4     # 图片解码线程数
+IMAGE_DECODE_SIZE = 224      # 解码时把大图缩小到的短边长度 (与 CLIP 输入一致)
+IMAGE_PREFETCH_BATCHES = 2   # 编码当前批时最多预先解码的批数
\ No newline at end of file
@@ -0,0 +1,45 @@
+# utils/logger.py
+# (V1 - 带请求 ID 的结构化日志)
+#
+# 请求 ID 存在 contextvars 里: API 中间件为每个请求设置 (沿用请求头 X-Request-ID, 没有就新生成),
+# 同一请求里的检索线程 (run_in_executor 时复制上下文) 和 LLM 调用都能取到。
+# log_event 每条日志输出一行 JSON (config.LOG_JSON = False 时输出便于阅读的一行文本)。
+
+import json
+import time
+import uuid
+import contextvars
+from typing import Optional
+
+# 导入你的配置
+from utils import config
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+def log_event(event: str, level: str = "info", **fields):
+    """输出一条结构化日志 (自动带上当前请求 ID)"""
+    record = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+        "level": level,
+        "event": event,
+        "request_id": get_request_id(),
+        **fields,
+    }
+    if config.LOG_JSON:
+        print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+    else:
+        extra = " ".join(f"{key}={value}" for key, value in fields.items())
+        print(f"[{record['ts']}] {level.upper()} [{record['request_id'] or '-'}] {event} {extra}".rstrip(), flush=True)
@@ -0,0 +1,263 @@
+# utils/metrics.py
+# (V1 - 运行指标 (Prometheus 文本格式))
+#
+# 直方图: 检索管线和 /api/query 每个阶段的耗时 (条文直查 / 向量召回 / 关键词召回 / 重排 / 关联图片 / LLM ...)
+# 计数器: 请求数 (按状态)、各阶段的异常、被吞掉的图片提取异常、Milvus 重试
+# 仪表:   进行中的请求数、模型占用内存、进程常驻内存
+# GET /metrics 输出 Prometheus 文本格式 (不依赖 prometheus_client)。
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+        if not self.labelnames:
+            self.labels()  # (无标签的指标启动时就输出 0)
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}, 收到 {key}")
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self.function: Callable[[], float] = None
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+
+    def set_function(self, function: Callable[[], float]):
+        """抓取 /metrics 时才调用 function 取值 (如进程内存)"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+                for key, child in children]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        lines = []
+        for key, child in children:
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- 指标定义 ---
+
+STAGE_SECONDS = Histogram(
+    "knowlex_stage_seconds",
+    "Latency of each retrieval / generation stage in seconds.",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "knowlex_request_seconds",
+    "End-to-end latency of API requests in seconds.",
+    ("endpoint",),
+)
+REQUESTS = Counter("knowlex_requests_total", "API requests by final status.", ("endpoint", "status"))
+ERRORS = Counter("knowlex_errors_total", "Exceptions raised in each stage.", ("stage",))
+MILVUS_RETRIES = Counter("knowlex_milvus_retries_total",
+                         "Milvus calls retried after a transient connection error.", ("method",))
+IMAGE_ERRORS = Counter("knowlex_image_errors_total",
+                       "Image extraction failures skipped while building results.")
+IN_FLIGHT = Gauge("knowlex_requests_in_flight", "API requests currently being processed.", ("endpoint",))
+MODEL_MEMORY = Gauge("knowlex_model_memory_bytes", "Approximate memory held by loaded models.", ("model",))
+PROCESS_MEMORY = Gauge("knowlex_process_resident_memory_bytes", "Resident memory of the API process.")
+
+
+def _resident_memory_bytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+PROCESS_MEMORY.set_function(_resident_memory_bytes)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """记录一个阶段的耗时; 阶段内抛出异常时计入 knowlex_errors_total (异常照常抛出)"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+@contextmanager
+def track_request(endpoint: str):
+    """记录一个 API 请求: 进行中数量、总耗时、最终状态 (ok / error / cancelled)"""
+    in_flight = IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    except BaseException:  # (客户端断开, 请求被取消)
+        status = "cancelled"
+        raise
+    finally:
+        in_flight.dec()
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, status).inc()
+
+def model_memory_bytes(model) -> int:
+    """
+    模型占用内存的估计: PyTorch 模型按参数和缓冲区的字节数 (在 model / .model / ._client / .client 里找),
+    ONNX Runtime 模型按模型文件大小; 找不到时返回 0。
+    """
+    if isinstance(model, (tuple, list)):  # (如 CLIP 的 (model, processor, device))
+        return sum(model_memory_bytes(item) for item in model)
+    import torch  # (延迟导入, 只在登记模型时需要)
+    for candidate in (model, getattr(model, "model", None), getattr(model, "_client", None),
+                      getattr(model, "client", None)):
+        if isinstance(candidate, torch.nn.Module):
+            tensors = list(candidate.parameters()) + list(candidate.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+    path = getattr(model, "model_path", None)
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
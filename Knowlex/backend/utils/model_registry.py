@@ -0,0 +1,93 @@
+# utils/model_registry.py
+# (V1 - 进程内共享的模型注册表)
+#
+# 各模块在导入时只登记加载函数 (register, 不加载), 模型在第一次 get 时才加载,
+# 每个进程每个模型只有一份 (入库和检索共用同一个 m3e)。
+# warm_up 可在后台线程里提前加载一组模型, 全部加载完成后 is_ready() 才返回 True (API 的 /api/ready)。
+
+import time
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils import metrics
+from utils.logger import log_event
+
+_loaders: Dict[str, Callable[[], object]] = {}
+_models: Dict[str, object] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+_ready = threading.Event()
+_warmup_error: Optional[str] = None
+
+
+def register(name: str, loader: Callable[[], object]) -> Callable[[], object]:
+    """登记一个模型的加载函数 (不加载), 返回取模型的函数 (等价于 lambda: get(name))"""
+    with _registry_lock:
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+    return lambda: get(name)
+
+def get(name: str):
+    """取模型: 第一次调用时加载 (同一模型并发调用只加载一次, 其余等待)"""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _loaders:
+        raise KeyError(f"模型 {name} 未登记")
+    with _locks[name]:
+        model = _models.get(name)
+        if model is None:
+            started = time.perf_counter()
+            model = _loaders[name]()
+            _models[name] = model
+            metrics.MODEL_MEMORY.labels(name).set(metrics.model_memory_bytes(model))
+            log_event("model_loaded", model=name, seconds=round(time.perf_counter() - started, 2))
+    return model
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+def registered() -> List[str]:
+    return list(_loaders)
+
+def warm_up(names: Iterable[str] = None, background: bool = True) -> Optional[threading.Thread]:
+    """
+    预热: 按顺序加载 names (默认全部已登记的模型; 未登记的名字跳过)。
+    background=True 时在后台线程里加载并返回该线程, 否则加载完才返回。
+    全部成功后 is_ready() 变为 True; 有模型加载失败时保持 False, 错误见 status()。
+    """
+    names = [name for name in (registered() if names is None else names) if name in _loaders]
+
+    def run():
+        global _warmup_error
+        started = time.perf_counter()
+        for name in names:
+            try:
+                get(name)
+            except Exception as e:
+                _warmup_error = f"{name}: {e}"
+                metrics.ERRORS.labels("warmup").inc()
+                log_event("warmup_failed", level="error", model=name, error=repr(e))
+                return
+        _ready.set()
+        log_event("warmup_completed", models=names, seconds=round(time.perf_counter() - started, 2))
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def status() -> Dict:
+    """预热状态: 是否就绪、已加载 / 未加载的模型、预热错误"""
+    return {
+        "ready": is_ready(),
+        "loaded": [name for name in _loaders if name in _models],
+        "pending": [name for name in _loaders if name not in _models],
+        "error": _warmup_error,
+    }